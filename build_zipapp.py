@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Build a self-contained zipapp of the prompt enhancement hook
+
+Packages hooks/*.py and integration_manager.py (with precompiled .pyc files),
+the templates and the default config into a single enhance_prompt.pyz whose
+shebang pins the interpreter and runs it isolated without site (-IS), so each
+prompt skips uv project resolution and site-packages scanning.
+
+Usage:
+    python3 build_zipapp.py build [--python /usr/bin/python3.12] [--output dist/enhance_prompt.pyz]
+    python3 build_zipapp.py coldstart [--runs 20]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipapp
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+HOOKS_DIR = ROOT / "hooks"
+DIST_DIR = ROOT / "dist"
+DEFAULT_OUTPUT = DIST_DIR / "enhance_prompt.pyz"
+
+MAIN_MODULE = '''\
+import os
+import sys
+
+# Optional modules installed next to the archive (learning system, error handlers)
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enhance_prompt import main
+
+main()
+'''
+
+COMPILE_SCRIPT = '''\
+import py_compile, sys
+for source, target in zip(sys.argv[1::2], sys.argv[2::2]):
+    py_compile.compile(source, cfile=target, doraise=True,
+                       invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+'''
+
+
+def _embedded_assets_source() -> str:
+    """Python module embedding the templates, default config and directive dedup plan"""
+    templates = {
+        path.stem: path.read_text(encoding="utf-8")
+        for path in sorted((HOOKS_DIR / "templates").glob("*.txt"))
+    }
+    default_config = (HOOKS_DIR / "config" / "default_config.json").read_text(encoding="utf-8")
+    dedup_plan_path = HOOKS_DIR / "config" / "dedup_plan.json"
+    dedup_plan = dedup_plan_path.read_text(encoding="utf-8") if dedup_plan_path.exists() else None
+    return (
+        '"""Generated by build_zipapp.py - do not edit"""\n'
+        f"EMBEDDED_TEMPLATES = {templates!r}\n"
+        f"EMBEDDED_DEFAULT_CONFIG = {default_config!r}\n"
+        f"EMBEDDED_DEDUP_PLAN = {dedup_plan!r}\n"
+    )
+
+
+def build(python: str, output: Path) -> Path:
+    """Assemble the staging directory, precompile it with the target interpreter, zip it"""
+    with tempfile.TemporaryDirectory() as staging_dir:
+        staging = Path(staging_dir)
+        sources = sorted(HOOKS_DIR.glob("*.py")) + [ROOT / "integration_manager.py"]
+        for source in sources:
+            shutil.copy2(source, staging / source.name)
+        (staging / "_embedded_assets.py").write_text(_embedded_assets_source(), encoding="utf-8")
+        (staging / "__main__.py").write_text(MAIN_MODULE, encoding="utf-8")
+
+        # zipimport cannot write bytecode caches, so ship .pyc built by the pinned interpreter
+        pairs = []
+        for module in sorted(staging.glob("*.py")):
+            if module.name != "__main__.py":
+                pairs += [str(module), str(module.with_suffix(".pyc"))]
+        subprocess.run([python, "-I", "-S", "-c", COMPILE_SCRIPT] + pairs, check=True)
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        zipapp.create_archive(staging, target=output, interpreter=f"{python} -IS", compressed=False)
+
+    output.chmod(0o755)
+    return output
+
+
+def _sample_payload() -> bytes:
+    return json.dumps({"prompt": "Refactor utils.py and add tests for parse_config()"}).encode()
+
+
+def _time_launch(command: List[str], env: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, input=_sample_payload(), stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, env=env, check=False)
+    return (time.perf_counter() - start) * 1000
+
+
+def _import_times(command: List[str], env: Dict[str, str], top: int) -> List[Dict]:
+    """Parse -X importtime output into the slowest top-level imports (cumulative us)"""
+    result = subprocess.run(command, input=_sample_payload(), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, env=env, check=False)
+    entries = []
+    for line in result.stderr.decode("utf-8", "replace").splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        if len(name) - len(name.lstrip()) != 1:
+            # Nested imports are indented; keep top-level ones only
+            continue
+        entries.append({"module": name.strip(), "self_us": int(fields[0]),
+                        "cumulative_us": int(fields[1])})
+    return sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:top]
+
+
+def coldstart_report(python: str, pyz: Path, runs: int, top: int) -> Dict:
+    """Measure cold-start milliseconds of the zipapp vs. the source hook"""
+    version = json.loads((HOOKS_DIR / "config" / "default_config.json").read_text())["version"]
+    env = dict(os.environ, HOME=tempfile.mkdtemp(prefix="enhancer-coldstart-"))
+    variants = {
+        "zipapp": [str(pyz)],
+        "source": [python, str(HOOKS_DIR / "enhance_prompt.py")],
+    }
+
+    importtime_commands = {
+        "zipapp": [python, "-X", "importtime", "-I", "-S", str(pyz)],
+        "source": [python, "-X", "importtime", str(HOOKS_DIR / "enhance_prompt.py")],
+    }
+
+    report = {"version": version, "python": python, "runs": runs, "variants": {}}
+    for name, command in variants.items():
+        _time_launch(command, env)  # warm the OS page cache
+        samples = sorted(_time_launch(command, env) for _ in range(runs))
+        report["variants"][name] = {
+            "median_ms": round(statistics.median(samples), 2),
+            "min_ms": round(samples[0], 2),
+            "p90_ms": round(samples[int(len(samples) * 0.9) - 1], 2),
+            "top_imports": _import_times(importtime_commands[name], env, top)
+        }
+    shutil.rmtree(env["HOME"], ignore_errors=True)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the prompt enhancer zipapp")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build enhance_prompt.pyz")
+    build_parser.add_argument("--python", default=sys.executable, help="Interpreter to pin")
+    build_parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+
+    report_parser = subparsers.add_parser("coldstart", help="Import-time / cold-start report")
+    report_parser.add_argument("--python", default=sys.executable)
+    report_parser.add_argument("--pyz", type=Path, default=DEFAULT_OUTPUT)
+    report_parser.add_argument("--runs", type=int, default=20)
+    report_parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        output = build(args.python, args.output)
+        print(f"Built {output} ({output.stat().st_size // 1024}KB) for {args.python}")
+        return 0
+
+    if not args.pyz.exists():
+        build(args.python, args.pyz)
+    report = coldstart_report(args.python, args.pyz, args.runs, args.top)
+    report_file = DIST_DIR / f"coldstart-{report['version']}.json"
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    report_file.write_text(json.dumps(report, indent=2))
+
+    for name, data in report["variants"].items():
+        print(f"{name:<8} median={data['median_ms']}ms min={data['min_ms']}ms p90={data['p90_ms']}ms")
+        for entry in data["top_imports"]:
+            print(f"    {entry['cumulative_us'] / 1000:7.2f}ms  {entry['module']}")
+    print(f"Report written to {report_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Memory-bounded, digest-keyed caches for prompt analysis
+
+functools.lru_cache keys on the full prompt text and bounds entries by count,
+so a long-lived process can retain hundreds of 50KB+ prompts plus their
+lowercased copies and split() lists. DigestCache instead:
+- keys entries by a BLAKE2b digest of string arguments (the text is not kept)
+- bounds capacity in bytes, evicting least recently used entries
+- expires entries after an optional per-cache TTL
+
+Usage:
+    python3 bounded_cache.py report [--prompts-file prompts.txt]
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# All caches created in this process, by name (used for diagnostics/configuration)
+_CACHES: Dict[str, "DigestCache"] = {}
+
+_MISSING = object()
+
+# Per-entry bookkeeping (OrderedDict node, entry tuple, timestamp) not visible to getsizeof
+_ENTRY_OVERHEAD = 200
+
+
+def text_digest(text: str) -> bytes:
+    """Compact content digest used in place of the text as a cache key"""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate retained bytes of a cached value (containers included)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+
+class DigestCache:
+    """LRU cache keyed by content digest with byte-size capacity and TTL"""
+
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _CACHES[name] = self
+
+    @staticmethod
+    def make_key(args: Tuple) -> Tuple:
+        """Replace string arguments with their digests"""
+        return tuple(text_digest(a) if isinstance(a, str) else a for a in args)
+
+    def get(self, key: Tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            value, size, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.current_bytes -= size
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any):
+        size = estimate_size(key) + estimate_size(value) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def configure(self, max_bytes: Optional[int] = None, ttl_seconds: Optional[float] = _MISSING):
+        """Adjust limits at runtime, evicting entries if the new capacity is smaller"""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            if ttl_seconds is not _MISSING:
+                self.ttl_seconds = ttl_seconds
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+def digest_cache(name: str, max_bytes: int, ttl_seconds: Optional[float] = None) -> Callable:
+    """Decorator equivalent of lru_cache backed by a named DigestCache"""
+    def decorator(func: Callable) -> Callable:
+        cache = DigestCache(name, max_bytes, ttl_seconds)
+
+        @wraps(func)
+        def wrapper(*args):
+            key = cache.make_key(args)
+            value = cache.get(key)
+            if value is _MISSING:
+                value = func(*args)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_info = cache.info
+        return wrapper
+    return decorator
+
+
+def configure_caches(settings: Dict[str, Dict[str, Any]]):
+    """Apply per-cache {"max_bytes": ..., "ttl_seconds": ...} settings by cache name"""
+    for name, cache_settings in (settings or {}).items():
+        cache = _CACHES.get(name)
+        if cache is None or not isinstance(cache_settings, dict):
+            continue
+        cache.configure(
+            max_bytes=cache_settings.get("max_bytes"),
+            ttl_seconds=cache_settings.get("ttl_seconds", cache.ttl_seconds)
+        )
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Accounting snapshot of every registered cache"""
+    return {name: cache.info() for name, cache in _CACHES.items()}
+
+
+def _measure_regex_tables(tables: Dict[str, Any]) -> Dict[str, Tuple[int, int]]:
+    """Measure (bytes, pattern count) of each compiled regex group with tracemalloc"""
+    import re
+    import tracemalloc
+
+    def _patterns(value) -> List:
+        if isinstance(value, dict):
+            return [p for v in value.values() for p in _patterns(v)]
+        if isinstance(value, (list, tuple)):
+            return [p for v in value for p in _patterns(v)]
+        return [value] if hasattr(value, "pattern") else []
+
+    results = {}
+    for group, value in tables.items():
+        patterns = _patterns(value)
+        re.purge()
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        rebuilt = [re.compile(p.pattern, p.flags) for p in patterns]
+        re.purge()
+        results[group] = (tracemalloc.get_traced_memory()[0] - before, len(rebuilt))
+        del rebuilt
+    return results
+
+
+def memory_report(prompts: List[str], stream=None) -> Dict[str, Any]:
+    """Run prompts through the analyzers, then measure retained memory per cache"""
+    import tracemalloc
+
+    stream = stream or sys.stdout
+    tracemalloc.start()
+    # Use the registry enhance_prompt populates, even when run as __main__
+    import bounded_cache
+    import enhance_prompt
+
+    for prompt in prompts:
+        enhance_prompt.analyze_prompt_context(prompt, {})
+
+    report = {"caches": {}, "regex_tables": {}}
+    for name, cache in list(bounded_cache._CACHES.items()):
+        accounted = cache.info()
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        cache.clear()
+        gc.collect()
+        accounted["measured_bytes"] = before - tracemalloc.get_traced_memory()[0]
+        report["caches"][name] = accounted
+
+    regex_tables = enhance_prompt._COMPILED_REGEXES
+    if hasattr(regex_tables, "compile_all"):
+        regex_tables = regex_tables.compile_all()
+    for group, (size, count) in _measure_regex_tables(regex_tables).items():
+        report["regex_tables"][group] = {"patterns": count, "measured_bytes": size}
+    tracemalloc.stop()
+
+    print(f"Workload: {len(prompts)} prompts, {sum(len(p) for p in prompts)} chars", file=stream)
+    print("\nCaches (accounted vs tracemalloc-measured retained bytes):", file=stream)
+    for name, info in report["caches"].items():
+        print(f"  {name:<20} entries={info['entries']:<5} accounted={info['bytes']:<10} "
+              f"measured={info['measured_bytes']:<10} max={info['max_bytes']} "
+              f"ttl={info['ttl_seconds']} hits={info['hits']} misses={info['misses']} "
+              f"evictions={info['evictions']}", file=stream)
+    print("\nCompiled regex tables:", file=stream)
+    for group, info in report["regex_tables"].items():
+        print(f"  {group:<20} patterns={info['patterns']:<3} measured={info['measured_bytes']}",
+              file=stream)
+    return report
+
+
+def _sample_prompts() -> List[str]:
+    """Synthetic workload mixing short and 50KB+ prompts"""
+    base = [
+        "fix typo in README.md",
+        "Refactor utils.py and add tests for parse_config()",
+        "Design a distributed microservices architecture for production payments",
+    ]
+    prompts = []
+    for i in range(200):
+        text = base[i % len(base)] + f" #{i}"
+        if i % 10 == 0:
+            text = (text + " ") * 2500
+        prompts.append(text)
+    return prompts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prompt enhancer cache diagnostics")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Report retained memory per cache")
+    report_parser.add_argument("--prompts-file", help="File with one prompt per line")
+    report_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.prompts_file:
+        with open(args.prompts_file, "r", encoding="utf-8") as f:
+            prompts = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        prompts = _sample_prompts()
+
+    if args.json:
+        import io
+        report = memory_report(prompts, stream=io.StringIO())
+        print(json.dumps(report, indent=2))
+    else:
+        memory_report(prompts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
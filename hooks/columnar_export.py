@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Columnar, day-partitioned export of the interaction log
+
+Streams analytics/interactions.log into typed column files under
+<directory>/day=YYYY-MM-DD/, a Hive-style layout that pyarrow.dataset, DuckDB
+and Spark read directly. Each row has:
+- timestamp, prompt/enhancement lengths, feedback and enhancement_ref
+- context analysis: complexity, ultra flag, project type, urgency, technology
+  stack, trigger list, word/file/function/workspace-match counts, history flag
+- the layers emitted and the per-stage latencies (<stage>_ms, slowest layer)
+- sample_weight, the 1/p weight of sampled records (1 when sampling is off)
+
+Formats:
+    parquet  pyarrow.parquet (default when pyarrow is installed)
+    arrow    Arrow IPC / Feather v2
+    pecol    stdlib fallback: zlib-compressed column chunks with validity
+             bitmaps and dictionary-encoded strings, read with read_pecol()
+
+Exports are incremental. The byte offset and inode of interactions.log are
+kept in _export_state.json, so each run only reads lines appended since the
+previous one. Parts are named after the offset they start at, which makes a
+run that crashed before saving its state rewrite the same files instead of
+duplicating rows. When the scheduler's cleanup replaces the log, the export
+rescans it and skips rows at or before the last exported timestamp.
+
+Usage:
+    python3 columnar_export.py export [--format auto|parquet|arrow|pecol] [--full]
+    python3 columnar_export.py info
+    python3 columnar_export.py read <part-file> [--columns complexity,total_ms] [--limit 20]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from file_utils import atomic_write_bytes, locked
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import pyarrow.parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LEARNING_DIR = Path.home() / ".claude" / "prompt-enhancer-learning"
+DEFAULT_EXPORT_DIR = LEARNING_DIR / "analytics" / "columnar"
+DEFAULT_ROWS_PER_PART = 100000
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "pecol": "pecol"}
+
+# Stages recorded by enhance_prompt.py that get their own latency column
+STAGE_COLUMNS = ("total", "context_analysis", "workspace_index", "enrichment_layers",
+                 "traffic_sketches", "learning_record")
+
+SCHEMA: List[Tuple[str, str]] = [
+    ("timestamp", "timestamp"),
+    ("prompt_length", "int32"),
+    ("enhancement_length", "int32"),
+    ("user_feedback", "string"),
+    ("enhancement_ref", "string"),
+    ("complexity", "string"),
+    ("ultra_mode", "bool"),
+    ("project_type", "string"),
+    ("urgency_level", "string"),
+    ("technology_stack", "list<string>"),
+    ("ultra_mode_triggers", "list<string>"),
+    ("word_count", "int32"),
+    ("file_references", "int32"),
+    ("function_names", "int32"),
+    ("workspace_matches", "int32"),
+    ("has_history", "bool"),
+    ("layers", "list<string>"),
+] + [(f"{stage}_ms", "float32") for stage in STAGE_COLUMNS] + [
+    ("slowest_layer", "string"),
+    ("slowest_layer_ms", "float32"),
+    ("sample_weight", "float32"),
+]
+
+_STATE_FILE = "_export_state.json"
+_FORMAT_VERSION = 1
+_PECOL_MAGIC = b"PECOL1\n\x00"
+_NUMERIC_CODES = {"timestamp": "q", "int32": "i", "float32": "f"}
+
+
+def get_export_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("analytics", {}).get("columnar_export", {})
+    return {
+        "enabled": bool(section.get("enabled", False)),
+        "directory": Path(os.path.expanduser(section.get("directory", str(DEFAULT_EXPORT_DIR)))),
+        "format": section.get("format", "auto"),
+        "rows_per_part": int(section.get("rows_per_part", DEFAULT_ROWS_PER_PART)),
+    }
+
+
+def resolve_format(name: str = "auto") -> str:
+    if name == "auto":
+        return "parquet" if PARQUET_AVAILABLE else "pecol"
+    if name == "parquet" and not PARQUET_AVAILABLE:
+        raise RuntimeError("parquet export needs pyarrow; use --format pecol")
+    if name == "arrow" and not PYARROW_AVAILABLE:
+        raise RuntimeError("arrow export needs pyarrow; use --format pecol")
+    if name not in EXTENSIONS:
+        raise ValueError(f"unknown export format: {name}")
+    return name
+
+
+# Rows -----------------------------------------------------------------------
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return None if value is None or isinstance(value, bool) else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_strings(value: Any) -> Optional[List[str]]:
+    return [str(v) for v in value] if isinstance(value, list) else None
+
+
+def _as_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _timestamp_us(value: Any) -> Optional[int]:
+    """Microseconds since the epoch; naive timestamps are local time, as written by record_interaction"""
+    try:
+        return int(datetime.datetime.fromisoformat(str(value)).timestamp() * 1_000_000)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def row_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Typed column values for one interactions.log record (None where absent)"""
+    stage_ms = record.get("stage_ms") if isinstance(record.get("stage_ms"), dict) else {}
+    layer_ms = {stage[len("layer."):]: ms for stage, ms in stage_ms.items()
+                if stage.startswith("layer.") and _as_float(ms) is not None}
+    slowest = max(layer_ms, key=lambda name: float(layer_ms[name])) if layer_ms else None
+
+    row = {
+        "timestamp": _timestamp_us(record.get("timestamp")),
+        "prompt_length": _as_int(record.get("prompt_length")),
+        "enhancement_length": _as_int(record.get("enhancement_length")),
+        "user_feedback": _as_str(record.get("user_feedback")),
+        "enhancement_ref": _as_str(record.get("enhancement_ref")),
+        "complexity": _as_str(record.get("complexity")),
+        "ultra_mode": record.get("ultra_mode") if isinstance(record.get("ultra_mode"), bool) else None,
+        "project_type": _as_str(record.get("project_type")),
+        "urgency_level": _as_str(record.get("urgency_level")),
+        "technology_stack": _as_strings(record.get("technology_stack")),
+        "ultra_mode_triggers": _as_strings(record.get("ultra_mode_triggers")),
+        "word_count": _as_int(record.get("word_count")),
+        "file_references": _as_int(record.get("file_references")),
+        "function_names": _as_int(record.get("function_names")),
+        "workspace_matches": _as_int(record.get("workspace_matches")),
+        "has_history": record.get("has_history") if isinstance(record.get("has_history"), bool) else None,
+        "layers": _as_strings(record.get("layers")),
+        "slowest_layer": slowest,
+        "slowest_layer_ms": float(layer_ms[slowest]) if slowest else None,
+        "sample_weight": _as_float(record.get("sample_weight", 1.0)),
+    }
+    for stage in STAGE_COLUMNS:
+        row[f"{stage}_ms"] = _as_float(stage_ms.get(stage))
+    return row
+
+
+# Stdlib column format -------------------------------------------------------
+
+def _bitmap(flags: List[bool]) -> bytes:
+    out = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+def _unbitmap(data: bytes, count: int) -> List[bool]:
+    return [bool(data[i >> 3] & (1 << (i & 7))) for i in range(count)]
+
+
+def _encode_dictionary(values: List[str]) -> Tuple[bytes, List[int]]:
+    """Dictionary block ([k][k+1 offsets][utf-8 blob]) and the code of each value"""
+    codes_by_value: Dict[str, int] = {}
+    codes = [codes_by_value.setdefault(v, len(codes_by_value)) for v in values]
+    encoded = [v.encode("utf-8") for v in codes_by_value]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    block = struct.pack(f"<I{len(offsets)}I", len(encoded), *offsets) + b"".join(encoded)
+    return block, codes
+
+
+def _decode_dictionary(data: bytes, pos: int) -> Tuple[List[str], int]:
+    (count,) = struct.unpack_from("<I", data, pos)
+    offsets = struct.unpack_from(f"<{count + 1}I", data, pos + 4)
+    blob_start = pos + 4 + 4 * (count + 1)
+    values = [data[blob_start + offsets[i]:blob_start + offsets[i + 1]].decode("utf-8") for i in range(count)]
+    return values, blob_start + offsets[-1]
+
+
+def encode_column(column_type: str, values: List[Any]) -> bytes:
+    """[validity bitmap][values], values laid out by type (nulls stored as 0/empty)"""
+    valid = [v is not None for v in values]
+    out = [_bitmap(valid)]
+    if column_type in _NUMERIC_CODES:
+        out.append(struct.pack(f"<{len(values)}{_NUMERIC_CODES[column_type]}", *(v or 0 for v in values)))
+    elif column_type == "bool":
+        out.append(_bitmap([bool(v) for v in values]))
+    elif column_type == "string":
+        block, codes = _encode_dictionary([v or "" for v in values])
+        out += [block, struct.pack(f"<{len(codes)}I", *codes)]
+    elif column_type == "list<string>":
+        items = [item for v in values for item in (v or [])]
+        offsets = [0]
+        for v in values:
+            offsets.append(offsets[-1] + len(v or []))
+        block, codes = _encode_dictionary(items)
+        out += [struct.pack(f"<{len(offsets)}I", *offsets), block, struct.pack(f"<{len(codes)}I", *codes)]
+    else:
+        raise ValueError(f"unsupported column type: {column_type}")
+    return b"".join(out)
+
+
+def decode_column(column_type: str, data: bytes, count: int) -> List[Any]:
+    pos = (count + 7) // 8
+    valid = _unbitmap(data, count)
+    if column_type in _NUMERIC_CODES:
+        values = list(struct.unpack_from(f"<{count}{_NUMERIC_CODES[column_type]}", data, pos))
+    elif column_type == "bool":
+        values = _unbitmap(data[pos:], count)
+    elif column_type == "string":
+        dictionary, pos = _decode_dictionary(data, pos)
+        values = [dictionary[code] for code in struct.unpack_from(f"<{count}I", data, pos)]
+    elif column_type == "list<string>":
+        offsets = struct.unpack_from(f"<{count + 1}I", data, pos)
+        dictionary, pos = _decode_dictionary(data, pos + 4 * (count + 1))
+        items = [dictionary[code] for code in struct.unpack_from(f"<{offsets[-1]}I", data, pos)]
+        values = [items[offsets[i]:offsets[i + 1]] for i in range(count)]
+    else:
+        raise ValueError(f"unsupported column type: {column_type}")
+    return [v if ok else None for v, ok in zip(values, valid)]
+
+
+def write_pecol(path: Path, rows: List[Dict[str, Any]]):
+    """[magic][zlib column chunks...][JSON footer][footer length:4][magic]"""
+    chunks, columns, offset = [], [], len(_PECOL_MAGIC)
+    for name, column_type in SCHEMA:
+        chunk = zlib.compress(encode_column(column_type, [row.get(name) for row in rows]), 6)
+        columns.append({"name": name, "type": column_type, "offset": offset, "length": len(chunk)})
+        chunks.append(chunk)
+        offset += len(chunk)
+    footer = json.dumps({"version": _FORMAT_VERSION, "rows": len(rows), "codec": "zlib",
+                         "columns": columns}).encode("utf-8")
+    atomic_write_bytes(path, b"".join([_PECOL_MAGIC] + chunks + [footer, struct.pack("<I", len(footer)),
+                                                                  _PECOL_MAGIC]))
+
+
+def read_pecol(path: Path, columns: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+    """Decode the requested columns (all by default) of a pecol file"""
+    data = Path(path).read_bytes()
+    if data[:8] != _PECOL_MAGIC or data[-8:] != _PECOL_MAGIC:
+        raise ValueError(f"{path} is not a pecol file")
+    (footer_length,) = struct.unpack_from("<I", data, len(data) - 12)
+    footer = json.loads(data[len(data) - 12 - footer_length:len(data) - 12])
+    result = {}
+    for column in footer["columns"]:
+        if columns is None or column["name"] in columns:
+            chunk = zlib.decompress(data[column["offset"]:column["offset"] + column["length"]])
+            result[column["name"]] = decode_column(column["type"], chunk, footer["rows"])
+    return result
+
+
+# Arrow formats ----------------------------------------------------------------
+
+def arrow_schema():
+    types = {
+        "timestamp": pyarrow.timestamp("us", tz="UTC"),
+        "int32": pyarrow.int32(),
+        "float32": pyarrow.float32(),
+        "bool": pyarrow.bool_(),
+        "string": pyarrow.string(),
+        "list<string>": pyarrow.list_(pyarrow.string()),
+    }
+    return pyarrow.schema([(name, types[column_type]) for name, column_type in SCHEMA])
+
+
+def write_arrow(path: Path, rows: List[Dict[str, Any]], fmt: str):
+    table = pyarrow.Table.from_pylist(rows, schema=arrow_schema())
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if fmt == "parquet":
+        pyarrow.parquet.write_table(table, str(tmp_path), compression="zstd")
+    else:
+        pyarrow.feather.write_feather(table, str(tmp_path), compression="zstd")
+    os.replace(str(tmp_path), str(path))
+
+
+def read_part(path: Path, columns: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+    """Columns of any exported part file, as Python lists"""
+    path = Path(path)
+    if path.suffix == ".pecol":
+        return read_pecol(path, columns)
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError(f"reading {path.suffix} files needs pyarrow")
+    if path.suffix == ".parquet":
+        table = pyarrow.parquet.read_table(str(path), columns=columns)
+    else:
+        table = pyarrow.feather.read_table(str(path), columns=columns)
+    return table.to_pydict()
+
+
+# Incremental export -------------------------------------------------------------
+
+def load_export_state(directory: Path) -> Dict[str, Any]:
+    try:
+        with open(directory / _STATE_FILE, "r") as f:
+            state = json.load(f)
+        if state.get("version") == _FORMAT_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"version": _FORMAT_VERSION, "inode": None, "offset": 0, "last_timestamp": "", "rows": 0}
+
+
+def _read_new_records(log_file: Path, state: Dict[str, Any],
+                      max_rows: Optional[int]) -> Tuple[List[Dict], int, int, int]:
+    """Complete records appended since the state offset; returns (records, start, end, inode)"""
+    stat = log_file.stat()
+    offset = state.get("offset", 0)
+    rescan = state.get("inode") not in (None, stat.st_ino) or offset > stat.st_size
+    if rescan:
+        # The log was compacted or replaced: skip what the watermark says is exported
+        offset = 0
+    watermark = state.get("last_timestamp", "") if rescan else ""
+
+    records, start = [], offset
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        while max_rows is None or len(records) < max_rows:
+            line = f.readline()
+            if not line or not line.endswith(b"\n"):
+                break
+            offset = f.tell()
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and str(record.get("timestamp", "")) > watermark:
+                records.append(record)
+    return records, start, offset, stat.st_ino
+
+
+def export_interactions(learning_dir: Path = LEARNING_DIR, directory: Path = DEFAULT_EXPORT_DIR,
+                        fmt: str = "auto", full: bool = False,
+                        max_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Export interactions appended since the last run; returns a summary"""
+    fmt = resolve_format(fmt)
+    log_file = learning_dir / "analytics" / "interactions.log"
+    directory.mkdir(parents=True, exist_ok=True)
+    summary = {"format": fmt, "rows": 0, "parts": [], "directory": str(directory)}
+    if not log_file.exists():
+        return summary
+
+    with locked(directory / "_export.lock"):
+        if full:
+            for partition in directory.glob("day=*"):
+                shutil.rmtree(partition, ignore_errors=True)
+        state = {} if full else load_export_state(directory)
+        records, start_offset, offset, inode = _read_new_records(log_file, state, max_rows)
+
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            day = str(record.get("timestamp", ""))[:10] or "unknown"
+            by_day.setdefault(day, []).append(row_from_record(record))
+
+        for day, rows in sorted(by_day.items()):
+            part = directory / f"day={day}" / f"part-{inode}-{start_offset:012d}.{EXTENSIONS[fmt]}"
+            part.parent.mkdir(parents=True, exist_ok=True)
+            if fmt == "pecol":
+                write_pecol(part, rows)
+            else:
+                write_arrow(part, rows, fmt)
+            summary["parts"].append(str(part.relative_to(directory)))
+            summary["rows"] += len(rows)
+
+        new_state = {
+            "version": _FORMAT_VERSION,
+            "inode": inode,
+            "offset": offset,
+            "last_timestamp": max([str(r.get("timestamp", "")) for r in records]
+                                  + [state.get("last_timestamp", "")]),
+            "rows": state.get("rows", 0) + summary["rows"],
+            "format": fmt,
+        }
+        atomic_write_bytes(directory / _STATE_FILE, json.dumps(new_state, indent=2).encode("utf-8"))
+    return summary
+
+
+def iter_parts(directory: Path) -> Iterator[Path]:
+    for extension in EXTENSIONS.values():
+        yield from sorted(directory.glob(f"day=*/part-*.{extension}"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Columnar export of the interaction log")
+    parser.add_argument("--learning-dir", type=Path, default=LEARNING_DIR)
+    parser.add_argument("--output", type=Path, default=None, help="Export directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export rows appended since the last run")
+    export_parser.add_argument("--format", default=None, choices=["auto"] + sorted(EXTENSIONS))
+    export_parser.add_argument("--full", action="store_true", help="Discard previous parts and re-export")
+    subparsers.add_parser("info", help="Partitions, parts and export state")
+    read_parser = subparsers.add_parser("read", help="Print rows of one part file as JSON lines")
+    read_parser.add_argument("path", type=Path)
+    read_parser.add_argument("--columns", default=None)
+    read_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    try:
+        from enhance_prompt import load_config
+        settings = get_export_settings(load_config())
+    except ImportError:
+        settings = get_export_settings()
+    directory = args.output or settings["directory"]
+
+    if args.command == "export":
+        rows, parts, full = 0, 0, args.full
+        while True:
+            summary = export_interactions(args.learning_dir, directory, args.format or settings["format"],
+                                          full=full, max_rows=settings["rows_per_part"])
+            rows, parts, full = rows + summary["rows"], parts + len(summary["parts"]), False
+            if summary["rows"] < settings["rows_per_part"]:
+                break
+        print(f"Exported {rows} rows as {summary['format']} into {parts} parts under {summary['directory']}")
+    elif args.command == "info":
+        state = load_export_state(directory)
+        parts = list(iter_parts(directory))
+        days = sorted({p.parent.name[len("day="):] for p in parts})
+        print(f"directory   {directory}")
+        print(f"days        {len(days)}" + (f" ({days[0]} .. {days[-1]})" if days else ""))
+        print(f"parts       {len(parts)} ({sum(p.stat().st_size for p in parts)} bytes)")
+        print(f"rows        {state.get('rows', 0)}")
+        print(f"log offset  {state.get('offset', 0)}")
+    else:
+        columns = args.columns.split(",") if args.columns else None
+        data = read_part(args.path, columns)
+        names = list(data)
+        count = len(data[names[0]]) if names else 0
+        for i in range(min(count, args.limit)):
+            print(json.dumps({name: data[name][i] for name in names}, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Per-project config overlays resolved from the hook's cwd
+
+load_config(cwd) merges, later entries winning:
+1. default_config.json (or the config embedded in the zipapp)
+2. ~/.claude/prompt-enhancer-config.json
+3. every .claude/prompt-enhancer-config.json from the repository root down to
+   cwd, so the overlay nearest to cwd wins
+
+The repository root is the nearest directory at or above cwd with a .git entry;
+outside a repository only cwd itself is checked. Overlays may only set the
+top-level sections listed in project_overlays.allowed_sections of the default
+and user config, so a cloned repository cannot redirect capture, learning or
+cache paths.
+
+Merged configs are cached in memory and on disk (one file per cwd) together
+with the (mtime_ns, size) of every file they depend on, including overlay and
+.git paths that do not exist yet. A cached merge is reused while all of those
+stamps are unchanged, so a prompt costs a few stat calls and one small read
+instead of re-reading and re-merging every JSON file. The refinement scheduler's
+daily cleanup removes cache files not read or written for cleanup_old_data_days.
+
+Usage:
+    python3 config_overlays.py show [--cwd DIR] [--sources]
+    python3 config_overlays.py clear
+    python3 config_overlays.py prune [--days 30]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from file_utils import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / ".claude" / "prompt-enhancer-learning" / "config_cache"
+OVERLAY_NAME = Path(".claude") / "prompt-enhancer-config.json"
+DEFAULT_ALLOWED_SECTIONS = ["bypass", "enrichment", "tot_reflection", "output_format", "uncertainty_handling",
+                            "orchestrator_optimization", "research", "questions"]
+_FORMAT_VERSION = 1
+
+# cwd -> cache entry; validated against file stamps on every lookup
+_memory: Dict[str, Dict[str, Any]] = {}
+
+
+def get_overlay_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("project_overlays", {})
+    return {
+        "enabled": bool(section.get("enabled", True)),
+        "allowed_sections": list(section.get("allowed_sections", DEFAULT_ALLOWED_SECTIONS)),
+    }
+
+
+def _stamp(path) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def repository_root(cwd: str) -> Optional[Path]:
+    """Nearest directory at or above cwd with a .git entry, or None outside a repository"""
+    for directory in [Path(cwd)] + list(Path(cwd).parents):
+        if os.path.lexists(directory / ".git"):
+            return directory
+    return None
+
+
+def directory_chain(cwd: str) -> List[Path]:
+    """Directories from the repository root down to cwd (just cwd outside a repository)"""
+    root = repository_root(cwd)
+    if root is None:
+        return [Path(cwd)]
+    chain = [Path(cwd)] + list(Path(cwd).parents)
+    return list(reversed(chain[:chain.index(root) + 1]))
+
+
+def overlay_sources(cwd: str) -> Tuple[List[Path], List[Path]]:
+    """Overlay paths (root first) and every path whose appearance changes the chain"""
+    chain = directory_chain(cwd)
+    overlays = [directory / OVERLAY_NAME for directory in chain]
+    # A new .git below the root would move it; one at the root disappearing would too
+    guards = [directory / ".git" for directory in chain]
+    return overlays, overlays + guards
+
+
+def _cache_file(cache_dir: Path, key: str) -> Path:
+    return cache_dir / f"{hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()}.json"
+
+
+def _read_entry(cache_dir: Path, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_cache_file(cache_dir, key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != _FORMAT_VERSION or entry.get("cwd") != key:
+        return None
+    return entry
+
+
+def _write_entry(cache_dir: Path, key: str, entry: Dict[str, Any]):
+    try:
+        atomic_write_text(_cache_file(cache_dir, key), json.dumps(entry, separators=(",", ":")))
+    except OSError as e:
+        logger.debug(f"Could not write config cache: {e}")
+
+
+def _fresh(entry: Optional[Dict[str, Any]]) -> bool:
+    return (bool(entry) and "config" in entry
+            and all(_stamp(path) == stamp for path, stamp in entry.get("stamps", [])))
+
+
+def _read_overlay(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overlay = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring project config {path}: {e}")
+        return {}
+    if not isinstance(overlay, dict):
+        logger.warning(f"Ignoring project config {path}: not a JSON object")
+        return {}
+    return overlay
+
+
+def merge_overlays(base: Dict[str, Any], overlays: List[Path],
+                   merge: Callable[[Dict, Dict], Dict]) -> Tuple[Dict[str, Any], List[str]]:
+    """base merged with each overlay in order, limited to the allowed sections; also the overlays used"""
+    allowed = set(get_overlay_settings(base)["allowed_sections"])
+    config, used = base, []
+    for path in overlays:
+        overlay = _read_overlay(path)
+        if not overlay:
+            continue
+        rejected = sorted(set(overlay) - allowed)
+        if rejected:
+            logger.warning(f"Project config {path} may not set: {', '.join(rejected)}")
+        config = merge(config, {key: value for key, value in overlay.items() if key in allowed})
+        used.append(str(path))
+    return config, used
+
+
+def resolve_config(cwd: Optional[str], base_sources: List[Path], load_base: Callable[[], Dict],
+                   merge: Callable[[Dict, Dict], Dict]) -> Dict[str, Any]:
+    """Merged config for cwd, reusing the cached merge while none of its source files changed"""
+    key = os.path.abspath(cwd) if isinstance(cwd, str) and cwd else ""
+    entry = _memory.get(key)
+    if _fresh(entry):
+        return entry["config"]
+    entry = _read_entry(DEFAULT_CACHE_DIR, key)
+    if _fresh(entry):
+        _memory[key] = entry
+        return entry["config"]
+
+    # Stamp before reading, so an edit made while merging invalidates the entry
+    stamps = [[str(path), _stamp(path)] for path in base_sources]
+    base = load_base()
+    enabled = get_overlay_settings(base)["enabled"] and bool(key)
+    overlays, watched = overlay_sources(key) if enabled else ([], [])
+    stamps += [[str(path), _stamp(path)] for path in watched]
+    config, used = merge_overlays(base, overlays, merge)
+    entry = {"version": _FORMAT_VERSION, "cwd": key, "stamps": stamps, "overlays": used, "config": config}
+    _memory[key] = entry
+    _write_entry(DEFAULT_CACHE_DIR, key, entry)
+    if used:
+        logger.info(f"Project config overlays for {key}: {', '.join(used)}")
+    return config
+
+
+def clear_cache(cache_dir: Path = DEFAULT_CACHE_DIR) -> int:
+    _memory.clear()
+    removed = 0
+    for path in cache_dir.glob("*.json"):
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def prune_cache(max_age_days: float, cache_dir: Path = DEFAULT_CACHE_DIR) -> int:
+    """Remove cache files (and stray temp files) unused for max_age_days; returns the count"""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in list(cache_dir.glob("*.json")) + list(cache_dir.glob(".*.tmp")):
+        try:
+            st = path.stat()
+            # Hits only read the file, so atime (relatime) is the last use; mtime the last merge
+            if max(st.st_atime, st.st_mtime) < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Per-project config overlays")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = subparsers.add_parser("show", help="Print the merged config for a directory")
+    show_parser.add_argument("--cwd", default=os.getcwd())
+    show_parser.add_argument("--sources", action="store_true", help="List the overlays and watched files instead")
+
+    subparsers.add_parser("clear", help="Remove the on-disk merge cache")
+    prune_parser = subparsers.add_parser("prune", help="Remove cached configs unused for --days")
+    prune_parser.add_argument("--days", type=float, default=30)
+
+    args = parser.parse_args(argv)
+    if args.command == "clear":
+        print(f"Removed {clear_cache()} cached configs")
+        return 0
+    if args.command == "prune":
+        print(f"Removed {prune_cache(args.days)} cached configs")
+        return 0
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import enhance_prompt
+    config = enhance_prompt.load_config(args.cwd)
+    if args.sources:
+        entry = _read_entry(DEFAULT_CACHE_DIR, os.path.abspath(args.cwd)) or {}
+        print("Overlays applied:")
+        for path in entry.get("overlays", []):
+            print(f"  {path}")
+        print("Watched files:")
+        for path, stamp in entry.get("stamps", []):
+            print(f"  {'present' if stamp else 'absent ':<8} {path}")
+        return 0
+    print(json.dumps(config, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
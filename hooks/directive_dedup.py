@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Cross-layer deduplication of repeated directives in the assembled output
+
+The ultra blocks, the four templates and the execution protocol of the
+evaluation wrapper repeat directives (input validation, async/testing
+advice, CI/CD and monitoring tool lists, ...). build_plan() runs once, at
+build time or by hand after templates are edited or refined:
+- splits every layer into directive lines (bullets, numbered items, sentences;
+  headings, code fences and diagrams are left alone)
+- clusters exact and near-duplicate directives from different layers
+  (Jaccard similarity of stemmed content words >= similarity)
+- picks one canonical wording per cluster (the most specific variant)
+- adds the KNOWN_DIRECTIVES clusters: paraphrases that share too few words
+  for the similarity test, such as the execution protocol's "All
+  self-assessment scores must be ≥9" restating the reflection block's
+  quality gate. Each names the lines that state the directive in full
+  ("keep", never dropped) and the lines that only restate it ("drop")
+- records, per layer variant (keyed by a content fingerprint), which lines
+  belong to which cluster, plus the headings and numbered lists around them
+
+dedup_layers() applies the plan while the output is assembled: the first
+occurrence of a cluster is emitted with the canonical wording, later ones are
+dropped, a heading whose lines were all dropped goes with them and numbered
+lists are renumbered. Known directives keep their own wording: a restatement
+is only dropped after a layer with the full statement was emitted. A layer whose content does not match a fingerprint in
+the plan (custom config values, a template refined after the plan was built)
+passes through unchanged.
+
+Usage:
+    python3 directive_dedup.py build [--output hooks/config/dedup_plan.json] [--similarity 0.75]
+    python3 directive_dedup.py report [--plan hooks/config/dedup_plan.json] [--clusters]
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 2
+DEFAULT_SIMILARITY = 0.75
+MIN_CONTENT_WORDS = 3
+SOURCE_PLAN_PATH = Path(__file__).resolve().parent / "config" / "dedup_plan.json"
+
+# Assembly order: ultra blocks, template layers, then the wrapper's execution protocol
+LAYER_ORDER = ["tot_reflection", "output_format", "uncertainty_handling", "orchestrator_react",
+               "design_guidance", "excellence_criteria", "tool_preferences", "workspace_methodology",
+               "execution_protocol"]
+
+STOPWORDS = frozenset("""
+a an the and or of for to in on at by with from as is are be been being it its this that these those
+your you we our all any each if then than so such into via use using when while before after not no
+only also both per e g etc vs
+""".split())
+
+# Paraphrased directives: {layer: pattern} of the full statements and of their restatements
+KNOWN_DIRECTIVES = [
+    {"name": "quality gate (scores >= 9)",
+     "keep": {"tot_reflection": r"^If ANY score < 9:"},
+     "drop": {"execution_protocol": r"All self-assessment scores must be ≥9"}},
+    {"name": "tree-of-thought approaches",
+     "keep": {"tot_reflection": r"GENERATE \d+-\d+ DISTINCT APPROACHES"},
+     "drop": {"execution_protocol": r"Follow ToT protocol"}},
+    {"name": "mandatory self-critique",
+     "keep": {"tot_reflection": r"you MUST perform this critique",
+              "output_format": r"\*\*Self-Critique\*\* \(mandatory\)"},
+     "drop": {"execution_protocol": r"Perform mandatory self-critique"}},
+    {"name": "ReAct loop",
+     "keep": {"orchestrator_react": r"Strict ReAct Format"},
+     "drop": {"execution_protocol": r"Use ReAct format for multi-step tasks"}},
+    {"name": "documented assumptions",
+     "keep": {"tot_reflection": r"List all assumptions made",
+              "uncertainty_handling": r"Explicit Assumption Statement"},
+     "drop": {"execution_protocol": r"Assumptions explicitly documented"}},
+    {"name": "Plan B",
+     "keep": {"uncertainty_handling": r"Alternative Solution \(Plan B\)"},
+     "drop": {"execution_protocol": r"Plan B provided for uncertainties"}},
+    {"name": "clarifying questions after research",
+     "keep": {"uncertainty_handling": r"Clarification Request"},
+     "drop": {"execution_protocol": r"if still unclear: Ask max"}},
+]
+
+_MARKER = re.compile(r"^(\s*(?:[-*•]\s+(?:\[[ xX]\]\s+)?|\d+\.\s+)?)(.*)$")
+_NUMBERED = re.compile(r"^(\s*)(\d+)\.(\s+)")
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_DIAGRAM_CHARS = set("│├└─═┌┐┘┬┴┼")
+
+
+def fingerprint(text: str) -> str:
+    return f"{len(text)}:{zlib.crc32(text.encode('utf-8')):08x}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (words and punctuation marks)"""
+    return len(_TOKEN.findall(text))
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def content_words(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD.findall(text.lower().replace("_", " ")) if w not in STOPWORDS]
+
+
+def _is_heading(body: str) -> bool:
+    stripped = body.strip().strip("*").strip()
+    return (body.lstrip().startswith("#") or stripped.endswith(":")
+            or (stripped.upper() == stripped and any(c.isalpha() for c in stripped)))
+
+
+def directive_lines(text: str) -> Tuple[List[Tuple[int, str, List[str]]], List[List[int]]]:
+    """(line number, body, content words) of each directive line, and heading sections"""
+    directives, sections = [], []
+    section: Optional[List[int]] = None
+    in_fence = False
+    for number, line in enumerate(text.split("\n")):
+        if line.strip().startswith("```"):
+            in_fence = not in_fence
+            section = None
+            continue
+        if in_fence or not line.strip() or set(line) & _DIAGRAM_CHARS:
+            section = None
+            continue
+        marker, body = _MARKER.match(line).groups()
+        if _is_heading(body):
+            section = [number]
+            sections.append(section)
+            continue
+        if section is not None:
+            section.append(number)
+        words = content_words(body)
+        # Checklist items are verification steps, not guidance; keep them whole
+        if len(words) >= MIN_CONTENT_WORDS and "[" not in marker:
+            directives.append((number, body, words))
+    return directives, [s for s in sections if len(s) > 1]
+
+
+def _numbered_runs(text: str) -> List[List[int]]:
+    """Line numbers of consecutive numbered items at the same indent"""
+    runs, current, indent = [], [], None
+    for number, line in enumerate(text.split("\n")):
+        match = _NUMBERED.match(line)
+        if match and (indent is None or match.group(1) == indent):
+            current.append(number)
+            indent = match.group(1)
+        elif match or (line.strip() and not line.startswith((indent or "") + " ")):
+            if len(current) > 1:
+                runs.append(current)
+            current = [number] if match else []
+            indent = match.group(1) if match else None
+    if len(current) > 1:
+        runs.append(current)
+    return runs
+
+
+def _similar(a: Set[str], b: Set[str], similarity: float) -> bool:
+    return len(a & b) >= similarity * len(a | b)
+
+
+def _known_matches(variants: List[Dict[str, Any]], known: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep and drop lines of each known directive that has both in the given variants"""
+    matches = []
+    for directive in known:
+        found = {"name": directive["name"], "keep": [], "drop": []}
+        for role in ("keep", "drop"):
+            for index, variant in enumerate(variants):
+                pattern = directive[role].get(variant["name"])
+                if not pattern:
+                    continue
+                found[role] += [(index, number) for number, line in enumerate(variant["content"].split("\n"))
+                                if re.search(pattern, line)]
+        if found["keep"] and found["drop"]:
+            matches.append(found)
+    return matches
+
+
+def build_plan(layers: Iterable[Tuple[str, str]], similarity: float = DEFAULT_SIMILARITY,
+               known: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Dedup plan for the given (layer name, content) variants, in assembly order"""
+    variants = [{"name": name, "content": content} for name, content in layers if content]
+    matches = _known_matches(variants, KNOWN_DIRECTIVES if known is None else known)
+    claimed = {line for match in matches for role in ("keep", "drop") for line in match[role]}
+
+    units = []
+    for index, variant in enumerate(variants):
+        directives, variant["sections"] = directive_lines(variant["content"])
+        name = variant["name"]
+        for number, body, words in directives:
+            if (index, number) in claimed:
+                continue
+            units.append({"variant": index, "name": name, "line": number, "body": body,
+                          "words": words, "set": frozenset(words)})
+
+    # Union-find over duplicate pairs from different layers; candidates share a content word
+    parent = list(range(len(units)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    by_word: Dict[str, List[int]] = {}
+    for index, unit in enumerate(units):
+        candidates = set()
+        for word in unit["set"]:
+            candidates.update(by_word.get(word, ()))
+        for other in candidates:
+            if units[other]["name"] != unit["name"] and (
+                    units[other]["words"] == unit["words"] or _similar(units[other]["set"], unit["set"], similarity)):
+                parent[find(index)] = find(other)
+        for word in unit["set"]:
+            by_word.setdefault(word, []).append(index)
+
+    groups: Dict[int, List[int]] = {}
+    for index in range(len(units)):
+        groups.setdefault(find(index), []).append(index)
+    clusters = [members for members in groups.values() if len({units[m]["name"] for m in members}) > 1]
+    clusters.sort(key=lambda members: min(members))
+
+    plan = {"version": PLAN_VERSION, "similarity": similarity, "canonical": {}, "known": {}, "layers": {}}
+    lines: Dict[int, List[List[int]]] = {}
+    marks: Dict[int, List[List[int]]] = {}
+    for cluster_id, members in enumerate(clusters):
+        # The most specific wording wins; ties go to the earliest occurrence
+        canonical = max(members, key=lambda m: (len(units[m]["set"]), -m))
+        plan["canonical"][str(cluster_id)] = units[canonical]["body"]
+        for member in members:
+            lines.setdefault(units[member]["variant"], []).append([units[member]["line"], cluster_id])
+
+    for cluster_id, match in enumerate(matches, start=len(clusters)):
+        # No canonical wording: each line stays as written, restatements are only dropped
+        plan["canonical"][str(cluster_id)] = None
+        plan["known"][str(cluster_id)] = match["name"]
+        for index, number in match["keep"]:
+            marks.setdefault(index, []).append([number, cluster_id])
+        for index, number in match["drop"]:
+            lines.setdefault(index, []).append([number, cluster_id])
+
+    for number, variant in enumerate(variants):
+        if number not in lines and number not in marks:
+            continue
+        clustered = {line for line, _ in lines.get(number, [])}
+        plan["layers"].setdefault(variant["name"], {})[fingerprint(variant["content"])] = {
+            "marks": sorted(marks.get(number, [])),
+            "lines": sorted(lines.get(number, [])),
+            "sections": [s for s in variant["sections"] if clustered & set(s[1:])],
+            "numbered": [run for run in _numbered_runs(variant["content"]) if clustered & set(run)],
+        }
+    return plan
+
+
+def dedup_layers(plan: Optional[Dict[str, Any]], layers: List[Tuple[str, str]],
+                 seen: Optional[Set[int]] = None) -> List[str]:
+    """Layer contents with repeated directives removed; seen carries clusters across calls"""
+    if not plan:
+        return [content for _, content in layers]
+    seen = set() if seen is None else seen
+    output = []
+    for name, content in layers:
+        entry = plan.get("layers", {}).get(name, {}).get(fingerprint(content))
+        if not entry:
+            output.append(content)
+            continue
+        lines = content.split("\n")
+        dropped = set()
+        # Full statements of known directives: never dropped, but later restatements are
+        seen.update(cluster for _, cluster in entry.get("marks", []))
+        for number, cluster in entry["lines"]:
+            if cluster in seen:
+                dropped.add(number)
+                continue
+            seen.add(cluster)
+            canonical = plan["canonical"].get(str(cluster))
+            if canonical:
+                lines[number] = _MARKER.match(lines[number]).group(1) + canonical
+        if dropped:
+            for heading, *members in entry["sections"]:
+                if all(member in dropped for member in members):
+                    dropped.add(heading)
+            for run in entry["numbered"]:
+                position = 1
+                for number in run:
+                    if number in dropped:
+                        continue
+                    lines[number] = _NUMBERED.sub(lambda m: f"{m.group(1)}{position}.{m.group(3)}", lines[number], 1)
+                    position += 1
+        output.append("\n".join(_kept_lines(lines, dropped)))
+    return output
+
+
+def _kept_lines(lines: List[str], dropped: Set[int]) -> List[str]:
+    """Lines not dropped, without the double blank lines a removed section leaves behind"""
+    kept, gap = [], False
+    for number, line in enumerate(lines):
+        if number in dropped:
+            gap = True
+            continue
+        if gap and not line.strip() and kept and not kept[-1].strip():
+            continue
+        kept.append(line)
+        gap = gap and not line.strip()
+    return kept
+
+
+def load_plan(paths: Iterable[Path], embedded: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """First readable plan of the current version from paths, else the embedded one"""
+    def sources():
+        for path in paths:
+            try:
+                yield path.read_text(encoding="utf-8")
+            except OSError:
+                continue
+        if embedded:
+            yield embedded
+
+    for source in sources():
+        try:
+            plan = json.loads(source)
+        except ValueError:
+            continue
+        if isinstance(plan, dict) and plan.get("version") == PLAN_VERSION:
+            return plan
+    return None
+
+
+def collect_layers(config: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Every layer variant the hook can emit for config, in assembly order"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import enhance_prompt
+
+    layers = [
+        ("tot_reflection", enhance_prompt.build_tot_reflection_block(config, "general")),
+        ("output_format", enhance_prompt.build_output_format_block("general")),
+        ("uncertainty_handling", enhance_prompt.build_uncertainty_handling_block()),
+        ("orchestrator_react", enhance_prompt.build_orchestrator_react_block()),
+    ]
+    templates_dir = Path(__file__).resolve().parent / "templates"
+    for name in LAYER_ORDER[4:8]:
+        content = enhance_prompt.load_template(name, config)
+        if not content and (templates_dir / f"{name}.txt").exists():
+            # Source checkout: templates live next to this file
+            content = enhance_prompt.render_template((templates_dir / f"{name}.txt").read_text(encoding="utf-8"),
+                                                     {"config": json.dumps(config, indent=2)})
+        layers.append((name, content))
+    layers.append(("execution_protocol", enhance_prompt.build_execution_protocol(True)))
+    layers.append(("execution_protocol", enhance_prompt.build_execution_protocol(False)))
+    return layers
+
+
+def savings_report(plan: Dict[str, Any], layers: List[Tuple[str, str]]) -> Dict[str, Dict[str, int]]:
+    """Bytes and approximate tokens of each mode's full layer set, with and without dedup"""
+    protocols = [content for name, content in layers if name == "execution_protocol"]
+    others = [(name, content) for name, content in layers if name != "execution_protocol"]
+    modes = {
+        "ultra": others + [("execution_protocol", protocols[0])],
+        "standard": [(n, c) for n, c in others if n in LAYER_ORDER[4:8]] + [("execution_protocol", protocols[-1])],
+    }
+    report = {}
+    for mode, mode_layers in modes.items():
+        before = "\n".join(content for _, content in mode_layers)
+        after = "\n".join(dedup_layers(plan, mode_layers))
+        before_bytes, after_bytes = len(before.encode("utf-8")), len(after.encode("utf-8"))
+        report[mode] = {
+            "bytes": before_bytes, "dedup_bytes": after_bytes, "saved_bytes": before_bytes - after_bytes,
+            "tokens": estimate_tokens(before), "dedup_tokens": estimate_tokens(after),
+            "saved_tokens": estimate_tokens(before) - estimate_tokens(after),
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cross-layer directive deduplication plan")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Analyse the layers and write the plan")
+    build_parser.add_argument("--output", type=Path, default=SOURCE_PLAN_PATH)
+    build_parser.add_argument("--similarity", type=float)
+    report_parser = subparsers.add_parser("report", help="Bytes/tokens saved per mode")
+    report_parser.add_argument("--plan", type=Path, default=SOURCE_PLAN_PATH)
+    for sub in (build_parser, report_parser):
+        sub.add_argument("--clusters", action="store_true", help="List the canonical directives")
+        sub.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import enhance_prompt
+    config = enhance_prompt.load_config()
+    layers = collect_layers(config)
+
+    if args.command == "build":
+        similarity = args.similarity or config.get("enrichment", {}).get("dedup", {}).get(
+            "similarity", DEFAULT_SIMILARITY)
+        plan = build_plan(layers, similarity)
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(plan, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Wrote {args.output}: {len(plan['canonical'])} duplicated directives "
+              f"({len(plan['known'])} known paraphrases) across {len(plan['layers'])} layers")
+    else:
+        plan = load_plan([args.plan])
+        if plan is None:
+            print(f"No plan at {args.plan}; run `directive_dedup.py build` first", file=sys.stderr)
+            return 1
+
+    report = savings_report(plan, layers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for mode, numbers in report.items():
+        print(f"{mode:<9} {numbers['bytes']:>6} -> {numbers['dedup_bytes']:>6} bytes "
+              f"(-{numbers['saved_bytes']}), ~{numbers['tokens']} -> ~{numbers['dedup_tokens']} tokens "
+              f"(-{numbers['saved_tokens']})")
+    if args.clusters:
+        for cluster_id, text in sorted(plan["canonical"].items(), key=lambda item: int(item[0])):
+            print(f"  [{cluster_id}] {text or 'known: ' + plan['known'].get(cluster_id, '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
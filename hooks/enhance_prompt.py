@@ -20,16 +20,18 @@ import re
 import sys
 import time
 from pathlib import Path
-from typing import Dict, Optional, Tuple, List
+from typing import Any, Callable, Dict, Optional, Tuple, List
 from functools import lru_cache
 
-# Setup logging
-logging.basicConfig(
-    level=logging.WARNING,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+def _configure_logging():
+    """Setup logging (deferred to main() to keep import time low)"""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
 # Lazy loading - imports loaded only when needed
 _IMPORT_CACHE = {}
 
@@ -123,6 +125,16 @@ def _fallback_performance_monitor(threshold_ms=500.0): return lambda func: func
 def _fallback_create_error_context(e, ctx): return str(e)
 def _fallback_safe_dict_access(d, key, default): return d.get(key, default) if isinstance(d, dict) else default
 
+# Templates and default config embedded by build_zipapp.py (absent when run from source)
+try:
+    from _embedded_assets import EMBEDDED_TEMPLATES, EMBEDDED_DEFAULT_CONFIG
+except ImportError:
+    EMBEDDED_TEMPLATES, EMBEDDED_DEFAULT_CONFIG = {}, None
+try:
+    from _embedded_assets import EMBEDDED_DEDUP_PLAN
+except ImportError:
+    EMBEDDED_DEDUP_PLAN = None
+
 # Get error handlers (lazy loaded)
 _error_handlers = _get_error_handlers()
 
@@ -139,67 +151,152 @@ performance_monitor = _error_handlers['performance_monitor']
 create_error_context = _error_handlers['create_error_context']
 safe_dict_access = _error_handlers['safe_dict_access']
 
-# Pre-compiled regex patterns for performance
-_COMPILED_REGEXES = {
-    'ultra_triggers': [re.compile(pattern, re.IGNORECASE) for pattern in [
+# Matcher backend for the pattern tables (stdlib re unless performance.matcher selects another)
+try:
+    from matcher_backends import compile_matcher, configure_matchers
+except ImportError:
+    compile_matcher = re.compile
+    def configure_matchers(settings): return False
+
+# Chunked parallel findall for very large prompts and histories (serial below the threshold)
+try:
+    from parallel_extraction import findall_many, findall_patterns, configure_parallel_extraction
+except ImportError:
+    def findall_many(patterns, texts): return [[p.findall(t) for p in patterns] for t in texts]
+    def findall_patterns(patterns, text): return [p.findall(text) for p in patterns]
+    def configure_parallel_extraction(settings): pass
+
+# Cross-layer directive dedup driven by a plan precomputed with directive_dedup.py build
+try:
+    from directive_dedup import dedup_layers, load_plan
+except ImportError:
+    def dedup_layers(plan, layers, seen=None): return [content for _, content in layers]
+    def load_plan(paths, embedded=None): return None
+
+# Sampling policy for learning records (every record is written unless learning.sampling is enabled)
+try:
+    from record_sampling import sample_weight
+except ImportError:
+    def sample_weight(metrics, config=None): return 1.0
+
+# Per-project config overlays, cached per cwd and keyed on file mtimes
+try:
+    from config_overlays import resolve_config
+except ImportError:
+    def resolve_config(cwd, base_sources, load_base, merge): return load_base()
+
+# Early exit for trivial follow-ups ("yes", "run the tests again")
+try:
+    from fast_path import classify_trivial, fast_path_output
+except ImportError:
+    def classify_trivial(prompt, config): return None
+    def fast_path_output(config): return ""
+
+# Regex pattern groups, compiled on first use of each group
+_REGEX_SOURCES = {
+    'ultra_triggers': lambda: [compile_matcher(pattern, re.IGNORECASE) for pattern in [
         r'\b(orchestrat|design.*architect|coordinate.*multi|comprehens.*system|microservice.*pattern)\b',
         r'\b(enterprise.*scale|production.*grade|distributed.*system|cloud.*native|kubernetes)\b',
         r'\b(complex.*workflow|advanced.*pattern|sophisticated.*solution|intricate.*design)\b'
     ]],
-    'technical_keywords': [re.compile(pattern, re.IGNORECASE) for pattern in [
+    'technical_keywords': lambda: [compile_matcher(pattern, re.IGNORECASE) for pattern in [
         r'\b(kubernetes|docker|microservice|serverless|nosql|oauth|jwt|graphql|rest.*api)\b',
         r'\b(machine.*learning|artificial.*intelligence|neural.*network|deep.*learning)\b',
         r'\b(blockchain|smart.*contract|distributed.*ledger|cryptocurrency)\b',
         r'\b(devops|cicd|continuous.*integration|continuous.*deployment|agile)\b'
     ]],
-    'file_references': [
-        re.compile(r'\b[\w\-./]+\.(py|js|jsx|ts|tsx|java|cpp|c|h|go|rs|rb|php|swift|kt|scala|sh|bat|ps1)\b'),
-        re.compile(r'\b[\w\-./]+\.(json|yaml|yml|xml|toml|ini|conf|config)\b'),
-        re.compile(r'\b[\w\-./]+\.(md|txt|csv|sql|html|css|scss|less)\b')
+    # Anchored at the start of each path run: a bare \b start retries at every
+    # word inside "a.a.a..." and goes quadratic (found by perf_fuzz.py)
+    'file_references': lambda: [
+        compile_matcher(r'(?<![\w\-./])[\-./]*\b([\w\-./]+\.(?:py|js|jsx|ts|tsx|java|cpp|c|h|go|rs|rb|php|swift|kt|scala|sh|bat|ps1))\b'),
+        compile_matcher(r'(?<![\w\-./])[\-./]*\b([\w\-./]+\.(?:json|yaml|yml|xml|toml|ini|conf|config))\b'),
+        compile_matcher(r'(?<![\w\-./])[\-./]*\b([\w\-./]+\.(?:md|txt|csv|sql|html|css|scss|less))\b')
     ],
-    'function_extraction': [
-        re.compile(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
-        re.compile(r'\b(def|function|func)\s+([a-zA-Z_][a-zA-Z0-9_]*)'),
-        re.compile(r'\b(class|interface)\s+([A-Z][a-zA-Z0-9_]*)')
+    'function_extraction': lambda: [
+        compile_matcher(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
+        compile_matcher(r'\b(def|function|func)\s+([a-zA-Z_][a-zA-Z0-9_]*)'),
+        compile_matcher(r'\b(class|interface)\s+([A-Z][a-zA-Z0-9_]*)')
     ],
-    'history_functions': [
-        re.compile(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
-        re.compile(r'\b(def|function|func)\s+([a-zA-Z_][a-zA-Z0-9_]*)'),
-        re.compile(r'\b(class|interface)\s+([A-Z][a-zA-Z0-9_]*)'),
-        re.compile(r'\b(implement|create|write|add)\s+(?:a\s+)?(?:function\s+)?([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
-        re.compile(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\s+(?:method|function)', re.IGNORECASE)
+    'history_functions': lambda: [
+        compile_matcher(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
+        compile_matcher(r'\b(def|function|func)\s+([a-zA-Z_][a-zA-Z0-9_]*)'),
+        compile_matcher(r'\b(class|interface)\s+([A-Z][a-zA-Z0-9_]*)'),
+        compile_matcher(r'\b(implement|create|write|add)\s+(?:a\s+)?(?:function\s+)?([a-zA-Z_][a-zA-Z0-9_]*)\(\)'),
+        compile_matcher(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\s+(?:method|function)', re.IGNORECASE)
     ],
-    'urgency': re.compile(r'\b(urgent|asap|immediately|critical|emergency|priority)\b'),
-    'casual': re.compile(r'\b(maybe|perhaps|might|could|sometime|eventually)\b'),
-    'examples': re.compile(r'(example|e\.g\.|such as)', re.IGNORECASE),
-    'constraints': re.compile(r'(constraint|requirement|must)', re.IGNORECASE),
-    'questions': re.compile(r'\?'),
-    'commands': re.compile(r'(add|create|fix|implement)', re.IGNORECASE),
-    'project_types': {
-        'web_app': [re.compile(r'\b(' + '|'.join(['web', 'frontend', 'backend', 'api', 'react', 'vue']) + r')\b', re.IGNORECASE)],
-        'mobile_app': [re.compile(r'\b(' + '|'.join(['mobile', 'ios', 'android', 'flutter']) + r')\b', re.IGNORECASE)],
-        'data_science': [re.compile(r'\b(' + '|'.join(['machine.*learning', 'data.*science', 'analytics', 'pandas', 'numpy']) + r')\b', re.IGNORECASE)],
-        'devops': [re.compile(r'\b(' + '|'.join(['devops', 'docker', 'kubernetes', 'cicd', 'deployment']) + r')\b', re.IGNORECASE)],
-        'cli_tool': [re.compile(r'\b(' + '|'.join(['cli', 'command.*line', 'terminal', 'shell']) + r')\b', re.IGNORECASE)]
+    'urgency': lambda: compile_matcher(r'\b(urgent|asap|immediately|critical|emergency|priority)\b'),
+    'casual': lambda: compile_matcher(r'\b(maybe|perhaps|might|could|sometime|eventually)\b'),
+    'examples': lambda: compile_matcher(r'(example|e\.g\.|such as)', re.IGNORECASE),
+    'constraints': lambda: compile_matcher(r'(constraint|requirement|must)', re.IGNORECASE),
+    'questions': lambda: compile_matcher(r'\?'),
+    'commands': lambda: compile_matcher(r'(add|create|fix|implement)', re.IGNORECASE),
+    'project_types': lambda: {
+        'web_app': [compile_matcher(r'\b(' + '|'.join(['web', 'frontend', 'backend', 'api', 'react', 'vue']) + r')\b', re.IGNORECASE)],
+        'mobile_app': [compile_matcher(r'\b(' + '|'.join(['mobile', 'ios', 'android', 'flutter']) + r')\b', re.IGNORECASE)],
+        'data_science': [compile_matcher(r'\b(' + '|'.join(['machine.*learning', 'data.*science', 'analytics', 'pandas', 'numpy']) + r')\b', re.IGNORECASE)],
+        'devops': [compile_matcher(r'\b(' + '|'.join(['devops', 'docker', 'kubernetes', 'cicd', 'deployment']) + r')\b', re.IGNORECASE)],
+        'cli_tool': [compile_matcher(r'\b(' + '|'.join(['cli', 'command.*line', 'terminal', 'shell']) + r')\b', re.IGNORECASE)]
     },
-    'tech_stacks': {
-        'python': [re.compile(r'\b(' + '|'.join(['python', 'django', 'flask', 'fastapi', 'pandas']) + r')\b', re.IGNORECASE)],
-        'javascript': [re.compile(r'\b(' + '|'.join(['javascript', 'node', 'react', 'vue', 'angular']) + r')\b', re.IGNORECASE)],
-        'java': [re.compile(r'\b(' + '|'.join(['java', 'spring', 'maven', 'gradle']) + r')\b', re.IGNORECASE)],
-        'go': [re.compile(r'\b(' + '|'.join(['go', 'golang', 'goroutine']) + r')\b', re.IGNORECASE)],
-        'rust': [re.compile(r'\b(' + '|'.join(['rust', 'cargo', 'tokio']) + r')\b', re.IGNORECASE)]
+    'tech_stacks': lambda: {
+        'python': [compile_matcher(r'\b(' + '|'.join(['python', 'django', 'flask', 'fastapi', 'pandas']) + r')\b', re.IGNORECASE)],
+        'javascript': [compile_matcher(r'\b(' + '|'.join(['javascript', 'node', 'react', 'vue', 'angular']) + r')\b', re.IGNORECASE)],
+        'java': [compile_matcher(r'\b(' + '|'.join(['java', 'spring', 'maven', 'gradle']) + r')\b', re.IGNORECASE)],
+        'go': [compile_matcher(r'\b(' + '|'.join(['go', 'golang', 'goroutine']) + r')\b', re.IGNORECASE)],
+        'rust': [compile_matcher(r'\b(' + '|'.join(['rust', 'cargo', 'tokio']) + r')\b', re.IGNORECASE)]
     },
-    'domain_terms': {
-        'medical': [re.compile(r'\b(' + '|'.join(['medical', 'healthcare', 'clinical', 'patient', 'diagnosis']) + r')\b', re.IGNORECASE)],
-        'finance': [re.compile(r'\b(' + '|'.join(['finance', 'financial', 'banking', 'payment', 'transaction']) + r')\b', re.IGNORECASE)],
-        'education': [re.compile(r'\b(' + '|'.join(['education', 'learning', 'student', 'course', 'curriculum']) + r')\b', re.IGNORECASE)],
-        'ecommerce': [re.compile(r'\b(' + '|'.join(['ecommerce', 'shopping.*cart', 'payment', 'checkout', 'inventory']) + r')\b', re.IGNORECASE)],
-        'gaming': [re.compile(r'\b(' + '|'.join(['game', 'gaming', 'player', 'score', 'level']) + r')\b', re.IGNORECASE)]
-    }
+    'domain_terms': lambda: {
+        'medical': [compile_matcher(r'\b(' + '|'.join(['medical', 'healthcare', 'clinical', 'patient', 'diagnosis']) + r')\b', re.IGNORECASE)],
+        'finance': [compile_matcher(r'\b(' + '|'.join(['finance', 'financial', 'banking', 'payment', 'transaction']) + r')\b', re.IGNORECASE)],
+        'education': [compile_matcher(r'\b(' + '|'.join(['education', 'learning', 'student', 'course', 'curriculum']) + r')\b', re.IGNORECASE)],
+        'ecommerce': [compile_matcher(r'\b(' + '|'.join(['ecommerce', 'shopping.*cart', 'payment', 'checkout', 'inventory']) + r')\b', re.IGNORECASE)],
+        'gaming': [compile_matcher(r'\b(' + '|'.join(['game', 'gaming', 'player', 'score', 'level']) + r')\b', re.IGNORECASE)]
+    },
+    # Matched against the lowercased prompt
+    'complexity': lambda: {level: [compile_matcher(pattern) for pattern in patterns] for level, patterns in {
+        "extreme": [
+            r'\b(architecture|system design|distributed|microservices|orchestrate|multi-agent)\b',
+            r'\b(complex workflow|advanced|sophisticated|intricate)\b'
+        ],
+        "high": [
+            r'\b(integration|refactor|optimize|performance|scalability)\b',
+            r'\b(multiple|several|various|complex)\b'
+        ],
+        "medium": [
+            r'\b(add|create|implement|build|modify)\b'
+        ],
+        "low": [
+            r'\b(fix|debug|simple|basic|quick)\b'
+        ]
+    }.items()}
 }
 
-# LRU cache for frequently accessed data
-@lru_cache(maxsize=256)
+class _LazyRegexTable(dict):
+    """Compiles a regex group on first access so import pays only for groups used"""
+
+    def __missing__(self, group):
+        compiled = _REGEX_SOURCES[group]()
+        self[group] = compiled
+        return compiled
+
+    def __contains__(self, group):
+        return group in _REGEX_SOURCES
+
+    def compile_all(self) -> Dict:
+        """Force compilation of every group (diagnostics and warm-up)"""
+        for group in _REGEX_SOURCES:
+            self[group]
+        return dict(self)
+
+_COMPILED_REGEXES = _LazyRegexTable()
+
+# Digest-keyed, byte-bounded caches (prompt text itself is never used as a key)
+try:
+    from bounded_cache import digest_cache, configure_caches
+except ImportError:
+    def digest_cache(name, max_bytes, ttl_seconds=None): return lru_cache(maxsize=256)
+    def configure_caches(settings): pass
+
+@digest_cache("regex_search", max_bytes=64 * 1024, ttl_seconds=600)
 def _cached_regex_search(pattern_name: str, text: str) -> bool:
     """Cached regex search for performance"""
     if pattern_name in _COMPILED_REGEXES:
@@ -207,7 +304,7 @@ def _cached_regex_search(pattern_name: str, text: str) -> bool:
         return bool(pattern.search(text))
     return False
 
-@lru_cache(maxsize=512)
+@digest_cache("string_analysis", max_bytes=4 * 1024 * 1024, ttl_seconds=300)
 def _cached_string_analysis(text: str, operation: str) -> List[str] or bool:
     """Cached string analysis operations"""
     if operation == "lower":
@@ -244,13 +341,72 @@ except ImportError:
         def start_timer(self, name): return ""
         def end_timer(self, tid, otype="general", meta=None): return 0.0
 
+try:
+    from layer_providers import FunctionLayerProvider, run_layer_providers, get_plugin_providers
+    LAYER_PROVIDERS_AVAILABLE = True
+except ImportError:
+    LAYER_PROVIDERS_AVAILABLE = False
+
+try:
+    from traffic_sketches import record_traffic
+except ImportError:
+    def record_traffic(prompt, context, config): return False
+
+try:
+    from latency_histograms import stage_timer, record_stage, set_latency_dimensions, flush_latency, pending_stages
+except ImportError:
+    from contextlib import nullcontext as stage_timer
+    def record_stage(stage, elapsed_ms): pass
+    def pending_stages(): return {}
+    def set_latency_dimensions(mode=None, prompt_chars=None): pass
+    def flush_latency(config): return False
+
+try:
+    from traffic_capture import capture_payload
+except ImportError:
+    def capture_payload(input_data, config): return False
+
+try:
+    from session_precompute import load_session_state
+except ImportError:
+    def load_session_state(input_data, config): return None
+
+try:
+    from transcript_reader import attach_transcript_history
+except ImportError:
+    def attach_transcript_history(input_data, config): return input_data
+
+try:
+    from workspace_index import resolve_references, format_resolved_references
+except ImportError:
+    def resolve_references(cwd, file_references, function_names, config=None): return {}
+    def format_resolved_references(resolved): return ""
+
+try:
+    from enhancement_store import store_enhancement
+except ImportError:
+    def store_enhancement(enhancement, learning_dir=None, meta=None, dictionary_key=None): return None
+
+try:
+    from hook_profiler import profile_call, annotate_profile
+except ImportError:
+    def profile_call(func, config, *args, tags=None, **kwargs): return func(*args, **kwargs)
+    def annotate_profile(**tags): pass
+
 # Global instances with caching
 _learning_system = None
 _template_refiner = None
 _performance_monitor = None
-_config_cache = None
-_config_cache_time = 0
-CONFIG_CACHE_TTL = 300  # 5 minutes
+USER_CONFIG_PATH = Path.home() / ".claude" / "prompt-enhancer-config.json"
+# Files the merged config depends on besides the project overlays (the zipapp embeds the defaults).
+# The hook itself and its parent (the .pyz when run as a zipapp) invalidate cached merges when the
+# hook or zipapp is upgraded, since new code may ship new defaults.
+CONFIG_SOURCES = [Path(__file__).parent.parent / "config" / "default_config.json", USER_CONFIG_PATH,
+                  Path(__file__), Path(__file__).parent]
+REFINED_TEMPLATES_DIR = Path.home() / ".claude" / "prompt-enhancer-learning" / "refined_templates"
+_session_templates: Dict[str, str] = {}  # rendered templates warmed by session_precompute.py
+_dedup_plan: Dict[str, Optional[Dict]] = {}
+_interaction_metrics: Dict[str, Any] = {}  # analysis of the current prompt, for the interaction log
 
 def get_learning_system(config: Optional[Dict] = None):
     global _learning_system
@@ -273,21 +429,17 @@ def get_performance_monitor(config: Optional[Dict] = None):
     return _performance_monitor or LearningPerformanceMonitor({})
 
 @performance_monitor(threshold_ms=100.0)
-def load_config() -> Dict:
-    """Load configuration with fallback to defaults and caching"""
-    global _config_cache, _config_cache_time
-
-    current_time = time.time()
-
-    # Return cached config if still valid
-    if (_config_cache is not None and
-        current_time - _config_cache_time < CONFIG_CACHE_TTL):
-        return _config_cache
-
+def load_config(cwd: Optional[str] = None) -> Dict:
+    """Load defaults, the user config and the project overlays from cwd up to the repo root"""
+    config = safe_execute(lambda: resolve_config(cwd, CONFIG_SOURCES, load_user_config, deep_merge),
+                          error_message="Failed to resolve config")
+    return config if config is not None else load_default_config()
+
+def load_user_config() -> Dict:
+    """Load the user configuration merged over the defaults"""
     def _load():
-        user_config_path = Path.home() / ".claude" / "prompt-enhancer-config.json"
-        if user_config_path.exists():
-            config_str = safe_file_read(user_config_path, "")
+        if USER_CONFIG_PATH.exists():
+            config_str = safe_file_read(USER_CONFIG_PATH, "")
             if config_str:
                 user_config = safe_json_load(config_str, {})
                 if user_config:
@@ -295,14 +447,15 @@ def load_config() -> Dict:
                     return deep_merge(default, user_config)
         return load_default_config()
 
-    _config_cache = safe_execute(_load, fallback_result=load_default_config(), log_errors=True)
-    _config_cache_time = current_time
-    return _config_cache
+    return safe_execute(_load, fallback_result=load_default_config(), log_errors=True)
 
 def load_default_config() -> Dict:
     """Load default configuration"""
     default_path = Path(__file__).parent.parent / "config" / "default_config.json"
     
+    if not default_path.exists() and EMBEDDED_DEFAULT_CONFIG is not None:
+        return json.loads(EMBEDDED_DEFAULT_CONFIG)
+    
     if not default_path.exists():
         return {
             "version": "2.0.0",
@@ -352,6 +505,9 @@ def deep_merge(base: Dict, override: Dict) -> Dict:
 @performance_monitor(threshold_ms=50.0)
 def load_template(name: str, config: Dict) -> str:
     """Load enrichment template from templates/"""
+    if name in _session_templates:
+        return _session_templates[name]
+    
     def _load():
         templates_dir = Path(__file__).parent.parent / "templates"
         template_path = templates_dir / f"{name}.txt"
@@ -359,7 +515,16 @@ def load_template(name: str, config: Dict) -> str:
         if not name.replace("_", "").replace(".", "").isalnum():
             raise ValueError(f"Invalid template name: {name}")
         
-        content = safe_file_read(template_path, "")
+        # Prefer templates published by the background refinement scheduler
+        content = ""
+        if config.get("learning", {}).get("adaptive_refinement_enabled", True):
+            refined_path = REFINED_TEMPLATES_DIR / f"{name}.txt"
+            if refined_path.exists():
+                content = safe_file_read(refined_path, "")
+        if not content:
+            content = EMBEDDED_TEMPLATES.get(name, "")
+        if not content:
+            content = safe_file_read(template_path, "")
         if not content:
             logger.warning(f"Template not found: {template_path}")
             return ""
@@ -373,18 +538,21 @@ def render_template(template: str, variables: Dict) -> str:
     return safe_template_render(template, variables, fallback=template or "")
 
 @performance_monitor(threshold_ms=200.0)
-def analyze_prompt_context(prompt: str, input_data: Dict) -> Dict:
-    """Extract comprehensive context from prompt"""
+def analyze_prompt_context(prompt: str, input_data: Dict, session_state: Optional[Dict] = None) -> Dict:
+    """
+    Extract comprehensive context from prompt. session_state carries history
+    analysis precomputed by session_precompute.py from non-prompt hook events.
+    """
     def _analyze():
         safe_prompt = validate_prompt(prompt)
         safe_input = validate_context(input_data)
         
-        return {
+        context = {
             "technical_keywords": safe_execute(lambda: extract_technical_keywords(safe_prompt), []),
             "file_references": safe_execute(lambda: extract_file_references(safe_prompt), []),
             "function_names": safe_execute(lambda: extract_function_names(safe_prompt), []),
-            "project_type": safe_execute(lambda: detect_project_type(safe_prompt, safe_input), "unknown"),
-            "technology_stack": safe_execute(lambda: detect_technology_stack(safe_prompt, safe_input), []),
+            "project_type": safe_execute(lambda: detect_project_type(safe_prompt, safe_input, session_state), "unknown"),
+            "technology_stack": safe_execute(lambda: detect_technology_stack(safe_prompt, safe_input, session_state), []),
             "urgency_level": safe_execute(lambda: detect_urgency_level(safe_prompt), "normal"),
             "complexity_indicators": safe_execute(lambda: detect_complexity_indicators(safe_prompt), {}),
             "conversation_patterns": safe_execute(lambda: analyze_conversation_patterns(safe_input), {}),
@@ -392,6 +560,11 @@ def analyze_prompt_context(prompt: str, input_data: Dict) -> Dict:
             "domain_specific": safe_execute(lambda: detect_domain_specific_terms(safe_prompt), []),
             "ultra_mode_triggers": safe_execute(lambda: detect_ultra_mode_triggers(safe_prompt), [])
         }
+        if session_state:
+            if not context["conversation_patterns"].get("has_history"):
+                context["conversation_patterns"] = session_state.get("conversation_patterns", context["conversation_patterns"])
+            context["history_functions"] = session_state.get("history_functions", [])
+        return context
     
     return safe_execute(_analyze, fallback_result={
         "technical_keywords": [], "file_references": [], "function_names": [],
@@ -429,8 +602,7 @@ def detect_ultra_mode_triggers(prompt: str) -> List[str]:
 def extract_technical_keywords(prompt: str) -> List[str]:
     """Extract technical keywords using pre-compiled regex"""
     keywords = set()
-    for pattern in _COMPILED_REGEXES['technical_keywords']:
-        matches = pattern.findall(prompt)
+    for matches in findall_patterns(_COMPILED_REGEXES['technical_keywords'], prompt):
         if matches:
             keywords.update(matches)
     return sorted(list(keywords))
@@ -438,8 +610,7 @@ def extract_technical_keywords(prompt: str) -> List[str]:
 def extract_file_references(prompt: str) -> List[str]:
     """Extract file paths using pre-compiled regex"""
     files = set()
-    for pattern in _COMPILED_REGEXES['file_references']:
-        matches = pattern.findall(prompt)
+    for matches in findall_patterns(_COMPILED_REGEXES['file_references'], prompt):
         if matches:
             files.update(matches)
     return sorted(list(files))
@@ -447,8 +618,7 @@ def extract_file_references(prompt: str) -> List[str]:
 def extract_function_names(prompt: str) -> List[str]:
     """Extract function/method names using pre-compiled regex"""
     functions = set()
-    for pattern in _COMPILED_REGEXES['function_extraction']:
-        matches = pattern.findall(prompt)
+    for matches in findall_patterns(_COMPILED_REGEXES['function_extraction'], prompt):
         if matches:
             for match in matches:
                 if isinstance(match, tuple):
@@ -471,59 +641,73 @@ def detect_functions_from_history(input_data: Dict) -> List[str]:
         elif 'history' in input_data:
             history = input_data['history']
 
-    # Extract from conversation history
-    for message in history:
-        if isinstance(message, dict) and 'content' in message:
-            content = str(message['content'])
-
-            # Look for function patterns using pre-compiled regex
-            for pattern in _COMPILED_REGEXES['history_functions']:
-                matches = pattern.findall(content)
-                for match in matches:
-                    if isinstance(match, tuple):
-                        func_name = match[-1] if len(match) > 1 else match[0]
-                    else:
-                        func_name = match
-
-                    if func_name and len(func_name) > 1:
-                        # Filter out common false positives
-                        false_positives = {
-                            'if', 'for', 'while', 'def', 'class', 'interface', 'function', 'func',
-                            'implement', 'create', 'write', 'add', 'get', 'set', 'new', 'old',
-                            'use', 'used', 'need', 'needs', 'make', 'made', 'take', 'took',
-                            'first', 'second', 'third', 'next', 'previous', 'last', 'final'
-                        }
-                        if func_name.lower() not in false_positives:
-                            functions.add(func_name)
+    # Extract from conversation history, scanning all messages in one (possibly parallel) batch
+    contents = [str(message['content']) for message in history
+                if isinstance(message, dict) and 'content' in message]
+    for per_pattern in findall_many(_COMPILED_REGEXES['history_functions'], contents):
+        for matches in per_pattern:
+            for match in matches:
+                if isinstance(match, tuple):
+                    func_name = match[-1] if len(match) > 1 else match[0]
+                else:
+                    func_name = match
+
+                if func_name and len(func_name) > 1:
+                    # Filter out common false positives
+                    false_positives = {
+                        'if', 'for', 'while', 'def', 'class', 'interface', 'function', 'func',
+                        'implement', 'create', 'write', 'add', 'get', 'set', 'new', 'old',
+                        'use', 'used', 'need', 'needs', 'make', 'made', 'take', 'took',
+                        'first', 'second', 'third', 'next', 'previous', 'last', 'final'
+                    }
+                    if func_name.lower() not in false_positives:
+                        functions.add(func_name)
 
     return sorted([f for f in functions if f and len(f) > 1])
 
-def detect_project_type(prompt: str, input_data: Dict) -> str:
-    """Detect project type"""
-    indicators = {
-        "web_app": ["web", "frontend", "backend", "api", "react", "vue"],
-        "mobile_app": ["mobile", "ios", "android", "flutter"],
-        "cli_tool": ["cli", "command line", "terminal"],
-        "library": ["library", "package", "module", "sdk"],
-        "data_science": ["data", "ml", "analysis", "pandas"]
-    }
-    
-    combined = (prompt + " " + " ".join([m.get("content", "") for m in input_data.get("conversationHistory", [])])).lower()
-    scores = {pt: sum(1 for ind in inds if ind in combined) for pt, inds in indicators.items()}
+PROJECT_TYPE_INDICATORS = {
+    "web_app": ["web", "frontend", "backend", "api", "react", "vue"],
+    "mobile_app": ["mobile", "ios", "android", "flutter"],
+    "cli_tool": ["cli", "command line", "terminal"],
+    "library": ["library", "package", "module", "sdk"],
+    "data_science": ["data", "ml", "analysis", "pandas"]
+}
+
+TECHNOLOGY_STACK_INDICATORS = {
+    "Python": ["python", "django", "flask", "fastapi"],
+    "JavaScript": ["javascript", "node.js", "react", "vue"],
+    "TypeScript": ["typescript", "ts", "tsx"],
+    "Docker": ["docker", "container"],
+    "Kubernetes": ["kubernetes", "k8s"]
+}
+
+def _history_text(input_data: Dict) -> str:
+    return " ".join([m.get("content", "") for m in input_data.get("conversationHistory", [])])
+
+def project_type_hits(text: str) -> Dict[str, List[str]]:
+    """Project type indicators present in text"""
+    text = text.lower()
+    return {pt: [ind for ind in inds if ind in text] for pt, inds in PROJECT_TYPE_INDICATORS.items()}
+
+def technology_stack_hits(text: str) -> List[str]:
+    """Technologies with at least one indicator present in text"""
+    text = text.lower()
+    return [tech for tech, inds in TECHNOLOGY_STACK_INDICATORS.items() if any(ind in text for ind in inds)]
+
+def detect_project_type(prompt: str, input_data: Dict, session_state: Optional[Dict] = None) -> str:
+    """Detect project type (history indicators may come precomputed in session_state)"""
+    hits = project_type_hits(prompt + " " + _history_text(input_data))
+    for pt, session_hits in (session_state or {}).get("project_type_hits", {}).items():
+        if pt in hits:
+            hits[pt] = list(set(hits[pt]) | set(session_hits))
+    scores = {pt: len(found) for pt, found in hits.items()}
     return max(scores, key=scores.get) if scores else "general"
 
-def detect_technology_stack(prompt: str, input_data: Dict) -> List[str]:
-    """Detect technology stack"""
-    indicators = {
-        "Python": ["python", "django", "flask", "fastapi"],
-        "JavaScript": ["javascript", "node.js", "react", "vue"],
-        "TypeScript": ["typescript", "ts", "tsx"],
-        "Docker": ["docker", "container"],
-        "Kubernetes": ["kubernetes", "k8s"]
-    }
-    
-    combined = (prompt + " " + " ".join([m.get("content", "") for m in input_data.get("conversationHistory", [])])).lower()
-    return [tech for tech, inds in indicators.items() if any(ind in combined for ind in inds)]
+def detect_technology_stack(prompt: str, input_data: Dict, session_state: Optional[Dict] = None) -> List[str]:
+    """Detect technology stack (history technologies may come precomputed in session_state)"""
+    found = set(technology_stack_hits(prompt + " " + _history_text(input_data)))
+    found.update((session_state or {}).get("technology_stack", []))
+    return [tech for tech in TECHNOLOGY_STACK_INDICATORS if tech in found]
 
 def detect_urgency_level(prompt: str) -> str:
     """Detect urgency level using pre-compiled regex with caching"""
@@ -538,26 +722,9 @@ def detect_urgency_level(prompt: str) -> str:
 
 def detect_complexity_indicators(prompt: str) -> Dict:
     """Detect complexity indicators"""
-    patterns = {
-        "extreme": [
-            r'\b(architecture|system design|distributed|microservices|orchestrate|multi-agent)\b',
-            r'\b(complex workflow|advanced|sophisticated|intricate)\b'
-        ],
-        "high": [
-            r'\b(integration|refactor|optimize|performance|scalability)\b',
-            r'\b(multiple|several|various|complex)\b'
-        ],
-        "medium": [
-            r'\b(add|create|implement|build|modify)\b'
-        ],
-        "low": [
-            r'\b(fix|debug|simple|basic|quick)\b'
-        ]
-    }
-    
     prompt_lower = prompt.lower()
-    indicators = {level: sum(len(re.findall(p, prompt_lower)) for p in pats) 
-                  for level, pats in patterns.items()}
+    indicators = {level: sum(len(p.findall(prompt_lower)) for p in pats)
+                  for level, pats in _COMPILED_REGEXES['complexity'].items()}
     
     # Determine level (extreme > high > medium > low)
     if indicators["extreme"] > 0:
@@ -605,6 +772,75 @@ def detect_domain_specific_terms(prompt: str) -> List[str]:
                 break
     return detected_domains
 
+# Default per-layer relevance rules (overridable via enrichment.routing.rules)
+_DEFAULT_ROUTING_RULES = {
+    "design_guidance": {
+        "base": 0.1,
+        "complexity": {"low": 0.0, "medium": 0.3, "high": 0.5, "extreme": 0.6},
+        "project_types": {"web_app": 0.1, "mobile_app": 0.1},
+        "file_references": 0.0,
+        "word_count": {"weight": 0.3, "full_at": 40}
+    },
+    "excellence_criteria": {
+        "base": 0.5,
+        "complexity": {"low": 0.0, "medium": 0.1, "high": 0.2, "extreme": 0.3},
+        "word_count": {"weight": 0.2, "full_at": 40}
+    },
+    "tool_preferences": {
+        "base": 0.2,
+        "complexity": {"low": 0.0, "medium": 0.2, "high": 0.3, "extreme": 0.4},
+        "file_references": 0.1,
+        "word_count": {"weight": 0.3, "full_at": 40}
+    },
+    "workspace_methodology": {
+        "base": 0.1,
+        "complexity": {"low": 0.0, "medium": 0.3, "high": 0.5, "extreme": 0.6},
+        "file_references": 0.1,
+        "word_count": {"weight": 0.2, "full_at": 40}
+    }
+}
+
+def route_enrichment_layers(context: Dict, config: Dict, use_ultra: bool = False) -> Dict[str, Dict]:
+    """
+    Score each template layer's relevance from the analysed context signals
+    
+    Returns {layer: {"score", "include", "reason"}}. Layers without a rule, and all
+    layers in ultra mode or with routing disabled, are always included.
+    """
+    routing_config = config.get("enrichment", {}).get("routing", {})
+    rules = deep_merge(_DEFAULT_ROUTING_RULES, routing_config.get("rules", {}))
+    threshold = routing_config.get("threshold", 0.5)
+    
+    complexity = context.get("complexity_indicators", {}).get("level", "medium")
+    file_count = len(context.get("file_references", []))
+    project_type = context.get("project_type", "unknown")
+    word_count = context.get("context_clues", {}).get("word_count", 0)
+    signals = f"complexity={complexity}, files={file_count}, project={project_type}, words={word_count}"
+    
+    decisions = {}
+    for layer, rule in rules.items():
+        if not routing_config.get("enabled", True) or use_ultra:
+            decisions[layer] = {"score": 1.0, "include": True,
+                                "reason": "ultra mode" if use_ultra else "routing disabled"}
+            continue
+        
+        word_rule = rule.get("word_count", {})
+        score = (rule.get("base", 0.0)
+                 + rule.get("complexity", {}).get(complexity, 0.0)
+                 + rule.get("project_types", {}).get(project_type, 0.0)
+                 + rule.get("file_references", 0.0) * min(file_count, 3)
+                 + word_rule.get("weight", 0.0) * min(word_count / max(word_rule.get("full_at", 40), 1), 1.0))
+        score = round(min(max(score, 0.0), 1.0), 3)
+        layer_threshold = rule.get("threshold", threshold)
+        include = score >= layer_threshold
+        decisions[layer] = {
+            "score": score,
+            "include": include,
+            "reason": f"score {score:.2f} {'>=' if include else '<'} {layer_threshold:.2f} ({signals})"
+        }
+    
+    return decisions
+
 def should_use_ultra_mode(context: Dict, config: Dict) -> bool:
     """Determine if ultra/expert template should be used"""
     ultra_config = config.get("enrichment", {}).get("ultra_mode", {})
@@ -819,6 +1055,40 @@ For critical code paths:
 - Refine and re-output
 """
 
+def _build_learning_insights(prompt: str, context: Dict, config: Dict) -> str:
+    """Pattern and success-metric insights from the integration manager"""
+    from integration_manager import integration_manager
+    return integration_manager.enhance_with_learning("", prompt, config).strip()
+
+def get_enrichment_providers(use_ultra: bool, task_type: str, config: Dict,
+                             routing: Optional[Dict[str, Dict]] = None) -> List[Tuple[str, Callable]]:
+    """
+    Ordered (name, build(prompt, context, config)) pairs for the enabled layers
+    that the relevance routing (if given) decided to include
+    """
+    providers = []
+    
+    # ULTRA MODE: Add ToT + Reflection + Uncertainty + ReAct
+    if use_ultra:
+        providers.append(("tot_reflection", lambda p, ctx, cfg: build_tot_reflection_block(cfg, task_type)))
+        providers.append(("output_format", lambda p, ctx, cfg: build_output_format_block(task_type)))
+        providers.append(("uncertainty_handling", lambda p, ctx, cfg: build_uncertainty_handling_block()))
+        providers.append(("orchestrator_react", lambda p, ctx, cfg: build_orchestrator_react_block()))
+    
+    # Standard enrichment layers
+    enrichment_config = config.get("enrichment", {}).get("layers", {})
+    
+    routing = routing or {}
+    
+    for name in ("design_guidance", "excellence_criteria", "tool_preferences", "workspace_methodology"):
+        if enrichment_config.get(name, True) and routing.get(name, {}).get("include", True):
+            providers.append((name, lambda p, ctx, cfg, name=name: load_template(name, cfg)))
+    
+    if enrichment_config.get("learning_insights", False):
+        providers.append(("learning_insights", _build_learning_insights))
+    
+    return providers
+
 def build_enrichment_layers(prompt: str, context: Dict, config: Dict) -> str:
     """
     Main enrichment orchestrator with ultra mode support
@@ -836,33 +1106,46 @@ def build_enrichment_layers(prompt: str, context: Dict, config: Dict) -> str:
         
         logger.info(f"Enrichment mode: {'ULTRA' if use_ultra else 'STANDARD'} | Complexity: {complexity}")
         
-        layers = []
-        
-        # ULTRA MODE: Add ToT + Reflection + Uncertainty + ReAct
-        if use_ultra:
-            layers.append(build_tot_reflection_block(config, task_type))
-            layers.append(build_output_format_block(task_type))
-            layers.append(build_uncertainty_handling_block())
-            layers.append(build_orchestrator_react_block())
-        
-        # Standard enrichment layers
-        enrichment_config = config.get("enrichment", {}).get("layers", {})
-        
-        if enrichment_config.get("design_guidance", True):
-            design = load_template("design_guidance", config)
-            if design: layers.append(design)
+        # Relevance routing: skip template layers that do not fit this prompt
+        routing = route_enrichment_layers(context, config, use_ultra)
+        context["layer_routing"] = routing
+        skipped = {name: d["reason"] for name, d in routing.items() if not d["include"]}
+        if skipped:
+            logger.info(f"Layers skipped by routing: {skipped}")
         
-        if enrichment_config.get("excellence_criteria", True):
-            excellence = load_template("excellence_criteria", config)
-            if excellence: layers.append(excellence)
-        
-        if enrichment_config.get("tool_preferences", True):
-            tools = load_template("tool_preferences", config)
-            if tools: layers.append(tools)
+        providers = get_enrichment_providers(use_ultra, task_type, config, routing)
+        parallel_config = config.get("enrichment", {}).get("parallel", {})
+
+        if LAYER_PROVIDERS_AVAILABLE:
+            # Built-in layers are required (no deadline); learning insights and plugins are not
+            results = run_layer_providers(
+                [FunctionLayerProvider(name, func, required=name != "learning_insights")
+                 for name, func in providers] + get_plugin_providers(),
+                prompt, context, config,
+                parallel=parallel_config.get("enabled", True),
+                max_workers=parallel_config.get("max_workers", 8),
+                default_deadline_ms=parallel_config.get("default_deadline_ms", 150.0),
+                deadlines_ms=parallel_config.get("deadlines_ms", {})
+            )
+            layers = [r.content for r in results if r.status == "ok"]
+            context["layers_emitted"] = [r.name for r in results if r.status == "ok"]
+            for r in results:
+                record_stage(f"layer.{r.name}", r.elapsed_ms)
+            dropped = {r.name: r.reason for r in results if r.status in ("timeout", "error")}
+            context["enrichment_report"] = {"layers": [r.to_dict() for r in results], "dropped": dropped}
+            for name, reason in dropped.items():
+                logger.warning(f"Enrichment layer dropped: {name} ({reason})")
+                # Counted in the latency histograms, so drops show up in latency_histograms.py
+                record_stage(f"layer_dropped.{name}", 0.0)
+        else:
+            built = [(name, func(prompt, context, config)) for name, func in providers]
+            layers = [content for _, content in built if content]
+            context["layers_emitted"] = [name for name, content in built if content]
         
-        if enrichment_config.get("workspace_methodology", True):
-            workspace = load_template("workspace_methodology", config)
-            if workspace: layers.append(workspace)
+        # Keep only the first copy of guidance repeated across layers
+        if config.get("enrichment", {}).get("dedup", {}).get("enabled", False):
+            seen = context.setdefault("directive_clusters", set())
+            layers = [content for content in dedup_layers(get_dedup_plan(), list(zip(context["layers_emitted"], layers)), seen) if content]
         
         if not layers:
             return ""
@@ -891,9 +1174,9 @@ def escape_prompt(prompt: str) -> str:
     
     return escaped
 
-def should_bypass(prompt: str) -> Tuple[bool, Optional[str]]:
+def should_bypass(prompt: str, config: Optional[Dict] = None) -> Tuple[bool, Optional[str]]:
     """Check bypass conditions"""
-    config = load_config()
+    config = config if config is not None else load_config()
     bypass_prefixes = config.get("bypass", {}).get("prefixes", ["*", "/", "#"])
     
     for prefix in bypass_prefixes:
@@ -902,6 +1185,49 @@ def should_bypass(prompt: str) -> Tuple[bool, Optional[str]]:
     
     return False, None
 
+def get_dedup_plan() -> Optional[Dict]:
+    """Load the directive dedup plan once per process (learning dir, then install, then embedded)"""
+    if "plan" not in _dedup_plan:
+        _dedup_plan["plan"] = load_plan([
+            REFINED_TEMPLATES_DIR.parent / "dedup_plan.json",
+            Path(__file__).parent.parent / "config" / "dedup_plan.json",
+            Path(__file__).parent / "config" / "dedup_plan.json",
+        ], embedded=EMBEDDED_DEDUP_PLAN)
+    return _dedup_plan["plan"]
+
+
+def build_execution_protocol(use_ultra: bool) -> str:
+    """
+    Closing execution protocol of the evaluation wrapper
+    """
+    return f"""═══════════════════════════════════════════════════════════════════
+EXECUTION PROTOCOL
+═══════════════════════════════════════════════════════════════════
+
+**Primary Directive:**
+Execute the user's request with maximum quality, leveraging the enrichment guidance above.
+
+**Research Phase (if needed):**
+1. Check conversation history FIRST
+2. Use available tools (codebase search, web search, documentation)
+3. Gather context before asking questions
+
+**Clarification Phase (only if critical ambiguity exists):**
+After research, if still unclear: Ask max 1-3 specific questions with concrete options
+
+**Implementation Phase:**
+{'- Follow ToT protocol: Generate 2-3 approaches, evaluate, select best' if use_ultra else '- Implement the solution'}
+{'- Use ReAct format for multi-step tasks' if use_ultra else ''}
+{'- Perform mandatory self-critique before finalizing' if use_ultra else ''}
+
+**Quality Gate:**
+{'- All self-assessment scores must be ≥9' if use_ultra else '- Verify solution meets requirements'}
+{'- Assumptions explicitly documented' if use_ultra else ''}
+{'- Plan B provided for uncertainties' if use_ultra else ''}
+
+BEGIN EXECUTION NOW.
+"""
+
 def build_base_evaluation(prompt: str, escaped_prompt: str, config: Dict, input_data: Dict) -> str:
     """
     Build enhanced prompt with ToT + Reflection + Ultra mode routing
@@ -915,16 +1241,45 @@ def build_base_evaluation(prompt: str, escaped_prompt: str, config: Dict, input_
         
         timer = perf_monitor.start_timer("prompt_enhancement")
         
+        # Merge in history analysis precomputed between prompts, if any
+        session_state = safe_execute(lambda: load_session_state(input_data, config),
+                                     error_message="Failed to load session state")
+        if session_state:
+            _session_templates.update(session_state.get("templates", {}))
+        else:
+            # Otherwise read only the recent tail of the session transcript
+            input_data = safe_execute(lambda: attach_transcript_history(input_data, config),
+                                      fallback_result=input_data,
+                                      error_message="Failed to read transcript history")
+        
         # Context analysis
-        context = analyze_prompt_context(prompt, input_data)
+        with stage_timer("context_analysis"):
+            context = analyze_prompt_context(prompt, input_data, session_state)
         use_ultra = should_use_ultra_mode(context, config)
+        annotate_profile(mode="ultra" if use_ultra else "standard")
+        set_latency_dimensions(mode="ultra" if use_ultra else "standard")
         
         logger.info(f"Context analyzed | Ultra mode: {use_ultra} | Complexity: {context.get('complexity_indicators', {}).get('level')}")
         
+        # Ground extracted file references and function names in the workspace index
+        with stage_timer("workspace_index"):
+            resolved = safe_execute(
+                lambda: resolve_references(input_data.get("cwd"), context.get("file_references", []),
+                                           context.get("function_names", []), config),
+                fallback_result={}, error_message="Failed to resolve workspace references"
+            )
+        context["resolved_references"] = resolved
+        workspace_line = f"\n- Workspace Matches: {format_resolved_references(resolved)}" if resolved else ""
+        
         # Build enrichment layers (includes ToT + Reflection if ultra mode)
-        enrichment = build_enrichment_layers(prompt, context, config)
+        with stage_timer("enrichment_layers"):
+            enrichment = build_enrichment_layers(prompt, context, config)
         
         # Build evaluation wrapper
+        execution_protocol = build_execution_protocol(use_ultra)
+        if "directive_clusters" in context:
+            execution_protocol = dedup_layers(get_dedup_plan(), [("execution_protocol", execution_protocol)],
+                                              context["directive_clusters"])[0]
         wrapper = f"""
 ═══════════════════════════════════════════════════════════════════
 PROMPT EVALUATION & STRATEGIC ENRICHMENT
@@ -938,7 +1293,7 @@ PROMPT EVALUATION & STRATEGIC ENRICHMENT
 - Complexity: {context.get('complexity_indicators', {}).get('level', 'unknown')}
 - Project Type: {context.get('project_type', 'unknown')}
 - Technology: {', '.join(context.get('technology_stack', [])[:3])}
-- Ultra Mode Triggers: {', '.join(context.get('ultra_mode_triggers', [])) if use_ultra else 'None'}
+- Ultra Mode Triggers: {', '.join(context.get('ultra_mode_triggers', [])) if use_ultra else 'None'}{workspace_line}
 
 ═══════════════════════════════════════════════════════════════════
 STRATEGIC ENRICHMENT
@@ -946,51 +1301,60 @@ STRATEGIC ENRICHMENT
 
 {enrichment}
 
-═══════════════════════════════════════════════════════════════════
-EXECUTION PROTOCOL
-═══════════════════════════════════════════════════════════════════
-
-**Primary Directive:**
-Execute the user's request with maximum quality, leveraging the enrichment guidance above.
-
-**Research Phase (if needed):**
-1. Check conversation history FIRST
-2. Use available tools (codebase search, web search, documentation)
-3. Gather context before asking questions
-
-**Clarification Phase (only if critical ambiguity exists):**
-After research, if still unclear: Ask max 1-3 specific questions with concrete options
-
-**Implementation Phase:**
-{'- Follow ToT protocol: Generate 2-3 approaches, evaluate, select best' if use_ultra else '- Implement the solution'}
-{'- Use ReAct format for multi-step tasks' if use_ultra else ''}
-{'- Perform mandatory self-critique before finalizing' if use_ultra else ''}
-
-**Quality Gate:**
-{'- All self-assessment scores must be ≥9' if use_ultra else '- Verify solution meets requirements'}
-{'- Assumptions explicitly documented' if use_ultra else ''}
-{'- Plan B provided for uncertainties' if use_ultra else ''}
-
-BEGIN EXECUTION NOW.
-"""
+{execution_protocol}"""
         
         exec_time = (time.time() - start_time) * 1000
         logger.info(f"Enhancement complete in {exec_time:.2f}ms")
         
         perf_monitor.end_timer(timer, "prompt_enhancement")
         
-        # Record in learning system
-        safe_execute(
-            lambda: learning_system.record_prompt_enhancement(
-                original_prompt=prompt,
-                enhanced_prompt=wrapper,
-                context_analysis=context,
-                applied_enrichments=["ultra_mode"] if use_ultra else ["standard"],
-                execution_time_ms=exec_time,
-                success_indicators={"ultra_mode": use_ultra, "enrichment_length": len(enrichment)}
-            ),
-            error_message="Failed to record enhancement"
-        )
+        _interaction_metrics.pop("enhancement_ref", None)
+        _interaction_metrics.update({
+            "complexity": context.get("complexity_indicators", {}).get("level", "unknown"),
+            "ultra_mode": use_ultra,
+            "project_type": context.get("project_type", "unknown"),
+            "urgency_level": context.get("urgency_level", "normal"),
+            "technology_stack": context.get("technology_stack", [])[:10],
+            "ultra_mode_triggers": context.get("ultra_mode_triggers", []),
+            "word_count": len(prompt.split()),
+            "file_references": len(context.get("file_references", [])),
+            "function_names": len(context.get("function_names", [])),
+            "workspace_matches": len(resolved or {}),
+            "has_history": bool(context.get("conversation_patterns", {}).get("has_history")),
+            "layers": context.get("layers_emitted", []),
+        })
+        
+        # Feed bounded-memory traffic analytics
+        with stage_timer("traffic_sketches"):
+            safe_execute(
+                lambda: record_traffic(prompt, context, config),
+                error_message="Failed to update traffic sketches"
+            )
+        
+        # Sample this invocation's learning records; written ones carry their 1/p weight
+        weight = safe_execute(lambda: sample_weight(_interaction_metrics, config), fallback_result=1.0,
+                              error_message="Failed to sample learning records")
+        _interaction_metrics["sample_weight"] = weight
+        
+        # Record in learning system (a reference instead of the text when the store has it)
+        if weight is not None:
+            with stage_timer("learning_record"):
+                enhancement_ref = None
+                if LEARNING_AVAILABLE and getattr(learning_system, "enabled", True):
+                    enhancement_ref = safe_execute(lambda: store_output(wrapper, config),
+                                                   error_message="Failed to store enhancement")
+                safe_execute(
+                    lambda: learning_system.record_prompt_enhancement(
+                        original_prompt=prompt,
+                        enhanced_prompt=f"enhancement_store:{enhancement_ref}" if enhancement_ref else wrapper,
+                        context_analysis=context,
+                        applied_enrichments=["ultra_mode"] if use_ultra else ["standard"],
+                        execution_time_ms=exec_time,
+                        success_indicators={"ultra_mode": use_ultra, "enrichment_length": len(enrichment),
+                                            "sample_weight": weight}
+                    ),
+                    error_message="Failed to record enhancement"
+                )
         
         return wrapper
         
@@ -1007,9 +1371,49 @@ Apply best practices and proceed with implementation.
 ## Context
 This is an enhanced prompt that failed to process through the full enhancement pipeline. Please continue with the original request using standard best practices."""
 
+def template_version() -> str:
+    """Fingerprint of the hook and its templates; changes on upgrade and when refined templates are published"""
+    import hashlib
+    # Path(__file__).parent is the archive when running from the zipapp
+    paths = ([Path(__file__), Path(__file__).parent]
+             + sorted((Path(__file__).parent.parent / "templates").glob("*.txt"))
+             + sorted(REFINED_TEMPLATES_DIR.glob("*.txt")))
+    digest = hashlib.blake2b(digest_size=6)
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        digest.update(f"{path}:{st.st_mtime_ns}:{st.st_size};".encode("utf-8"))
+    return digest.hexdigest()
+
+def store_output(enhanced: str, config: Dict) -> Optional[str]:
+    """Store this invocation's output in the enhancement store once; returns its record id"""
+    if "enhancement_ref" not in _interaction_metrics:
+        ref = None
+        if config.get("learning", {}).get("enhancement_store", {}).get("enabled", True):
+            # One dictionary per template version, so refined templates compress well too
+            ref = store_enhancement(enhanced, dictionary_key=template_version())
+        _interaction_metrics["enhancement_ref"] = ref
+    return _interaction_metrics["enhancement_ref"]
+
+def record_interaction(prompt: str, enhanced: str, config: Dict) -> bool:
+    """Append this invocation's analysis and stage latencies to the interaction log"""
+    if not config.get("learning", {}).get("interaction_log", {}).get("enabled", False):
+        return False
+    if _interaction_metrics.get("sample_weight", 1.0) is None:
+        return False
+    from integration_manager import integration_manager
+    store_output(enhanced, config)
+    metrics = dict(_interaction_metrics,
+                   stage_ms={stage: round(ms, 3) for stage, ms in pending_stages().items()})
+    integration_manager.record_interaction(prompt, enhanced, metrics=metrics, config=config)
+    return True
+
 @performance_monitor(threshold_ms=500.0)
 def main():
     """Main entry point"""
+    _configure_logging()
     try:
         # Read input
         input_data = safe_json_load(sys.stdin.read(), {})
@@ -1019,20 +1423,42 @@ def main():
             print("")
             sys.exit(0)
         
-        # Check bypass
-        should_skip, clean_prompt = should_bypass(prompt)
+        # Load config (with the project's overlays) and check bypass
+        config = load_config(input_data.get("cwd"))
+        should_skip, clean_prompt = should_bypass(prompt, config)
         if should_skip:
             print(clean_prompt)
             sys.exit(0)
         
-        # Escape and load config
+        safe_execute(lambda: capture_payload(input_data, config), error_message="Failed to capture payload")
+        
+        # Trivial follow-ups skip analysis, the learning system and the interaction log
+        fast_rule = classify_trivial(prompt, config)
+        if fast_rule:
+            set_latency_dimensions(mode="fast_path", prompt_chars=len(prompt))
+            with stage_timer("total"), stage_timer(f"fast_path.{fast_rule}"):
+                print(fast_path_output(config))
+            safe_execute(lambda: flush_latency(config), error_message="Failed to update latency histograms")
+            return True
+        
+        # Escape the prompt
         escaped_prompt = escape_prompt(prompt)
-        config = load_config()
+        configure_caches(config.get("performance", {}).get("caches", {}))
+        if configure_matchers(config.get("performance", {}).get("matcher", {})):
+            _COMPILED_REGEXES.clear()
+        configure_parallel_extraction(config.get("performance", {}).get("parallel_extraction", {}))
         
-        # Build enhanced prompt
-        enhanced = build_base_evaluation(prompt, escaped_prompt, config, input_data)
+        # Build enhanced prompt (profiled when profiling mode samples this call)
+        set_latency_dimensions(prompt_chars=len(prompt))
+        with stage_timer("total"):
+            enhanced = profile_call(
+                build_base_evaluation, config, prompt, escaped_prompt, config, input_data,
+                tags={"prompt_chars": len(prompt)}
+            )
         
         print(enhanced)
+        safe_execute(lambda: record_interaction(prompt, enhanced, config), error_message="Failed to record interaction")
+        safe_execute(lambda: flush_latency(config), error_message="Failed to update latency histograms")
         return True
         
     except KeyboardInterrupt:
@@ -1,11 +1,13 @@
 #!/bin/bash
-# Optimized wrapper for Claude Code prompt enhancement hook
-# Ensures correct environment and execution context
+# Launcher for the Claude Code prompt enhancement hook
+# Runs the packaged zipapp built by build_zipapp.py: its shebang pins the
+# interpreter and passes -I -S, so no uv resolution or site-packages scan.
 
-cd ~/Documents/claude-code-prompt-improver/claude-prompt-enhancer || {
-    echo "Error: Project directory not found" >&2
-    exit 1
-}
+HOOK_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
-# Use uv for fast, reliable Python execution
-exec uv run --quiet python -m scripts.enhance_prompt "$@"
+if [ -x "$HOOK_DIR/enhance_prompt.pyz" ]; then
+    exec "$HOOK_DIR/enhance_prompt.pyz" "$@"
+fi
+
+# No zipapp built: run the source hook without site-packages
+exec python3 -E -s -S "$HOOK_DIR/enhance_prompt.py" "$@"
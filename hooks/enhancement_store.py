@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Deduplicated, compressed storage of enhanced prompt outputs
+
+An enhanced prompt is mostly the same wrapper and template text every time.
+EnhancementStore splits each output into sections at the ═══ separator lines
+and stores every section once, as a content-addressed blob in an append-only
+pack. Each blob is compressed against a shared dictionary. A record is then
+a small JSON line listing blob references, with short sections inlined. The
+original output can be rebuilt exactly, and each record carries a digest so
+verify can prove that.
+
+Layout under <learning_dir>/enhancements/:
+    dict-<id>.bin   compression dictionary, trained on the first output stored under
+                    its id (the caller's template version, so refined templates get
+                    a new one); blobs are keyed by dictionary and content
+    blobs.pack      [codec:1][length:4][compressed bytes]... per unique section
+    blobs.idx       [digest:16][offset:8][length:4] per blob, in append order
+    blobs.sorted    [magic:8][covered:8] + the first `covered` bytes of blobs.idx
+                    as entries sorted by digest
+    records.jsonl   one record per stored output
+
+A blob lookup is a binary search of blobs.sorted (memory-mapped) plus a scan of
+the blobs.idx tail it does not cover yet, so storing an output never re-reads
+the whole index. Once the tail reaches COMPACT_TAIL_ENTRIES it is merged into
+a new blobs.sorted. A torn entry at the end of blobs.idx (a writer that died
+mid-append) is truncated before the next append.
+
+prune() drops records older than learning.cleanup_old_data_days and rewrites the
+pack and index with only the blobs the remaining records reference; the
+refinement scheduler runs it with its daily cleanup.
+
+Usage:
+    python3 enhancement_store.py stats
+    python3 enhancement_store.py show <record-id>
+    python3 enhancement_store.py verify
+    python3 enhancement_store.py prune [--days 30]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from file_utils import atomic_write_bytes, locked
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEARNING_DIR = Path.home() / ".claude" / "prompt-enhancer-learning"
+MIN_BLOB_CHARS = 64
+MAX_DICT_BYTES = 64 * 1024
+COMPACT_TAIL_ENTRIES = 1024
+
+# Section boundaries: lines made of box-drawing rules (kept with the following section)
+_SECTION_BOUNDARY = re.compile(r"(?m)^(?=═{10,}$)")
+
+_CODEC_ZLIB = 1
+_CODEC_ZSTD = 2
+_BLOB_HEADER = struct.Struct("<BI")
+_INDEX_ENTRY = struct.Struct("<16sQI")
+_SORTED_HEADER = struct.Struct("<8sQ")
+_SORTED_MAGIC = b"EPSORT01"
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def split_sections(text: str) -> List[str]:
+    """Lossless split of an enhanced prompt into sections ("".join() restores it)"""
+    return [section for section in _SECTION_BOUNDARY.split(text) if section]
+
+
+class EnhancementStore:
+    """Content-addressed section blobs plus per-output reference records"""
+
+    def __init__(self, learning_dir: Path = DEFAULT_LEARNING_DIR, codec: str = "auto"):
+        self.root = Path(learning_dir) / "enhancements"
+        self.pack_file = self.root / "blobs.pack"
+        self.index_file = self.root / "blobs.idx"
+        self.sorted_file = self.root / "blobs.sorted"
+        self.records_file = self.root / "records.jsonl"
+        self.codec = _CODEC_ZSTD if codec in ("auto", "zstd") and ZSTD_AVAILABLE else _CODEC_ZLIB
+        # blobs.sorted mapping (entries only), its identity and the blobs.idx bytes it covers
+        self._sorted: Optional[mmap.mmap] = None
+        self._sorted_stamp: Optional[tuple] = None
+        self._covered = 0
+        # blobs.idx entries past the covered prefix, and how far blobs.idx has been read
+        self._tail: Dict[bytes, tuple] = {}
+        self._tail_end = 0
+        self._dictionaries: Dict[str, bytes] = {}
+
+    # Dictionary -----------------------------------------------------------
+
+    def _current_dictionary_id(self) -> Optional[str]:
+        """The most recently trained dictionary"""
+        candidates = sorted(self.root.glob("dict-*.bin"), key=lambda p: p.stat().st_mtime)
+        return candidates[-1].stem[len("dict-"):] if candidates else None
+
+    def _dictionary(self, dict_id: Optional[str]) -> bytes:
+        if not dict_id:
+            return b""
+        if dict_id not in self._dictionaries:
+            self._dictionaries[dict_id] = (self.root / f"dict-{dict_id}.bin").read_bytes()
+        return self._dictionaries[dict_id]
+
+    def _train_dictionary(self, sample: str, dict_id: Optional[str] = None) -> str:
+        """Use a stored output as the dictionary (most common text last)"""
+        raw = sample.encode("utf-8")[-MAX_DICT_BYTES:]
+        dict_id = dict_id or _digest(raw).hex()[:12]
+        path = self.root / f"dict-{dict_id}.bin"
+        if not path.exists():
+            atomic_write_bytes(path, raw)
+        return dict_id
+
+    # Blobs ----------------------------------------------------------------
+
+    def _read_index(self, start: int = 0) -> Tuple[Dict[bytes, tuple], int]:
+        """Whole blobs.idx entries from byte start on, and where they end"""
+        try:
+            with open(self.index_file, "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return {}, 0
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        entries = {digest: (offset, length)
+                   for digest, offset, length in _INDEX_ENTRY.iter_unpack(data[:usable])}
+        return entries, start + usable
+
+    def _map_sorted(self):
+        """(Re)map blobs.sorted if it was replaced since it was last mapped"""
+        try:
+            st = os.stat(self.sorted_file)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._sorted_stamp:
+            return
+        self._close_sorted()
+        self._sorted_stamp, self._covered, self._tail, self._tail_end = stamp, 0, {}, 0
+        if stamp is None:
+            return
+        with open(self.sorted_file, "rb") as f:
+            header = f.read(_SORTED_HEADER.size)
+            if len(header) < _SORTED_HEADER.size or _SORTED_HEADER.unpack(header)[0] != _SORTED_MAGIC:
+                logger.warning(f"Ignoring unrecognized {self.sorted_file}")
+                return
+            self._covered = _SORTED_HEADER.unpack(header)[1]
+            self._tail_end = self._covered
+            if stamp[2] > _SORTED_HEADER.size:
+                self._sorted = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_sorted(self):
+        if self._sorted is not None:
+            self._sorted.close()
+            self._sorted = None
+
+    def _refresh_index(self):
+        """Pick up blobs.idx entries appended since the last refresh (and a new blobs.sorted)"""
+        self._map_sorted()
+        try:
+            size = os.stat(self.index_file).st_size
+        except FileNotFoundError:
+            size = 0
+        if size < self._tail_end:
+            # blobs.idx was rewritten without a matching blobs.sorted: ignore it until replaced
+            self._close_sorted()
+            self._covered, self._tail, self._tail_end = 0, {}, 0
+        if size > self._tail_end:
+            entries, self._tail_end = self._read_index(self._tail_end)
+            self._tail.update(entries)
+
+    def _sorted_lookup(self, digest: bytes) -> Optional[tuple]:
+        if self._sorted is None:
+            return None
+        base, size = _SORTED_HEADER.size, _INDEX_ENTRY.size
+        low, high = 0, (len(self._sorted) - base) // size
+        while low < high:
+            middle = (low + high) // 2
+            position = base + middle * size
+            key = self._sorted[position:position + 16]
+            if key < digest:
+                low = middle + 1
+            elif key > digest:
+                high = middle
+            else:
+                return _INDEX_ENTRY.unpack_from(self._sorted, position)[1:]
+        return None
+
+    def _lookup(self, digest: bytes) -> Optional[tuple]:
+        """(offset, length) of a stored blob, or None"""
+        return self._tail.get(digest) or self._sorted_lookup(digest)
+
+    def _write_sorted(self, entries: Dict[bytes, tuple], covered: int):
+        """Atomically replace blobs.sorted with entries covering blobs.idx[:covered]"""
+        atomic_write_bytes(self.sorted_file, [_SORTED_HEADER.pack(_SORTED_MAGIC, covered)]
+                           + [_INDEX_ENTRY.pack(digest, *entries[digest]) for digest in sorted(entries)])
+
+    def _compact_index(self):
+        """Merge the blobs.idx tail into blobs.sorted once it is long enough to slow lookups"""
+        if len(self._tail) < COMPACT_TAIL_ENTRIES:
+            return
+        entries, end = self._read_index()
+        self._write_sorted(entries, end)
+        self._map_sorted()
+        self._refresh_index()
+
+    def _repair_index(self):
+        """Truncate a torn entry left at the end of blobs.idx by a writer that died mid-append"""
+        try:
+            size = os.stat(self.index_file).st_size
+        except FileNotFoundError:
+            return
+        torn = size % _INDEX_ENTRY.size
+        if torn:
+            logger.warning(f"Truncating {torn} bytes of a torn entry from {self.index_file}")
+            os.truncate(self.index_file, size - torn)
+
+    def _load_index(self) -> Dict[bytes, tuple]:
+        """Every blob entry (for stats; lookups use _lookup)"""
+        return self._read_index()[0]
+
+    def _compress(self, data: bytes, dictionary: bytes) -> bytes:
+        if self.codec == _CODEC_ZSTD:
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=9, dict_data=zdict).compress(data)
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zdict=dictionary) if dictionary \
+            else zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+        return compressor.compress(data) + compressor.flush()
+
+    def _decompress(self, codec: int, data: bytes, dictionary: bytes) -> bytes:
+        if codec == _CODEC_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("blob was written with zstandard, which is not installed")
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=zdict).decompress(data)
+        decompressor = zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def _put_blob(self, raw: bytes, dict_id: str, dictionary: bytes) -> tuple:
+        """Store raw if unseen under this dictionary; returns (digest_hex, bytes_written)"""
+        # A blob only decodes with the dictionary it was compressed against
+        digest = _digest(dict_id.encode("ascii") + b"\0" + raw)
+        if self._lookup(digest):
+            return digest.hex(), 0
+        payload = self._compress(raw, dictionary)
+        with open(self.pack_file, "ab") as pack:
+            offset = pack.tell()
+            pack.write(_BLOB_HEADER.pack(self.codec, len(payload)) + payload)
+        with open(self.index_file, "ab") as idx:
+            idx.write(_INDEX_ENTRY.pack(digest, offset, _BLOB_HEADER.size + len(payload)))
+        self._tail[digest] = (offset, _BLOB_HEADER.size + len(payload))
+        self._tail_end += _INDEX_ENTRY.size
+        return digest.hex(), _BLOB_HEADER.size + len(payload) + _INDEX_ENTRY.size
+
+    def _get_blob(self, digest_hex: str, dictionary: bytes) -> bytes:
+        self._refresh_index()
+        location = self._lookup(bytes.fromhex(digest_hex))
+        if location is None:
+            raise KeyError(f"blob {digest_hex} not in the index")
+        offset, length = location
+        with open(self.pack_file, "rb") as pack:
+            pack.seek(offset)
+            blob = pack.read(length)
+        codec, size = _BLOB_HEADER.unpack_from(blob)
+        return self._decompress(codec, blob[_BLOB_HEADER.size:_BLOB_HEADER.size + size], dictionary)
+
+    # Records --------------------------------------------------------------
+
+    def put(self, text: str, meta: Optional[Dict[str, Any]] = None,
+            dictionary_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store one enhanced output; returns the record (also appended to records.jsonl).
+
+        dictionary_key names the dictionary to compress with (e.g. a template version);
+        the first output stored under a new key trains it. Without a key the most
+        recent dictionary is used.
+        """
+        if dictionary_key is not None and not re.fullmatch(r"[0-9a-zA-Z_-]{1,32}", dictionary_key):
+            raise ValueError(f"Invalid dictionary key: {dictionary_key!r}")
+        with self._store_lock():
+            # Another process may have appended since the index was last read
+            self._repair_index()
+            self._refresh_index()
+            if dictionary_key:
+                dict_id = dictionary_key
+                if not (self.root / f"dict-{dict_id}.bin").exists():
+                    self._train_dictionary(text, dict_id)
+            else:
+                dict_id = self._current_dictionary_id() or self._train_dictionary(text)
+            dictionary = self._dictionary(dict_id)
+
+            parts, written = [], 0
+            for section in split_sections(text):
+                if len(section) < MIN_BLOB_CHARS:
+                    parts.append(section)
+                    continue
+                digest_hex, blob_bytes = self._put_blob(section.encode("utf-8"), dict_id, dictionary)
+                parts.append({"b": digest_hex})
+                written += blob_bytes
+
+            raw = text.encode("utf-8")
+            record = {
+                "id": _digest(raw + str(time.time()).encode()).hex()[:16],
+                "ts": round(time.time(), 3),
+                "dict": dict_id,
+                "chars": len(text),
+                "sha": _digest(raw).hex(),
+                "parts": parts,
+            }
+            if meta:
+                record["meta"] = meta
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            with open(self.records_file, "a", encoding="utf-8") as f:
+                f.write(line)
+            record["bytes_written"] = written + len(line.encode("utf-8"))
+            self._compact_index()
+        return record
+
+    @staticmethod
+    def _scratch(path: Path) -> Path:
+        return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+    def _store_lock(self):
+        return locked(self.root / "store.lock")
+
+    def prune(self, max_age_days: float) -> Dict[str, int]:
+        """Drop records older than max_age_days and every blob only they referenced"""
+        result = {"records": 0, "blobs": 0, "bytes_freed": 0}
+        if not self.records_file.exists():
+            return result
+        cutoff = time.time() - max_age_days * 86400
+        with self._store_lock():
+            records = list(self.iter_records())
+            kept = [record for record in records if record.get("ts", 0) >= cutoff]
+            if len(kept) == len(records):
+                return result
+            self._repair_index()
+            self._refresh_index()
+            previous = len(self._read_index()[0])
+            live = {part["b"] for record in kept for part in record.get("parts", []) if isinstance(part, dict)}
+            files = [self.pack_file, self.index_file, self.sorted_file, self.records_file]
+            before = sum(p.stat().st_size for p in files if p.exists())
+
+            # Write the new generation next to the old one, then swap records first: kept
+            # records only reference blobs that are in both the old and the new pack
+            entries: Dict[bytes, tuple] = {}
+            with open(self.pack_file, "rb") as old_pack, \
+                    open(self._scratch(self.pack_file), "wb") as new_pack:
+                for digest_hex in sorted(live):
+                    digest = bytes.fromhex(digest_hex)
+                    location = self._lookup(digest)
+                    if location is None:
+                        continue
+                    old_pack.seek(location[0])
+                    entries[digest] = (new_pack.tell(), location[1])
+                    new_pack.write(old_pack.read(location[1]))
+            index_data = b"".join(_INDEX_ENTRY.pack(digest, *entries[digest]) for digest in sorted(entries))
+            self._scratch(self.index_file).write_bytes(index_data)
+            with open(self._scratch(self.records_file), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                             for record in kept)
+
+            os.replace(str(self._scratch(self.records_file)), str(self.records_file))
+            self._close_sorted()
+            self.sorted_file.unlink(missing_ok=True)
+            os.replace(str(self._scratch(self.pack_file)), str(self.pack_file))
+            os.replace(str(self._scratch(self.index_file)), str(self.index_file))
+            self._write_sorted(entries, len(index_data))
+            self._sorted_stamp = None
+            self._refresh_index()
+
+            # Dictionaries no remaining record uses, except the one new records are written with
+            used = {record.get("dict") for record in kept} | {self._current_dictionary_id()}
+            for path in self.root.glob("dict-*.bin"):
+                if path.stem[len("dict-"):] not in used:
+                    before += path.stat().st_size
+                    path.unlink()
+            after = sum(p.stat().st_size for p in files if p.exists())
+            result.update(records=len(records) - len(kept), blobs=previous - len(entries),
+                          bytes_freed=before - after)
+        return result
+
+    def get(self, record: Dict[str, Any]) -> str:
+        """Reconstruct the original output of a record"""
+        dictionary = self._dictionary(record.get("dict"))
+        return "".join(part if isinstance(part, str) else self._get_blob(part["b"], dictionary).decode("utf-8")
+                       for part in record.get("parts", []))
+
+    def find(self, record_id: str) -> Optional[Dict[str, Any]]:
+        return next((r for r in self.iter_records() if r.get("id") == record_id), None)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(self.records_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def verify(self) -> Dict[str, int]:
+        """Rebuild every record and check it against its digest"""
+        result = {"records": 0, "ok": 0, "failed": 0}
+        for record in self.iter_records():
+            result["records"] += 1
+            try:
+                rebuilt = self.get(record)
+                ok = _digest(rebuilt.encode("utf-8")).hex() == record.get("sha")
+            except Exception as e:
+                logger.warning(f"Record {record.get('id')} unreadable: {e}")
+                ok = False
+            result["ok" if ok else "failed"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        records = list(self.iter_records())
+        original = sum(len(self.get(r).encode("utf-8")) for r in records)
+        files = [self.pack_file, self.index_file, self.records_file] + list(self.root.glob("dict-*.bin"))
+        stored = sum(p.stat().st_size for p in files if p.exists())
+        return {
+            "records": len(records),
+            "unique_blobs": len(self._load_index()),
+            "original_bytes": original,
+            "stored_bytes": stored,
+            "ratio": round(original / stored, 1) if stored else 0.0,
+            "codec": "zstd" if self.codec == _CODEC_ZSTD else "zlib",
+        }
+
+
+_stores: Dict[str, EnhancementStore] = {}
+
+
+def store_enhancement(enhancement: str, learning_dir: Path = DEFAULT_LEARNING_DIR,
+                      meta: Optional[Dict[str, Any]] = None,
+                      dictionary_key: Optional[str] = None) -> Optional[str]:
+    """Store an enhanced output and return its record id (None on failure)"""
+    if not enhancement:
+        return None
+    key = str(learning_dir)
+    if key not in _stores:
+        _stores[key] = EnhancementStore(learning_dir)
+    try:
+        return _stores[key].put(enhancement, meta, dictionary_key)["id"]
+    except Exception as e:
+        logger.warning(f"Could not store enhancement: {e}")
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Deduplicated enhancement store")
+    parser.add_argument("--learning-dir", type=Path, default=DEFAULT_LEARNING_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Original vs. stored bytes")
+    show_parser = subparsers.add_parser("show", help="Print the original output of a record")
+    show_parser.add_argument("record_id")
+    subparsers.add_parser("verify", help="Rebuild every record and check its digest")
+    prune_parser = subparsers.add_parser("prune", help="Drop old records and the blobs only they use")
+    prune_parser.add_argument("--days", type=float, default=30)
+    args = parser.parse_args(argv)
+
+    store = EnhancementStore(args.learning_dir)
+    if args.command == "stats":
+        for key, value in store.stats().items():
+            print(f"{key:<16} {value}")
+    elif args.command == "show":
+        record = store.find(args.record_id)
+        if not record:
+            print(f"No record {args.record_id}", file=sys.stderr)
+            return 1
+        sys.stdout.write(store.get(record))
+    elif args.command == "prune":
+        result = store.prune(args.days)
+        print(f"Dropped {result['records']} records and {result['blobs']} blobs, "
+              f"freed {result['bytes_freed']} bytes")
+    else:
+        result = store.verify()
+        print(f"{result['ok']}/{result['records']} records rebuilt exactly, {result['failed']} failed")
+        return 1 if result["failed"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Early exit for trivial follow-up prompts
+
+Short follow-ups ("yes", "continue", "run the tests again") do not need the
+full pipeline: context analysis, every extractor, learning system start-up and
+the wrapper build. main() calls classify_trivial() right after loading the
+config. The check costs a few microseconds, and a prompt counts as trivial when:
+- it is at most max_chars characters and max_words words long
+- it has no file or code token (path separators inside words, backticks,
+  brackets, operators)
+- it contains none of the ultra trigger keywords or extra block_words
+- every word is in the acknowledgment vocabulary (rule "acknowledgment") or
+  in the acknowledgment + follow-up vocabularies (rule "follow_up")
+
+A trivial prompt gets the precomputed note (mode "minimal") or no output at all
+(mode "passthrough"). It never touches the learning system or the interaction
+log. Each early exit is recorded in the latency histograms under mode
+"fast_path" and stage fast_path.<rule>, and those counts are what `stats` shows.
+
+Usage:
+    python3 fast_path.py check "run the tests again"
+    python3 fast_path.py stats
+"""
+
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+DEFAULT_MAX_CHARS = 48
+DEFAULT_MAX_WORDS = 6
+DEFAULT_NOTE = ("[Short follow-up] Continue the current task with the context, plan and quality bar "
+                "already established in this conversation.")
+
+# Affirmative only: "no" / "nope" reject the last step, so "continue" would be the wrong note
+DEFAULT_ACKNOWLEDGMENTS = [
+    "yes", "y", "yep", "yeah", "yup", "ok", "okay", "k", "sure", "please", "thanks",
+    "thank", "you", "thx", "ty", "great", "good", "nice", "perfect", "cool", "fine", "lgtm",
+    "agreed", "correct", "right", "exactly", "go", "ahead", "on", "continue", "proceed", "next",
+    "do", "it", "that", "done", "sounds", "looks",
+]
+DEFAULT_FOLLOW_UP_WORDS = [
+    "run", "rerun", "re-run", "retry", "try", "again", "the", "tests", "test", "build", "lint",
+    "keep", "going", "carry", "resume", "same", "one", "more", "time", "this", "those", "these",
+    "now", "and", "then", "all", "let's", "with", "changes", "commit", "push", "check",
+]
+
+# Path separators inside words (src/app.py, utils.parse), code punctuation and operators
+_CODE_TOKEN = re.compile(r"\w[./\\:]\w|[`$(){}\[\]<>=@#|*]")
+_STRIP = ".,!?;:\"'"
+_NO_WORDS: list = []
+
+_vocabulary_cache: Dict[Tuple[int, ...], Tuple[Tuple, Tuple[FrozenSet[str], FrozenSet[str], Tuple[str, ...]]]] = {}
+
+
+def get_fast_path_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("performance", {}).get("fast_path", {})
+    return {
+        "enabled": bool(section.get("enabled", False)),
+        "mode": section.get("mode", "minimal"),
+        "max_chars": int(section.get("max_chars", DEFAULT_MAX_CHARS)),
+        "max_words": int(section.get("max_words", DEFAULT_MAX_WORDS)),
+        "acknowledgments": section.get("acknowledgments", DEFAULT_ACKNOWLEDGMENTS),
+        "follow_up_words": section.get("follow_up_words", DEFAULT_FOLLOW_UP_WORDS),
+        "block_words": section.get("block_words", _NO_WORDS),
+        "note": section.get("note", DEFAULT_NOTE),
+    }
+
+
+def _vocabularies(settings: Dict[str, Any], config: Dict) -> Tuple[FrozenSet[str], FrozenSet[str], Tuple[str, ...]]:
+    """Acknowledgment set, acknowledgment + follow-up set and blocked phrases, built once per config"""
+    triggers = config.get("enrichment", {}).get("ultra_mode", {}).get("trigger_keywords", _NO_WORDS)
+    sources = (settings["acknowledgments"], settings["follow_up_words"], triggers, settings["block_words"])
+    # Keyed on the identity of the (cached) config lists; the entry keeps them alive
+    key = tuple(map(id, sources))
+    entry = _vocabulary_cache.get(key)
+    if entry is None:
+        if len(_vocabulary_cache) >= 8:
+            _vocabulary_cache.clear()
+        acknowledgments = frozenset(w.lower() for w in settings["acknowledgments"])
+        follow_up = acknowledgments | frozenset(w.lower() for w in settings["follow_up_words"])
+        blocked = tuple(w.lower() for w in list(triggers) + list(settings["block_words"]) if w)
+        entry = _vocabulary_cache[key] = (sources, (acknowledgments, follow_up, blocked))
+    return entry[1]
+
+
+def classify_trivial(prompt: str, config: Dict) -> Optional[str]:
+    """Rule that makes prompt trivial ("acknowledgment" or "follow_up"), or None for the full pipeline"""
+    settings = get_fast_path_settings(config)
+    if not settings["enabled"]:
+        return None
+    text = prompt.strip().lower()
+    if not text or len(text) > settings["max_chars"] or _CODE_TOKEN.search(text):
+        return None
+    words = [w for w in (word.strip(_STRIP) for word in text.split()) if w]
+    if not words or len(words) > settings["max_words"]:
+        return None
+    acknowledgments, follow_up, blocked = _vocabularies(settings, config)
+    if any(phrase in text for phrase in blocked):
+        return None
+    if all(word in acknowledgments for word in words):
+        return "acknowledgment"
+    if all(word in follow_up for word in words):
+        return "follow_up"
+    return None
+
+
+def fast_path_output(config: Dict) -> str:
+    """What the hook prints for a trivial prompt"""
+    settings = get_fast_path_settings(config)
+    return "" if settings["mode"] == "passthrough" else settings["note"]
+
+
+def _load_config() -> Dict:
+    try:
+        from enhance_prompt import load_config
+        return load_config(os.getcwd())
+    except ImportError:
+        return {}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Early exit for trivial follow-up prompts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = subparsers.add_parser("check", help="Classify a prompt with the current config")
+    check_parser.add_argument("prompt")
+    check_parser.add_argument("--force", action="store_true", help="Classify even if the fast path is disabled")
+
+    subparsers.add_parser("stats", help="How often the fast path fired (from the latency histograms)")
+
+    args = parser.parse_args(argv)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    config = _load_config()
+
+    if args.command == "check":
+        if args.force:
+            config = dict(config, performance=dict(config.get("performance", {}),
+                          fast_path=dict(config.get("performance", {}).get("fast_path", {}), enabled=True)))
+        rule = classify_trivial(args.prompt, config)
+        print(f"trivial ({rule})" if rule else "full pipeline")
+        return 0
+
+    from latency_histograms import DEFAULT_HISTOGRAM_PATH, load_store
+    latency = config.get("performance", {}).get("latency", {})
+    store = load_store(Path(os.path.expanduser(latency.get("path", str(DEFAULT_HISTOGRAM_PATH)))))
+    totals: Dict[str, int] = {}
+    rules: Dict[str, int] = {}
+    for (stage, mode, _), histogram in store.histograms.items():
+        if stage == "total":
+            totals[mode] = totals.get(mode, 0) + histogram.count
+        elif stage.startswith("fast_path."):
+            rule = stage[len("fast_path."):]
+            rules[rule] = rules.get(rule, 0) + histogram.count
+    fired = totals.get("fast_path", 0)
+    recorded = sum(totals.values())
+    print(f"Fast path: {fired}/{recorded} recorded invocations "
+          f"({fired / recorded if recorded else 0.0:.1%})")
+    for rule, count in sorted(rules.items()):
+        print(f"  {rule:<15} {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
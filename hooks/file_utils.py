@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the hook's on-disk state
+
+Hook processes run concurrently, so state files (sketches, histograms, caches,
+indexes, exports) are replaced atomically: written to a temp file in the same
+directory, then renamed over the target. Updates that must not interleave take
+an flock on "<path>.lock"; without fcntl (Windows) locking is a no-op.
+"""
+
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def atomic_write_bytes(path: Path, data: Union[bytes, Iterable[bytes]], durable: bool = False):
+    """Write data (bytes or chunks) so readers see either the old or the new file, never a partial one"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.writelines([data] if isinstance(data, (bytes, bytearray, memoryview)) else data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path: Path, text: str, durable: bool = False):
+    atomic_write_bytes(path, text.encode("utf-8"), durable)
+
+
+def try_lock(path: Path, wait_ms: float = 0) -> Optional[IO]:
+    """Best-effort exclusive lock on path.lock; returns the open handle (close to release) or None"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_handle = open(str(path) + ".lock", "a")
+    if fcntl is None:
+        return lock_handle
+    deadline = time.monotonic() + wait_ms / 1000.0
+    while True:
+        try:
+            fcntl.flock(lock_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_handle
+        except OSError:
+            if time.monotonic() >= deadline:
+                lock_handle.close()
+                return None
+            time.sleep(0.002)
+
+
+@contextmanager
+def locked(lock_path: Path, shared: bool = False) -> Iterator[None]:
+    """Blocking flock on lock_path itself for the duration of the block"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock_handle:
+        if fcntl is not None:
+            fcntl.flock(lock_handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling for the prompt enhancement hook
+
+Profiles a sampled fraction of hook invocations with cProfile and writes:
+- <name>.prof       pstats-compatible binary profile
+- <name>.collapsed  flamegraph-compatible collapsed stacks ("a;b;c <usec>")
+- <name>.json       tags (prompt size, mode, timestamp, duration)
+
+Profiling is opt-in, enabled by CLAUDE_ENHANCER_PROFILE (1/true or a sample
+rate such as 0.1) or by "performance.profiling.enabled" in the config.
+
+Usage:
+    python3 hook_profiler.py list
+    python3 hook_profiler.py merge [--mode ultra] [--top 30] [--output merged]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = Path.home() / ".claude" / "prompt-enhancer-profiles"
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_MAX_PROFILES = 50
+
+# Tags attached to the profile currently being recorded (None when idle)
+_active_tags: Optional[Dict[str, Any]] = None
+
+
+def get_profiling_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    """Resolve profiling settings from env vars over the config section"""
+    section = (config or {}).get("performance", {}).get("profiling", {})
+    settings = {
+        "enabled": bool(section.get("enabled", False)),
+        "sample_rate": float(section.get("sample_rate", DEFAULT_SAMPLE_RATE)),
+        "max_profiles": int(section.get("max_profiles", DEFAULT_MAX_PROFILES)),
+        "directory": Path(os.path.expanduser(section.get("directory", str(DEFAULT_PROFILE_DIR))))
+    }
+
+    env_value = os.environ.get("CLAUDE_ENHANCER_PROFILE", "").strip().lower()
+    if env_value in ("1", "true", "yes", "on"):
+        settings["enabled"] = True
+        settings["sample_rate"] = 1.0
+    elif env_value in ("0", "false", "no", "off"):
+        settings["enabled"] = False
+    elif env_value:
+        try:
+            settings["sample_rate"] = float(env_value)
+            settings["enabled"] = settings["sample_rate"] > 0
+        except ValueError:
+            logger.warning(f"Ignoring invalid CLAUDE_ENHANCER_PROFILE value: {env_value}")
+
+    env_dir = os.environ.get("CLAUDE_ENHANCER_PROFILE_DIR")
+    if env_dir:
+        settings["directory"] = Path(os.path.expanduser(env_dir))
+
+    settings["sample_rate"] = min(max(settings["sample_rate"], 0.0), 1.0)
+    return settings
+
+
+def annotate_profile(**tags):
+    """Attach tags (e.g. mode="ultra") to the profile being recorded, if any"""
+    if _active_tags is not None:
+        _active_tags.update(tags)
+
+
+def profile_call(func: Callable, config: Optional[Dict], *args, tags: Optional[Dict] = None, **kwargs):
+    """Call func, profiling it when profiling is enabled and this call is sampled"""
+    global _active_tags
+
+    settings = get_profiling_settings(config)
+    if not settings["enabled"] or random.random() >= settings["sample_rate"]:
+        return func(*args, **kwargs)
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    _active_tags = dict(tags or {})
+    start_time = time.time()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (e.g. an outer cProfile run) is already active
+        _active_tags = None
+        return func(*args, **kwargs)
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        recorded_tags = _active_tags
+        _active_tags = None
+        recorded_tags["duration_ms"] = round((time.time() - start_time) * 1000, 3)
+        try:
+            _write_profile(profiler, recorded_tags, settings)
+        except Exception as e:
+            logger.warning(f"Could not write profile: {e}")
+
+
+def _write_profile(profiler, tags: Dict[str, Any], settings: Dict[str, Any]):
+    """Persist pstats, collapsed stacks and tags, then rotate old profiles"""
+    import pstats
+
+    profile_dir = settings["directory"]
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+    tags.setdefault("mode", "unknown")
+    tags["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    name = "{}-{}-{}-{}c".format(
+        time.strftime("%Y%m%d-%H%M%S"), os.getpid(), tags["mode"], tags.get("prompt_chars", 0)
+    )
+    base = profile_dir / name
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(str(base.with_suffix(".prof")))
+    base.with_suffix(".collapsed").write_text(
+        "".join(f"{stack} {value}\n" for stack, value in collapse_stats(stats).items())
+    )
+    base.with_suffix(".json").write_text(json.dumps(tags, indent=2))
+
+    rotate_profiles(profile_dir, settings["max_profiles"])
+
+
+def rotate_profiles(profile_dir: Path, max_profiles: int):
+    """Keep only the newest max_profiles profiles in profile_dir"""
+    profiles = sorted(profile_dir.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in profiles[max(max_profiles, 0):]:
+        for suffix in (".prof", ".collapsed", ".json"):
+            try:
+                stale.with_suffix(suffix).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _frame_label(func: Tuple[str, int, str]) -> str:
+    """Format a pstats function key as a flamegraph frame"""
+    filename, lineno, funcname = func
+    if filename == "~":
+        return funcname
+    return f"{Path(filename).name}:{funcname}:{lineno}"
+
+
+def collapse_stats(stats) -> Dict[str, int]:
+    """
+    Convert pstats caller/callee data into collapsed stacks (microseconds).
+
+    cProfile only records caller->callee edges, so stacks are rebuilt by walking
+    edges from the roots and scaling each subtree by the share of the callee's
+    cumulative time that came through that edge.
+    """
+    raw = stats.stats
+    callees: Dict[Tuple, Dict[Tuple, float]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+
+    roots = [func for func, entry in raw.items() if not any(c in raw for c in entry[4])]
+    collapsed: Dict[str, int] = {}
+
+    def walk(func, path: List[str], on_path: set, inclusive: float):
+        cumulative = raw[func][3]
+        if cumulative <= 0 or inclusive <= 0:
+            return
+        scale = min(inclusive / cumulative, 1.0)
+        stack = path + [_frame_label(func)]
+        self_usec = int(raw[func][2] * scale * 1_000_000)
+        if self_usec > 0:
+            key = ";".join(stack)
+            collapsed[key] = collapsed.get(key, 0) + self_usec
+        for callee, edge_time in callees.get(func, {}).items():
+            if callee in on_path or callee not in raw:
+                continue
+            walk(callee, stack, on_path | {callee}, edge_time * scale)
+
+    for root in roots:
+        walk(root, [], {root}, raw[root][3])
+
+    return collapsed
+
+
+def load_profiles(profile_dir: Path, mode: Optional[str] = None) -> List[Tuple[Path, Dict[str, Any]]]:
+    """Return (profile path, tags) pairs, optionally filtered by mode"""
+    profiles = []
+    for prof in sorted(profile_dir.glob("*.prof")):
+        tags = {}
+        tags_file = prof.with_suffix(".json")
+        if tags_file.exists():
+            try:
+                tags = json.loads(tags_file.read_text())
+            except ValueError:
+                pass
+        if mode and tags.get("mode") != mode:
+            continue
+        profiles.append((prof, tags))
+    return profiles
+
+
+def merge_profiles(profile_dir: Path, output: Path, mode: Optional[str] = None, top: int = 30,
+                   stream=None) -> int:
+    """Merge profiles into one aggregate .prof/.collapsed pair and print a report"""
+    import pstats
+
+    stream = stream or sys.stdout
+    profiles = load_profiles(profile_dir, mode)
+    if not profiles:
+        print(f"No profiles found in {profile_dir}", file=stream)
+        return 0
+
+    stats = pstats.Stats(str(profiles[0][0]), stream=stream)
+    for prof, _ in profiles[1:]:
+        stats.add(str(prof))
+
+    merged_stacks: Dict[str, int] = {}
+    for prof, _ in profiles:
+        collapsed_file = prof.with_suffix(".collapsed")
+        if not collapsed_file.exists():
+            continue
+        for line in collapsed_file.read_text().splitlines():
+            stack, _, value = line.rpartition(" ")
+            if stack and value.isdigit():
+                merged_stacks[stack] = merged_stacks.get(stack, 0) + int(value)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(str(output.with_suffix(".prof")))
+    output.with_suffix(".collapsed").write_text(
+        "".join(f"{stack} {value}\n" for stack, value in sorted(merged_stacks.items()))
+    )
+
+    durations = sorted(tags.get("duration_ms", 0.0) for _, tags in profiles)
+    modes: Dict[str, int] = {}
+    for _, tags in profiles:
+        modes[tags.get("mode", "unknown")] = modes.get(tags.get("mode", "unknown"), 0) + 1
+
+    print(f"Merged {len(profiles)} profiles from {profile_dir}", file=stream)
+    print(f"Modes: {', '.join(f'{m}={n}' for m, n in sorted(modes.items()))}", file=stream)
+    print(f"Duration ms: min={durations[0]:.1f} "
+          f"median={durations[len(durations) // 2]:.1f} max={durations[-1]:.1f}", file=stream)
+    print(f"Aggregate written to {output.with_suffix('.prof')} and {output.with_suffix('.collapsed')}",
+          file=stream)
+    print("", file=stream)
+    stats.sort_stats("cumulative").print_stats(top)
+    return len(profiles)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point for listing and merging profiles"""
+    parser = argparse.ArgumentParser(description="Prompt enhancer hook profiles")
+    parser.add_argument("--dir", type=Path, default=None, help="Profile directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List recorded profiles")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge profiles into an aggregate report")
+    merge_parser.add_argument("--mode", choices=["ultra", "standard"], help="Only merge this mode")
+    merge_parser.add_argument("--top", type=int, default=30, help="Functions to show in the report")
+    merge_parser.add_argument("--output", type=Path, default=None, help="Output path (without suffix)")
+
+    args = parser.parse_args(argv)
+    profile_dir = args.dir or get_profiling_settings()["directory"]
+
+    if args.command == "list":
+        for prof, tags in load_profiles(profile_dir):
+            print(f"{prof.name}  mode={tags.get('mode', '?')}  "
+                  f"prompt_chars={tags.get('prompt_chars', '?')}  "
+                  f"duration_ms={tags.get('duration_ms', '?')}")
+        return 0
+
+    output = args.output or profile_dir / "aggregate" / f"merged-{args.mode or 'all'}"
+    return 0 if merge_profiles(profile_dir, output, args.mode, args.top) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
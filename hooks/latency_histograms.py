@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency histograms merged across hook invocations
+
+Each invocation times its stages (context analysis, enrichment layers, each
+layer provider, learning record, ...) and, on exit, merges them into a small
+persisted file of log-bucketed histograms keyed by stage, mode (ultra vs
+standard) and prompt-size bucket. Buckets grow by 2^(1/16), so any reported
+percentile is within ~4.5% of the true value, and histograms from any number
+of invocations (or machines) merge by adding bucket counts.
+
+Usage:
+    python3 latency_histograms.py stats [--stage enrichment_layers] [--by mode,size] [--json]
+    python3 latency_histograms.py export-prometheus [--output /var/lib/node_exporter/prompt_enhancer.prom]
+    python3 latency_histograms.py merge other-latency.json
+    python3 latency_histograms.py reset
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from file_utils import atomic_write_text, try_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTOGRAM_PATH = Path.home() / ".claude" / "prompt-enhancer-learning" / "analytics" / "latency.json"
+
+MIN_VALUE_MS = 0.001
+BUCKETS_PER_DOUBLING = 16
+_LOG_GROWTH = math.log(2.0) / BUCKETS_PER_DOUBLING
+_FORMAT_VERSION = 1
+
+# Prompt-size buckets (upper bound in characters, label)
+SIZE_BUCKETS = ((200, "xs"), (1000, "s"), (5000, "m"), (20000, "l"), (float("inf"), "xl"))
+
+# Cumulative bucket bounds (seconds) for the Prometheus exporter
+PROMETHEUS_BOUNDS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+DIMENSIONS = ("stage", "mode", "size")
+
+
+def size_bucket(prompt_chars: int) -> str:
+    for limit, label in SIZE_BUCKETS:
+        if prompt_chars < limit:
+            return label
+    return SIZE_BUCKETS[-1][1]
+
+
+class LatencyHistogram:
+    """Sparse log-bucketed histogram of millisecond values"""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    @staticmethod
+    def bucket_index(value_ms: float) -> int:
+        if value_ms <= MIN_VALUE_MS:
+            return 0
+        return int(math.log(value_ms / MIN_VALUE_MS) / _LOG_GROWTH) + 1
+
+    @staticmethod
+    def bucket_upper_ms(index: int) -> float:
+        return MIN_VALUE_MS * math.exp(index * _LOG_GROWTH)
+
+    def record(self, value_ms: float, count: int = 1):
+        index = self.bucket_index(value_ms)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total_ms += value_ms * count
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the pct-th value (capped at the observed max)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_upper_ms(index), self.max_ms)
+        return self.max_ms
+
+    def cumulative_below(self, bound_ms: float) -> int:
+        """Count of values in buckets whose upper bound is <= bound_ms"""
+        return sum(count for index, count in self.counts.items()
+                   if self.bucket_upper_ms(index) <= bound_ms * (1 + 1e-9))
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(50), 3),
+            "p90_ms": round(self.percentile(90), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counts": {str(i): c for i, c in sorted(self.counts.items())}, "count": self.count,
+                "total_ms": round(self.total_ms, 6), "max_ms": round(self.max_ms, 6)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.counts = {int(i): int(c) for i, c in data.get("counts", {}).items()}
+        histogram.count = int(data.get("count", sum(histogram.counts.values())))
+        histogram.total_ms = float(data.get("total_ms", 0.0))
+        histogram.max_ms = float(data.get("max_ms", 0.0))
+        return histogram
+
+
+class HistogramStore:
+    """Histograms keyed by (stage, mode, size)"""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self.invocations = 0
+        self.updated_at = 0.0
+
+    def record(self, stage: str, mode: str, size: str, value_ms: float):
+        key = (stage, mode, size)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        self.histograms[key].record(value_ms)
+
+    def merge(self, other: "HistogramStore"):
+        for key, histogram in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            self.histograms[key].merge(histogram)
+        self.invocations += other.invocations
+        self.updated_at = max(self.updated_at, other.updated_at)
+
+    def grouped(self, by: Iterable[str], stage: Optional[str] = None
+                ) -> Dict[Tuple[str, ...], LatencyHistogram]:
+        """Merge histograms down to the requested dimensions (stage is always kept)"""
+        fields = ["stage"] + [d for d in by if d in DIMENSIONS and d != "stage"]
+        groups: Dict[Tuple[str, ...], LatencyHistogram] = {}
+        for key, histogram in self.histograms.items():
+            labels = dict(zip(DIMENSIONS, key))
+            if stage and labels["stage"] != stage:
+                continue
+            group_key = tuple(labels[f] for f in fields)
+            if group_key not in groups:
+                groups[group_key] = LatencyHistogram()
+            groups[group_key].merge(histogram)
+        return groups
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": _FORMAT_VERSION,
+            "invocations": self.invocations,
+            "updated_at": self.updated_at,
+            "histograms": {"|".join(key): h.to_dict() for key, h in sorted(self.histograms.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HistogramStore":
+        if data.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"unsupported latency histogram version {data.get('version')}")
+        store = cls()
+        store.invocations = int(data.get("invocations", 0))
+        store.updated_at = float(data.get("updated_at", 0.0))
+        for key, histogram in data.get("histograms", {}).items():
+            parts = tuple(key.split("|"))
+            if len(parts) == len(DIMENSIONS):
+                store.histograms[parts] = LatencyHistogram.from_dict(histogram)
+        return store
+
+
+def load_store(path: Path = DEFAULT_HISTOGRAM_PATH) -> HistogramStore:
+    try:
+        return HistogramStore.from_dict(json.loads(path.read_text(encoding="utf-8")))
+    except FileNotFoundError:
+        return HistogramStore()
+
+
+def save_store(store: HistogramStore, path: Path = DEFAULT_HISTOGRAM_PATH):
+    atomic_write_text(path, json.dumps(store.to_dict(), separators=(",", ":")))
+
+
+def prometheus_text(store: HistogramStore) -> str:
+    """Render the store as a Prometheus histogram in text exposition format"""
+    metric = "prompt_enhancer_stage_latency_seconds"
+    lines = [f"# HELP {metric} Prompt enhancer hook latency per stage, mode and prompt size.",
+             f"# TYPE {metric} histogram"]
+    for (stage, mode, size), histogram in sorted(store.histograms.items()):
+        labels = f'stage="{stage}",mode="{mode}",size="{size}"'
+        for bound in PROMETHEUS_BOUNDS_S:
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} '
+                         f'{histogram.cumulative_below(bound * 1000.0)}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.total_ms / 1000.0:.6f}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+    lines.append("# HELP prompt_enhancer_invocations_total Hook invocations recorded in the histograms.")
+    lines.append("# TYPE prompt_enhancer_invocations_total counter")
+    lines.append(f"prompt_enhancer_invocations_total {store.invocations}")
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(store: HistogramStore, output: Path):
+    """Write a node exporter textfile (atomically, as the textfile collector requires)"""
+    atomic_write_text(output, prometheus_text(store))
+
+
+# Per-invocation recorder: stages are timed as the hook runs and flushed once at exit
+_pending: List[Tuple[str, float]] = []
+_pending_lock = threading.Lock()
+_dimensions = {"mode": "unknown", "size": "xs"}
+
+
+def record_stage(stage: str, elapsed_ms: float):
+    with _pending_lock:
+        _pending.append((stage, elapsed_ms))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time the enclosed block as one stage of the current invocation"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def pending_stages() -> Dict[str, float]:
+    """This invocation's unflushed stage timings, summed per stage"""
+    totals: Dict[str, float] = {}
+    with _pending_lock:
+        for stage, elapsed_ms in _pending:
+            totals[stage] = totals.get(stage, 0.0) + elapsed_ms
+    return totals
+
+
+def set_latency_dimensions(mode: Optional[str] = None, prompt_chars: Optional[int] = None):
+    if mode is not None:
+        _dimensions["mode"] = mode
+    if prompt_chars is not None:
+        _dimensions["size"] = size_bucket(prompt_chars)
+
+
+def flush_latency(config: Dict) -> bool:
+    """Merge this invocation's stage timings into the persisted histograms"""
+    with _pending_lock:
+        pending = list(_pending)
+        _pending.clear()
+
+    settings = config.get("performance", {}).get("latency", {})
+    if not settings.get("enabled", False) or not pending:
+        return False
+
+    path = Path(os.path.expanduser(settings.get("path", str(DEFAULT_HISTOGRAM_PATH))))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_handle = try_lock(path, settings.get("lock_wait_ms", 20))
+    if lock_handle is None:
+        logger.info("Latency histograms busy; dropping this invocation's timings")
+        return False
+    try:
+        try:
+            store = load_store(path)
+        except ValueError as e:
+            logger.warning(f"Resetting unreadable latency histograms: {e}")
+            store = HistogramStore()
+        for stage, elapsed_ms in pending:
+            store.record(stage, _dimensions["mode"], _dimensions["size"], elapsed_ms)
+        store.invocations += 1
+        store.updated_at = time.time()
+        save_store(store, path)
+
+        textfile = settings.get("prometheus_textfile")
+        if textfile:
+            export_prometheus(store, Path(os.path.expanduser(textfile)))
+        return True
+    finally:
+        lock_handle.close()
+
+
+def _print_stats(store: HistogramStore, by: List[str], stage: Optional[str]):
+    fields = ["stage"] + [d for d in by if d in DIMENSIONS and d != "stage"]
+    groups = sorted(store.grouped(by, stage).items())
+    widths = [max([len(f)] + [len(key[i]) for key, _ in groups]) + 2 for i, f in enumerate(fields)]
+    header = "".join(f"{f:<{w}}" for f, w in zip(fields, widths))
+    print(f"{header}{'count':>8} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for key, histogram in groups:
+        summary = histogram.summary()
+        labels = "".join(f"{v:<{w}}" for v, w in zip(key, widths))
+        print(f"{labels}{summary['count']:>8} {summary['p50_ms']:>8.2f}ms {summary['p90_ms']:>8.2f}ms "
+              f"{summary['p99_ms']:>8.2f}ms {summary['max_ms']:>8.2f}ms")
+    print(f"\n{store.invocations} invocations")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prompt enhancer latency histograms")
+    parser.add_argument("--path", type=Path, default=DEFAULT_HISTOGRAM_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = subparsers.add_parser("stats", help="p50/p90/p99/max per stage")
+    stats_parser.add_argument("--stage", help="Only this stage")
+    stats_parser.add_argument("--by", default="mode,size",
+                              help="Comma-separated breakdown: mode, size (empty for stage only)")
+    stats_parser.add_argument("--json", action="store_true")
+
+    export_parser = subparsers.add_parser("export-prometheus", help="Write a node exporter textfile")
+    export_parser.add_argument("--output", type=Path, help="Defaults to stdout")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge histogram files from other machines")
+    merge_parser.add_argument("others", nargs="+", type=Path)
+
+    subparsers.add_parser("reset", help="Delete the persisted histograms")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "reset":
+        if args.path.exists():
+            args.path.unlink()
+        print(f"Removed {args.path}")
+        return 0
+
+    store = load_store(args.path)
+    if args.command == "stats":
+        by = [d.strip() for d in args.by.split(",") if d.strip()]
+        if args.json:
+            fields = ["stage"] + [d for d in by if d in DIMENSIONS and d != "stage"]
+            rows = [dict(zip(fields, key), **h.summary())
+                    for key, h in sorted(store.grouped(by, args.stage).items())]
+            print(json.dumps({"invocations": store.invocations, "stages": rows}, indent=2))
+        else:
+            _print_stats(store, by, args.stage)
+    elif args.command == "export-prometheus":
+        if args.output:
+            export_prometheus(store, args.output)
+            print(f"Wrote {args.output}")
+        else:
+            sys.stdout.write(prometheus_text(store))
+    elif args.command == "merge":
+        for other in args.others:
+            store.merge(load_store(other))
+        save_store(store, args.path)
+        print(f"Merged {len(args.others)} file(s) into {args.path} ({store.invocations} invocations)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Enrichment layer providers with concurrent execution and per-layer deadlines
+
+A layer provider produces one enrichment block (an ultra block, a template, or
+a plugin-supplied layer). run_layer_providers() runs providers concurrently on
+a small pool of daemon worker threads, waits for each until its own deadline,
+and assembles results in provider order. Providers that time out, raise or
+return nothing are dropped and reported with a reason instead of delaying or
+breaking the prompt. Required providers (the built-in ultra blocks and
+templates) are waited for without a deadline unless deadlines_ms names them,
+so a cold disk or a loaded machine slows the prompt instead of silently
+removing core guidance.
+
+Worker threads are daemonic so that a hung provider never delays hook exit.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE_MS = 150.0
+DEFAULT_MAX_WORKERS = 8
+
+
+class LayerProvider:
+    """One enrichment layer; subclasses (or plugins) override build()"""
+
+    def __init__(self, name: str, deadline_ms: Optional[float] = None, required: bool = False):
+        self.name = name
+        self.deadline_ms = deadline_ms
+        self.required = required
+
+    def build(self, prompt: str, context: Dict, config: Dict) -> str:
+        raise NotImplementedError
+
+
+class FunctionLayerProvider(LayerProvider):
+    """Layer provider backed by a callable taking (prompt, context, config)"""
+
+    def __init__(self, name: str, func: Callable[[str, Dict, Dict], str],
+                 deadline_ms: Optional[float] = None, required: bool = False):
+        super().__init__(name, deadline_ms, required)
+        self.func = func
+
+    def build(self, prompt: str, context: Dict, config: Dict) -> str:
+        return self.func(prompt, context, config)
+
+
+class LayerResult:
+    """Outcome of one provider: status is ok, empty, timeout or error"""
+
+    __slots__ = ("name", "content", "status", "reason", "elapsed_ms")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.content = ""
+        self.status = "timeout"
+        self.reason = ""
+        self.elapsed_ms = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "status": self.status, "reason": self.reason,
+                "elapsed_ms": round(self.elapsed_ms, 3)}
+
+
+# Plugin registry: providers appended after the built-in layers, in registration order
+_PLUGIN_PROVIDERS: List[LayerProvider] = []
+
+
+def register_layer_provider(provider: LayerProvider):
+    """Register a plugin layer provider (replaces an existing one with the same name)"""
+    unregister_layer_provider(provider.name)
+    _PLUGIN_PROVIDERS.append(provider)
+
+
+def unregister_layer_provider(name: str):
+    _PLUGIN_PROVIDERS[:] = [p for p in _PLUGIN_PROVIDERS if p.name != name]
+
+
+def get_plugin_providers() -> List[LayerProvider]:
+    return list(_PLUGIN_PROVIDERS)
+
+
+class _DaemonWorkerPool:
+    """Minimal thread pool whose workers are daemon threads"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._tasks: "queue.Queue[Tuple[Callable, Tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle = 0
+
+    def submit(self, func: Callable, *args):
+        with self._lock:
+            # Grow when every worker is busy (e.g. stuck in an abandoned provider)
+            if self._idle <= self._tasks.qsize() and self._workers < self.max_workers:
+                self._workers += 1
+                self._idle += 1
+                threading.Thread(target=self._work, name=f"layer-provider-{self._workers}",
+                                 daemon=True).start()
+        self._tasks.put((func, args))
+
+    def _work(self):
+        while True:
+            func, args = self._tasks.get()
+            with self._lock:
+                self._idle -= 1
+            try:
+                func(*args)
+            except Exception as e:
+                logger.debug(f"Layer provider worker error: {e}")
+            finally:
+                with self._lock:
+                    self._idle += 1
+
+
+_pool: Optional[_DaemonWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> _DaemonWorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _DaemonWorkerPool(max_workers)
+        else:
+            _pool.max_workers = max(_pool.max_workers, max_workers)
+        return _pool
+
+
+def _run_provider(provider: LayerProvider, prompt: str, context: Dict, config: Dict,
+                  result: LayerResult, done: threading.Event):
+    start = time.perf_counter()
+    try:
+        content = provider.build(prompt, context, config)
+        result.content = content or ""
+        result.status = "ok" if content else "empty"
+        if not content:
+            result.reason = "provider returned no content"
+    except Exception as e:
+        result.status = "error"
+        result.reason = f"{type(e).__name__}: {e}"
+    finally:
+        result.elapsed_ms = (time.perf_counter() - start) * 1000
+        done.set()
+
+
+def run_layer_providers(providers: List[LayerProvider], prompt: str, context: Dict, config: Dict,
+                        parallel: bool = True, max_workers: int = DEFAULT_MAX_WORKERS,
+                        default_deadline_ms: float = DEFAULT_DEADLINE_MS,
+                        deadlines_ms: Optional[Dict[str, float]] = None) -> List[LayerResult]:
+    """
+    Run providers and return one LayerResult per provider, in provider order.
+
+    In parallel mode each provider gets deadlines_ms[name], its own deadline_ms, or
+    default_deadline_ms (none for required providers), measured from the moment all
+    providers were submitted. Serial mode runs providers inline without deadlines.
+    """
+    deadlines_ms = deadlines_ms or {}
+    results = [LayerResult(p.name) for p in providers]
+
+    if not parallel or len(providers) <= 1:
+        for provider, result in zip(providers, results):
+            _run_provider(provider, prompt, context, config, result, threading.Event())
+        return results
+
+    pool = _get_pool(max_workers)
+    events = []
+    start = time.monotonic()
+    for provider, result in zip(providers, results):
+        done = threading.Event()
+        events.append(done)
+        pool.submit(_run_provider, provider, prompt, context, config, result, done)
+
+    for index, (provider, done) in enumerate(zip(providers, events)):
+        deadline_ms = deadlines_ms.get(provider.name, provider.deadline_ms)
+        if deadline_ms is None and provider.required:
+            done.wait()
+            continue
+        deadline_ms = deadline_ms or default_deadline_ms
+        remaining = start + deadline_ms / 1000.0 - time.monotonic()
+        if not done.wait(max(remaining, 0.0)):
+            # Leave the worker to finish in the background; its result is discarded
+            timed_out = LayerResult(provider.name)
+            timed_out.reason = f"exceeded {deadline_ms:.0f}ms deadline"
+            timed_out.elapsed_ms = (time.monotonic() - start) * 1000
+            results[index] = timed_out
+
+    return results
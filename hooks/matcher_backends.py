@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Pluggable regex matcher backends for the keyword tables and learned patterns
+
+compile_matcher() replaces re.compile() for the pattern tables in
+enhance_prompt.py. The backend is chosen by performance.matcher.backend:
+
+    stdlib  Python's backtracking re (default)
+    linear  KeywordMatcher for keyword-table patterns, \\b(word|a.*b|...)\\b,
+            with results identical to re. Other patterns use re2 when it is
+            installed, else re.
+    re2     google-re2 for every pattern it accepts, re for the rest. RE2's
+            \\b is ASCII-only, so results can differ on non-ASCII text.
+
+A gap such as machine.*learning makes re rescan the rest of the line at every
+"machine", so a long prompt takes quadratic time. KeywordMatcher finds the
+literal pieces with str.find and computes one greedy match end per line and
+alternative, so its time is linear in the prompt.
+
+Learned patterns (pattern_regex in patterns.json) are checked when they are
+loaded. A pattern is rejected for a syntax error, a backreference, a nested
+repeat like (a+)+, too many variable-length repeats, or excessive length.
+Unbounded repeats (.*, \\w+, {n,}) are bounded to max_gap characters, or the
+pattern is rejected if on_unsafe is "reject". The re2 backend runs in linear
+time, so it keeps learned patterns unbounded.
+
+Usage:
+    python3 matcher_backends.py check 'deploy.*(prod|staging)' ...
+    python3 matcher_backends.py check --patterns ~/.claude/prompt-enhancer-learning/patterns.json
+    python3 matcher_backends.py bench [--chars 50000]
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    from _sre import unicode_tolower as _unicode_tolower
+    from re._casefix import _EXTRA_CASES
+except ImportError:
+    _unicode_tolower = None
+    _EXTRA_CASES = {}
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("stdlib", "linear", "re2")
+DEFAULT_LEARNED_SETTINGS = {"on_unsafe": "rewrite", "max_gap": 64, "max_repeats": 2, "max_length": 256}
+
+_RE2_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"))
+_SUPPORTED_FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL
+
+_backend = "stdlib"
+
+
+# Case folding identical to re.IGNORECASE (simple lowercase plus re's extra equivalences)
+
+def _fold_char(char: str) -> str:
+    if _unicode_tolower is None:
+        lowered = char.lower()
+        return lowered if len(lowered) == 1 else char
+    lowered = _unicode_tolower(ord(char))
+    return chr(min((lowered,) + tuple(_EXTRA_CASES.get(lowered, ()))))
+
+
+def fold_case(text: str) -> str:
+    """Per-character fold; the result has the same length as text"""
+    if text.isascii():
+        return text.lower()
+    return text.translate({ord(c): _fold_char(c) for c in set(text)})
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+# Keyword scanner ---------------------------------------------------------------
+
+_KEYWORD_SHAPE = re.compile(r"^(?P<lb>\\b)?(?P<open>\()?(?P<body>.*?)(?P<close>\))?(?P<rb>\\b)?$", re.DOTALL)
+
+
+def _parse_literal(source: str) -> Optional[str]:
+    """Unescape a literal run; None if it contains any regex construct"""
+    out, i = [], 0
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            if i + 1 >= len(source) or source[i + 1].isalnum():
+                return None
+            out.append(source[i + 1])
+            i += 2
+            continue
+        if char in ".^$*+?{}[]()|":
+            return None
+        out.append(char)
+        i += 1
+    return "".join(out) or None
+
+
+def _split_unescaped(source: str, separator: str) -> List[str]:
+    parts, current, i = [], [], 0
+    while i < len(source):
+        if source[i] == "\\" and i + 1 < len(source):
+            current.append(source[i:i + 2])
+            i += 2
+        elif source.startswith(separator, i):
+            parts.append("".join(current))
+            current = []
+            i += len(separator)
+        else:
+            current.append(source[i])
+            i += 1
+    parts.append("".join(current))
+    return parts
+
+
+def parse_keyword_pattern(pattern: str, flags: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Structure of a keyword-table pattern: optional \\b, an optional group around
+    alternatives, optional \\b. Each alternative is literals joined by .* gaps.
+    Returns None for anything else.
+    """
+    if flags & ~re.IGNORECASE:
+        return None
+    shape = _KEYWORD_SHAPE.match(pattern)
+    if not shape or bool(shape.group("open")) != bool(shape.group("close")):
+        return None
+    body = shape.group("body")
+    alternatives = []
+    if not shape.group("open") and (shape.group("lb") or shape.group("rb")) and "|" in body:
+        return None  # \ba|b\b binds the boundaries to single alternatives
+    for alternative in _split_unescaped(body, "|"):
+        literals = [_parse_literal(piece) for piece in _split_unescaped(alternative, ".*")]
+        if not literals or any(literal is None for literal in literals):
+            return None
+        alternatives.append(literals)
+    ignore_case = bool(flags & re.IGNORECASE)
+    return {
+        "leading_boundary": bool(shape.group("lb")),
+        "trailing_boundary": bool(shape.group("rb")),
+        "ignore_case": ignore_case,
+        "alternatives": [[fold_case(lit) for lit in literals] if ignore_case else literals
+                         for literals in alternatives],
+    }
+
+
+class KeywordMatcher:
+    """
+    Linear-time matcher for keyword-table patterns with re's exact leftmost,
+    first-alternative, greedy-gap semantics (search, findall, finditer spans)
+    """
+
+    backend = "linear"
+
+    def __init__(self, pattern: str, flags: int = 0, structure: Optional[Dict[str, Any]] = None):
+        self.pattern = pattern
+        self.flags = flags
+        structure = structure or parse_keyword_pattern(pattern, flags)
+        if structure is None:
+            raise ValueError(f"not a keyword pattern: {pattern!r}")
+        self.alternatives: List[List[str]] = structure["alternatives"]
+        self.leading_boundary = structure["leading_boundary"]
+        self.trailing_boundary = structure["trailing_boundary"]
+        self.ignore_case = structure["ignore_case"]
+
+    def _boundary(self, text: str, pos: int) -> bool:
+        before = pos > 0 and _is_word(text[pos - 1])
+        after = pos < len(text) and _is_word(text[pos])
+        return before != after
+
+    def _gap_end(self, text: str, folded: str, literals: List[str], line_start: int, line_end: int,
+                 cache: Dict[Tuple[int, int], Tuple[int, int]], key: int) -> Tuple[int, int]:
+        """
+        For an alternative with gaps, the greedy match end on this line and the
+        latest position where its first gap may end (-1/-1 if it cannot match here).
+        Both are independent of the start position, so they are computed once per line.
+        """
+        cached = cache.get((line_start, key))
+        if cached is not None:
+            return cached
+        last = literals[-1]
+        bound = line_end
+        end_pos = -1
+        while True:
+            q = folded.rfind(last, line_start, bound)
+            if q < 0:
+                break
+            if not self.trailing_boundary or self._boundary(text, q + len(last)):
+                end_pos = q + len(last)
+                break
+            bound = q + len(last) - 1
+        result = (-1, -1)
+        if end_pos >= 0:
+            upper = end_pos - len(last)
+            for literal in reversed(literals[1:-1]):
+                q = folded.rfind(literal, line_start, upper)
+                if q < 0:
+                    upper = -1
+                    break
+                upper = q
+            if upper >= 0:
+                result = (end_pos, upper)
+        cache[(line_start, key)] = result
+        return result
+
+    def _match_at(self, text: str, folded: str, pos: int, index: int, line: List[int],
+                  cache: Dict[Tuple[int, int], Tuple[int, int]]) -> int:
+        literals = self.alternatives[index]
+        first_end = pos + len(literals[0])
+        if len(literals) == 1:
+            if self.trailing_boundary and not self._boundary(text, first_end):
+                return -1
+            return first_end
+        if pos > line[1]:
+            # Positions only move forward, so each line boundary is found once
+            line[0] = text.rfind("\n", max(line[1], 0), pos) + 1
+            line[1] = text.find("\n", pos)
+            if line[1] < 0:
+                line[1] = len(text)
+        end_pos, first_gap_limit = self._gap_end(text, folded, literals, line[0], line[1], cache, index)
+        if end_pos < 0 or first_gap_limit < first_end:
+            return -1
+        return end_pos
+
+    def _spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        folded = fold_case(text) if self.ignore_case else text
+        cache: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        line = [0, -1]  # [start, end) of the line holding the current position
+        heap = []
+        for index, literals in enumerate(self.alternatives):
+            p = folded.find(literals[0])
+            if p >= 0:
+                heap.append((p, index))
+        heapq.heapify(heap)
+
+        pos = 0
+        while heap:
+            start = heap[0][0]
+            candidates = []
+            while heap and heap[0][0] == start:
+                candidates.append(heapq.heappop(heap)[1])
+            matched_end = -1
+            if not self.leading_boundary or self._boundary(text, start):
+                for index in sorted(candidates):
+                    matched_end = self._match_at(text, folded, start, index, line, cache)
+                    if matched_end >= 0:
+                        break
+            if matched_end >= 0:
+                yield start, matched_end
+                pos = matched_end
+                candidates += [index for _, index in heap]
+                heap = []
+            else:
+                pos = start + 1
+            for index in candidates:
+                p = folded.find(self.alternatives[index][0], pos)
+                if p >= 0:
+                    heapq.heappush(heap, (p, index))
+
+    def search(self, text: str) -> bool:
+        return next(self._spans(text), None) is not None
+
+    def findall(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self._spans(text)]
+
+    def finditer_spans(self, text: str) -> List[Tuple[int, int]]:
+        return list(self._spans(text))
+
+
+# Backend selection ----------------------------------------------------------------
+
+def _compile_re2(pattern: str, flags: int):
+    if flags & ~_SUPPORTED_FLAGS:
+        raise ValueError("flags not supported by re2")
+    inline = "".join(letter for flag, letter in _RE2_FLAGS if flags & flag)
+    return re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+
+
+def compile_matcher(pattern: str, flags: int = 0, backend: Optional[str] = None):
+    """Compiled matcher (search/findall like re.Pattern) for the configured backend"""
+    backend = backend or _backend
+    if backend == "linear":
+        structure = parse_keyword_pattern(pattern, flags)
+        if structure is not None:
+            return KeywordMatcher(pattern, flags, structure)
+    if backend in ("linear", "re2") and RE2_AVAILABLE:
+        try:
+            return _compile_re2(pattern, flags)
+        except Exception as e:
+            logger.debug(f"re2 cannot compile {pattern!r} ({e}); using re")
+    return re.compile(pattern, flags)
+
+
+def configure_matchers(settings: Optional[Dict[str, Any]]) -> bool:
+    """Select the backend from performance.matcher; True if it changed"""
+    global _backend
+    backend = (settings or {}).get("backend", "stdlib")
+    if backend not in BACKENDS:
+        logger.warning(f"Unknown matcher backend {backend!r}; using stdlib")
+        backend = "stdlib"
+    if backend == "re2" and not RE2_AVAILABLE:
+        logger.warning("Matcher backend re2 requested but google-re2 is not installed; using stdlib")
+        backend = "stdlib"
+    changed = backend != _backend
+    _backend = backend
+    return changed
+
+
+def active_backend() -> str:
+    return _backend
+
+
+# Learned pattern validation -----------------------------------------------------
+
+def _repeat_stats(items, inside_repeat: bool = False) -> Dict[str, int]:
+    """Counts of variable repeats, unbounded repeats, nested repeats and backreferences"""
+    stats = {"variable": 0, "unbounded": 0, "nested": 0, "backrefs": 0}
+
+    def merge(other):
+        for key, value in other.items():
+            stats[key] += value
+
+    for op, av in items:
+        name = str(op)
+        if name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            low, high, body = av
+            variable = high != low
+            if variable:
+                stats["variable"] += 1
+                stats["unbounded"] += high == sre_parse.MAXREPEAT
+                if inside_repeat:
+                    stats["nested"] += 1
+            merge(_repeat_stats(body, inside_repeat or (variable and high > 1)))
+        elif name in ("GROUPREF", "GROUPREF_EXISTS"):
+            stats["backrefs"] += 1
+            if name == "GROUPREF_EXISTS":
+                for branch in av[1:]:
+                    if branch is not None:
+                        merge(_repeat_stats(branch, inside_repeat))
+        elif name == "SUBPATTERN":
+            merge(_repeat_stats(av[-1], inside_repeat))
+        elif name in ("ASSERT", "ASSERT_NOT", "ATOMIC_GROUP"):
+            merge(_repeat_stats(av[-1] if name != "ATOMIC_GROUP" else av, inside_repeat))
+        elif name == "BRANCH":
+            for branch in av[1]:
+                merge(_repeat_stats(branch, inside_repeat))
+    return stats
+
+
+def bound_repeats(pattern: str, max_gap: int) -> str:
+    """Rewrite *, + and {n,} outside character classes as {0,max_gap}, {1,max_gap}, {n,n+max_gap}"""
+    out, i, in_class, after_quantifier = [], 0, False, False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            out.append(pattern[i:i + 2])
+            after_quantifier = False
+            i += 2
+            continue
+        if in_class:
+            if char == "]":
+                in_class = False
+            out.append(char)
+            i += 1
+            continue
+        if char == "[":
+            in_class = True
+            after_quantifier = False
+            out.append(char)
+            i += 1
+            if pattern[i:i + 1] == "^":
+                out.append("^")
+                i += 1
+            if pattern[i:i + 1] == "]":
+                out.append("]")
+                i += 1
+            continue
+        if char in "?+" and after_quantifier:
+            # Lazy or possessive marker of the preceding quantifier
+            out.append(char)
+            after_quantifier = False
+            i += 1
+            continue
+        bounded = re.match(r"\{\d*(,\d+)?\}", pattern[i:]) if char == "{" else None
+        open_range = re.match(r"\{(\d*),\}", pattern[i:]) if char == "{" else None
+        if char in "*+" or open_range:
+            low = int(open_range.group(1) or 0) if open_range else (0 if char == "*" else 1)
+            upper = max_gap if low <= 1 else low + max_gap
+            out.append(f"{{{low},{upper}}}")
+            i += len(open_range.group(0)) if open_range else 1
+            after_quantifier = True
+            continue
+        if char == "?" or bounded:
+            token = bounded.group(0) if bounded else char
+            out.append(token)
+            i += len(token)
+            after_quantifier = True
+            continue
+        out.append(char)
+        after_quantifier = False
+        i += 1
+    return "".join(out)
+
+
+def check_learned_pattern(pattern: str, settings: Optional[Dict[str, Any]] = None,
+                          backend: Optional[str] = None) -> Tuple[Optional[str], List[str]]:
+    """
+    (pattern to compile, notes) for a learned pattern_regex, or (None, reasons)
+    when it is rejected
+    """
+    limits = dict(DEFAULT_LEARNED_SETTINGS, **(settings or {}).get("learned_patterns", {}))
+    backend = backend or _backend
+    if not isinstance(pattern, str) or not pattern:
+        return None, ["empty or not a string"]
+    if len(pattern) > limits["max_length"]:
+        return None, [f"longer than {limits['max_length']} characters"]
+    try:
+        stats = _repeat_stats(sre_parse.parse(pattern, re.IGNORECASE))
+    except (re.error, RecursionError, OverflowError) as e:
+        return None, [f"invalid: {e}"]
+
+    if stats["backrefs"]:
+        return None, ["backreference (no linear-time evaluation)"]
+    if backend == "re2" and RE2_AVAILABLE:
+        return pattern, []
+    if stats["nested"]:
+        return None, ["nested repeat (exponential backtracking)"]
+    if stats["variable"] > limits["max_repeats"]:
+        return None, [f"{stats['variable']} variable-length repeats (limit {limits['max_repeats']})"]
+    if not stats["unbounded"]:
+        return pattern, []
+    if limits["on_unsafe"] == "reject":
+        return None, [f"{stats['unbounded']} unbounded repeat(s)"]
+
+    rewritten = bound_repeats(pattern, int(limits["max_gap"]))
+    try:
+        if _repeat_stats(sre_parse.parse(rewritten, re.IGNORECASE))["unbounded"]:
+            return None, ["unbounded repeat could not be rewritten"]
+    except re.error as e:
+        return None, [f"rewrite failed: {e}"]
+    return rewritten, [f"bounded {stats['unbounded']} unbounded repeat(s) to {limits['max_gap']} characters"]
+
+
+_learned_cache: Dict[Tuple[str, str, str], Any] = {}
+
+
+def compile_learned_pattern(pattern: str, settings: Optional[Dict[str, Any]] = None):
+    """Validated, compiled (case-insensitive) matcher for a learned pattern, or None if rejected"""
+    key = (str(pattern), _backend, json.dumps((settings or {}).get("learned_patterns", {}), sort_keys=True))
+    if key not in _learned_cache:
+        safe, notes = check_learned_pattern(pattern, settings)
+        matcher = None
+        if safe is None:
+            logger.warning(f"Rejected learned pattern {pattern!r}: {'; '.join(notes)}")
+        else:
+            if notes:
+                logger.info(f"Learned pattern {pattern!r}: {'; '.join(notes)}")
+            try:
+                matcher = compile_matcher(safe, re.IGNORECASE)
+            except re.error as e:
+                logger.warning(f"Rejected learned pattern {pattern!r}: {e}")
+        _learned_cache[key] = matcher
+    return _learned_cache[key]
+
+
+# CLI ------------------------------------------------------------------------------
+
+def _bench(chars: int):
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import enhance_prompt
+
+    inputs = {
+        "gap keywords": ("machine " * chars)[:chars],
+        "word soup": ("shopping command data " * chars)[:chars],
+        "prose": ("Refactor the payment service and add tests for the API. " * chars)[:chars],
+    }
+    backends = [b for b in BACKENDS if b != "re2" or RE2_AVAILABLE]
+    print(f"{'input':<14}" + "".join(f"{b:>12}" for b in backends))
+    for label, text in inputs.items():
+        row = []
+        for backend in backends:
+            # Through enhance_prompt: this file may be running as __main__, a separate module
+            enhance_prompt.configure_matchers({"backend": backend})
+            enhance_prompt._COMPILED_REGEXES.clear()
+            start = time.perf_counter()
+            enhance_prompt.extract_technical_keywords(text)
+            enhance_prompt.detect_ultra_mode_triggers(text)
+            enhance_prompt.detect_domain_specific_terms(text)
+            enhance_prompt.detect_complexity_indicators(text)
+            row.append((time.perf_counter() - start) * 1000)
+        print(f"{label:<14}" + "".join(f"{ms:>10.1f}ms" for ms in row))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Matcher backends and learned pattern checks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser("check", help="Validate learned patterns")
+    check_parser.add_argument("patterns", nargs="*")
+    check_parser.add_argument("--patterns", dest="patterns_file", type=Path)
+    check_parser.add_argument("--backend", choices=BACKENDS, default="stdlib")
+    bench_parser = subparsers.add_parser("bench", help="Time the keyword tables per backend")
+    bench_parser.add_argument("--chars", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        _bench(args.chars)
+        return 0
+
+    patterns = list(args.patterns)
+    if args.patterns_file:
+        data = json.loads(args.patterns_file.read_text())
+        patterns += [p["pattern_regex"] for p in data.values() if isinstance(p, dict) and p.get("pattern_regex")]
+    configure_matchers({"backend": args.backend})
+    rejected = 0
+    for pattern in patterns:
+        safe, notes = check_learned_pattern(pattern)
+        if safe is None:
+            rejected += 1
+            print(f"REJECT  {pattern!r}: {'; '.join(notes)}")
+        elif safe != pattern:
+            print(f"REWRITE {pattern!r} -> {safe!r}")
+        else:
+            print(f"OK      {pattern!r}")
+    return 1 if rejected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
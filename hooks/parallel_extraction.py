@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Chunked parallel regex extraction for large prompts and long histories
+
+findall_many(patterns, texts) returns exactly [[p.findall(t) for p in patterns]
+for t in texts]. Below the size threshold of the active mode, or on a single
+core, that is also how it is computed. Above it, the work is split into tasks
+and run concurrently:
+- threads       free-threaded CPython (sys._is_gil_enabled() is False)
+- interpreters  concurrent.futures.InterpreterPoolExecutor (CPython 3.14+)
+- processes     ProcessPoolExecutor everywhere else
+
+A long text is split into chunks that end just after a newline. That is exact
+for "line-local" patterns: ones that can match neither a newline nor the empty
+string, and use no ^, $, \\A or \\Z anchor. Such a match never crosses a
+chunk boundary and never looks past one, so the findall lists of the
+chunks, concatenated in order, are the findall list of the text. Any
+other pattern (e.g. one containing \\s) gets the whole text as one task. Short
+texts are batched. Results are assembled in input order, so the output does
+not depend on task scheduling.
+
+Only stdlib re patterns are split; other matcher backends run serially.
+
+Usage:
+    python3 parallel_extraction.py runtime
+    python3 parallel_extraction.py bench --chars 2000000 [--mode processes]
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+MODES = ("auto", "threads", "interpreters", "processes", "serial")
+DEFAULT_MIN_CHARS = {"threads": 131072, "interpreters": 262144, "processes": 1048576}
+
+_settings: Dict[str, Any] = {"enabled": True, "mode": "auto", "max_workers": 4, "chunk_chars": 65536,
+                             "min_chars": dict(DEFAULT_MIN_CHARS)}
+_pool = None
+_pool_mode: Optional[str] = None
+
+# Character classes that never match "\n"
+_NO_NEWLINE_CATEGORIES = {"CATEGORY_DIGIT", "CATEGORY_WORD", "CATEGORY_NOT_SPACE", "CATEGORY_NOT_LINEBREAK",
+                          "CATEGORY_UNI_DIGIT", "CATEGORY_UNI_WORD", "CATEGORY_UNI_NOT_SPACE",
+                          "CATEGORY_UNI_NOT_LINEBREAK", "CATEGORY_LOC_WORD"}
+# Anchors that behave differently at the edge of a chunk than inside the full text
+_EDGE_ANCHORS = {"AT_BEGINNING", "AT_BEGINNING_STRING", "AT_END", "AT_END_STRING"}
+
+
+def detect_runtime() -> str:
+    """Best parallel mode this interpreter supports"""
+    if hasattr(sys, "_is_gil_enabled") and not sys._is_gil_enabled():
+        return "threads"
+    try:
+        from concurrent.futures import InterpreterPoolExecutor  # noqa: F401
+        return "interpreters"
+    except ImportError:
+        return "processes"
+
+
+def _cpu_count() -> int:
+    if hasattr(os, "process_cpu_count"):
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def active_mode() -> str:
+    """Mode findall_many uses above the threshold; serial when disabled or on one core"""
+    if not _settings.get("enabled", True):
+        return "serial"
+    mode = _settings.get("mode", "auto")
+    if mode == "auto":
+        mode = detect_runtime() if _cpu_count() > 1 else "serial"
+    return mode
+
+
+def configure_parallel_extraction(settings: Optional[Dict[str, Any]]):
+    """Apply performance.parallel_extraction; drops the worker pool if the mode changes"""
+    settings = settings or {}
+    mode = settings.get("mode", "auto")
+    if mode not in MODES:
+        logger.warning(f"Unknown parallel extraction mode {mode!r}; using auto")
+        mode = "auto"
+    _settings.update({
+        "enabled": bool(settings.get("enabled", True)),
+        "mode": mode,
+        "max_workers": max(int(settings.get("max_workers", 4)), 1),
+        "chunk_chars": max(int(settings.get("chunk_chars", 65536)), 1024),
+        "min_chars": dict(DEFAULT_MIN_CHARS, **settings.get("min_chars", {})),
+    })
+    if _pool is not None and _pool_mode != active_mode():
+        _shutdown_pool()
+
+
+def _shutdown_pool():
+    global _pool, _pool_mode
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool, _pool_mode = None, None
+
+
+def _get_pool(mode: str):
+    global _pool, _pool_mode
+    if _pool is None:
+        workers = min(_settings["max_workers"], _cpu_count())
+        if mode == "threads":
+            from concurrent.futures import ThreadPoolExecutor
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+        elif mode == "interpreters":
+            from concurrent.futures import InterpreterPoolExecutor
+            # Subinterpreters start with the interpreter's default sys.path, not ours
+            hooks_dir = str(Path(__file__).resolve().parent)
+            _pool = InterpreterPoolExecutor(max_workers=workers, initializer=exec,
+                                            initargs=(f"import sys; sys.path.insert(0, {hooks_dir!r})",))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_mode = mode
+    return _pool
+
+
+def _set_matches_newline(items) -> bool:
+    matches = False
+    negate = False
+    for op, av in items:
+        name = str(op)
+        if name == "NEGATE":
+            negate = True
+        elif name == "LITERAL":
+            matches = matches or av == 10
+        elif name == "RANGE":
+            matches = matches or av[0] <= 10 <= av[1]
+        elif name == "CATEGORY":
+            matches = matches or str(av) not in _NO_NEWLINE_CATEGORIES
+        else:
+            return True
+    return matches != negate
+
+
+def _items_line_local(items, flags: int) -> bool:
+    """True if no node in items can consume a newline or depends on a chunk edge"""
+    for op, av in items:
+        name = str(op)
+        if name == "LITERAL":
+            if av == 10:
+                return False
+        elif name == "NOT_LITERAL":
+            if av != 10:
+                return False
+        elif name == "ANY":
+            if flags & re.DOTALL:
+                return False
+        elif name == "IN":
+            if _set_matches_newline(av):
+                return False
+        elif name == "AT":
+            if str(av) in _EDGE_ANCHORS:
+                return False
+        elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            if not _items_line_local(av[2], flags):
+                return False
+        elif name == "SUBPATTERN":
+            if not _items_line_local(av[-1], flags):
+                return False
+        elif name in ("ASSERT", "ASSERT_NOT"):
+            if not _items_line_local(av[1], flags):
+                return False
+        elif name == "ATOMIC_GROUP":
+            if not _items_line_local(av, flags):
+                return False
+        elif name == "BRANCH":
+            if not all(_items_line_local(branch, flags) for branch in av[1]):
+                return False
+        elif name == "GROUPREF_EXISTS":
+            if not all(branch is None or _items_line_local(branch, flags) for branch in av[1:]):
+                return False
+        elif name != "GROUPREF":
+            return False
+    return True
+
+
+@lru_cache(maxsize=256)
+def is_line_local(source: str, flags: int) -> bool:
+    """True if findall over newline-aligned chunks equals findall over the whole text"""
+    try:
+        parsed = sre_parse.parse(source, flags)
+        return parsed.getwidth()[0] > 0 and _items_line_local(parsed, parsed.state.flags)
+    except Exception:
+        return False
+
+
+def _scan_texts(specs: Sequence[Tuple[str, int]], texts: Sequence[str]) -> List[List[list]]:
+    """findall of every pattern over a batch of texts (or chunks)"""
+    patterns = [re.compile(source, flags) for source, flags in specs]
+    return [[pattern.findall(text) for pattern in patterns] for text in texts]
+
+
+def _chunk_bounds(text: str, chunk_chars: int) -> List[Tuple[int, int]]:
+    """Chunks of about chunk_chars, each ending just after a newline (or at the end)"""
+    bounds, start = [], 0
+    while start < len(text):
+        newline = text.find("\n", start + chunk_chars - 1)
+        end = len(text) if newline == -1 else newline + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _serial(patterns: Sequence, texts: Sequence[str]) -> List[List[list]]:
+    return [[pattern.findall(text) for pattern in patterns] for text in texts]
+
+
+def findall_many(patterns: Sequence, texts: Sequence[str]) -> List[List[list]]:
+    """[[p.findall(t) for p in patterns] for t in texts], in parallel for large inputs"""
+    mode = active_mode()
+    total = sum(len(text) for text in texts)
+    if (mode == "serial" or total < _settings["min_chars"].get(mode, DEFAULT_MIN_CHARS["processes"])
+            or not all(isinstance(p, re.Pattern) for p in patterns)):
+        return _serial(patterns, texts)
+
+    specs = [(p.pattern, p.flags) for p in patterns]
+    local = [number for number, (source, flags) in enumerate(specs) if is_line_local(source, flags)]
+    whole = [number for number in range(len(specs)) if number not in local]
+    chunk_chars = _settings["chunk_chars"]
+    try:
+        pool = _get_pool(mode)
+        # (text index, pattern numbers, future returning one findall list per chunk and pattern)
+        jobs, batch, batch_chars = [], [], 0
+        for index, text in enumerate(texts):
+            if len(text) <= chunk_chars:
+                batch.append(index)
+                batch_chars += len(text)
+                if batch_chars >= chunk_chars:
+                    jobs.append((batch, None, pool.submit(_scan_texts, specs, [texts[i] for i in batch])))
+                    batch, batch_chars = [], 0
+                continue
+            if local:
+                chunks = [text[start:end] for start, end in _chunk_bounds(text, chunk_chars)]
+                jobs += [([index], local, pool.submit(_scan_texts, [specs[n] for n in local], [chunk]))
+                         for chunk in chunks]
+            jobs += [([index], [number], pool.submit(_scan_texts, [specs[number]], [text])) for number in whole]
+        if batch:
+            jobs.append((batch, None, pool.submit(_scan_texts, specs, [texts[i] for i in batch])))
+
+        results: List[List[list]] = [[[] for _ in patterns] for _ in texts]
+        for indices, numbers, future in jobs:
+            for index, per_pattern in zip(indices, future.result()):
+                for number, matches in zip(numbers or range(len(patterns)), per_pattern):
+                    results[index][number].extend(matches)
+        return results
+    except Exception as e:
+        logger.warning(f"Parallel extraction failed in {mode} mode ({e}); continuing serially")
+        _shutdown_pool()
+        _settings["enabled"] = False
+        return _serial(patterns, texts)
+
+
+def findall_patterns(patterns: Sequence, text: str) -> List[list]:
+    """[p.findall(text) for p in patterns], in parallel for large texts"""
+    return findall_many(patterns, [text])[0]
+
+
+def _bench(chars: int, mode: Optional[str]):
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import enhance_prompt
+
+    prompt = ("Refactor api/server.py and utils/config_loader.py, then call parse_config() "
+              "and def load_rows(path) from the data.pipeline module.\n" * (chars // 100 + 1))[:chars]
+    history = {"conversationHistory": [{"role": "user", "content": prompt[i:i + 2000]}
+                                       for i in range(0, len(prompt), 2000)]}
+    runs = {
+        "extract_file_references": lambda: enhance_prompt.extract_file_references(prompt),
+        "extract_function_names": lambda: enhance_prompt.extract_function_names(prompt),
+        "extract_technical_keywords": lambda: enhance_prompt.extract_technical_keywords(prompt),
+        "detect_functions_from_history": lambda: enhance_prompt.detect_functions_from_history(history),
+    }
+    # Through enhance_prompt: this file may be running as __main__, a separate module
+    enhance_prompt.configure_parallel_extraction({"mode": "serial"})
+    serial = {}
+    for name, run in runs.items():
+        start = time.perf_counter()
+        serial[name] = (run(), (time.perf_counter() - start) * 1000)
+    parallel_mode = mode or detect_runtime()
+    enhance_prompt.configure_parallel_extraction({"mode": parallel_mode, "min_chars": {parallel_mode: 0}})
+    print(f"{chars} chars, {parallel_mode} mode, {min(_settings['max_workers'], _cpu_count())} workers")
+    print(f"{'extractor':<32}{'serial':>10}{'cold':>10}{'warm':>10}  identical")
+    for name, run in runs.items():
+        timings, results = [], []
+        for _ in range(2):
+            start = time.perf_counter()
+            results.append(run())
+            timings.append((time.perf_counter() - start) * 1000)
+        identical = all(result == serial[name][0] for result in results)
+        print(f"{name:<32}{serial[name][1]:>8.1f}ms{timings[0]:>8.1f}ms{timings[1]:>8.1f}ms  {identical}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Parallel extraction runtime and benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("runtime", help="Show the detected parallel mode")
+    bench_parser = subparsers.add_parser("bench", help="Time serial vs. parallel extraction")
+    bench_parser.add_argument("--chars", type=int, default=2000000)
+    bench_parser.add_argument("--mode", choices=[m for m in MODES if m not in ("auto", "serial")])
+    args = parser.parse_args(argv)
+
+    if args.command == "runtime":
+        print(f"runtime={detect_runtime()} cpus={_cpu_count()} active={active_mode()}")
+        return 0
+    _bench(args.chars, args.mode)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
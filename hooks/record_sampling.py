@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Sampling of learning records with inverse-probability weights
+
+Every prompt writes a learning record (record_prompt_enhancement) and an
+interactions.log line. With learning.sampling enabled, each invocation is kept
+with probability p and both records carry sample_weight = 1/p. Weighted sums
+(interactions, chars, feedback counts) are then unbiased estimates of the
+unsampled totals, and ratios of weighted sums estimate rates.
+
+Policies:
+    fixed         keep with probability rate
+    rate_limited  keep about max_per_second records per second: p = max_per_second
+                  x the EWMA inter-arrival gap, shared across hook processes in
+                  analytics/sampling_state.json. The gap is known before the coin
+                  flip, so 1/p stays an unbiased weight under bursts
+    stratified    strata["ultra"] for ultra mode, else strata[complexity], else rate
+
+p never drops below min_rate, which bounds the weights (and their variance).
+
+Usage:
+    python3 record_sampling.py simulate [--policy stratified] [--count 20000] [--json]
+    python3 record_sampling.py state
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from file_utils import atomic_write_text, try_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = Path.home() / ".claude" / "prompt-enhancer-learning" / "analytics" / "sampling_state.json"
+POLICIES = ("fixed", "rate_limited", "stratified")
+LOCK_WAIT_MS = 10.0
+
+DEFAULT_STRATA = {"ultra": 1.0, "extreme": 1.0, "high": 0.5, "medium": 0.2, "low": 0.05}
+
+
+def get_sampling_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("learning", {}).get("sampling", {})
+    policy = section.get("policy", "fixed")
+    if policy not in POLICIES:
+        logger.warning(f"Unknown sampling policy {policy!r}, using fixed")
+        policy = "fixed"
+    return {
+        "enabled": bool(section.get("enabled", False)),
+        "policy": policy,
+        "rate": float(section.get("rate", 1.0)),
+        "max_per_second": float(section.get("max_per_second", 0.5)),
+        "ewma_alpha": float(section.get("ewma_alpha", 0.2)),
+        "strata": dict(section.get("strata", DEFAULT_STRATA)),
+        "min_rate": float(section.get("min_rate", 0.01)),
+        "state_path": Path(os.path.expanduser(section.get("state_path", str(DEFAULT_STATE_PATH)))),
+    }
+
+
+def stratum(metrics: Dict[str, Any]) -> str:
+    """Stratum of one invocation: "ultra", or its complexity level"""
+    return "ultra" if metrics.get("ultra_mode") else str(metrics.get("complexity", "unknown"))
+
+
+def _read_state(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def arrival_gap(path: Path, alpha: float, now: Optional[float] = None) -> Optional[float]:
+    """EWMA inter-arrival gap in seconds including this arrival (None for the first one)"""
+    now = time.time() if now is None else now
+    lock_handle = try_lock(path, LOCK_WAIT_MS)
+    try:
+        state = _read_state(path)
+        gap, last = state.get("gap_s"), state.get("last")
+        if isinstance(last, (int, float)):
+            observed = max(now - last, 0.0)
+            gap = observed if not isinstance(gap, (int, float)) else alpha * observed + (1 - alpha) * gap
+        if lock_handle is not None:
+            # Without the lock, use the shared estimate but leave updating it to the holder
+            atomic_write_text(path, json.dumps({"gap_s": gap, "last": now}))
+        return gap
+    finally:
+        if lock_handle is not None:
+            lock_handle.close()
+
+
+def inclusion_probability(settings: Dict[str, Any], metrics: Dict[str, Any],
+                          now: Optional[float] = None) -> float:
+    """Probability that this invocation's records are written under the configured policy"""
+    if not settings["enabled"]:
+        return 1.0
+    policy = settings["policy"]
+    if policy == "rate_limited":
+        gap = arrival_gap(settings["state_path"], settings["ewma_alpha"], now)
+        rate = 1.0 if gap is None else settings["max_per_second"] * gap
+    elif policy == "stratified":
+        rate = float(settings["strata"].get(stratum(metrics), settings["rate"]))
+    else:
+        rate = settings["rate"]
+    return min(1.0, max(settings["min_rate"], rate))
+
+
+def sample_weight(metrics: Dict[str, Any], config: Optional[Dict] = None,
+                  rng: Callable[[], float] = random.random) -> Optional[float]:
+    """1/p if this invocation's learning records should be written, None to skip them"""
+    p = inclusion_probability(get_sampling_settings(config), metrics)
+    if p >= 1.0:
+        return 1.0
+    return 1.0 / p if rng() < p else None
+
+
+def record_weight(record: Dict[str, Any]) -> float:
+    """Stored sample weight of a record (1 for records written before sampling existed)"""
+    try:
+        weight = float(record.get("sample_weight", 1) or 1)
+    except (TypeError, ValueError):
+        return 1
+    return int(weight) if weight.is_integer() else weight
+
+
+def simulate(config: Optional[Dict], count: int, seed: int = 0) -> Dict[str, Any]:
+    """Sample a synthetic traffic mix and compare weighted estimates with the true totals"""
+    rng = random.Random(seed)
+    mix = [("low", False, 0.55), ("medium", False, 0.25), ("high", False, 0.12),
+           ("extreme", False, 0.05), ("extreme", True, 0.03)]
+    settings = get_sampling_settings(config)
+    settings["enabled"] = True
+    now = 0.0
+    truth = {"interactions": 0, "prompt_chars": 0, "ultra": 0}
+    estimate = {"interactions": 0.0, "prompt_chars": 0.0, "ultra": 0.0}
+    variance = dict.fromkeys(estimate, 0.0)
+    written = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        settings["state_path"] = Path(tmp) / "sampling_state.json"
+        for _ in range(count):
+            # Poisson arrivals at ~2/s with a 10x burst every few minutes
+            now += rng.expovariate(20.0 if int(now) % 300 < 30 else 2.0)
+            complexity, ultra, _ = rng.choices(mix, weights=[m[2] for m in mix])[0]
+            metrics = {"complexity": complexity, "ultra_mode": ultra}
+            chars = int(rng.lognormvariate(5, 1))
+            truth["interactions"] += 1
+            truth["prompt_chars"] += chars
+            truth["ultra"] += ultra
+            p = inclusion_probability(settings, metrics, now)
+            if p >= 1.0 or rng.random() < p:
+                written += 1
+                for key, value in (("interactions", 1), ("prompt_chars", chars), ("ultra", ultra)):
+                    estimate[key] += value / p
+                    variance[key] += (1 - p) / (p * p) * value * value
+    return {
+        "policy": settings["policy"],
+        "count": count,
+        "written": written,
+        "written_share": written / count if count else 0.0,
+        "truth": truth,
+        "estimate": {key: round(value, 1) for key, value in estimate.items()},
+        "standard_error": {key: round(value ** 0.5, 1) for key, value in variance.items()},
+        "ultra_rate": {"truth": truth["ultra"] / max(truth["interactions"], 1),
+                       "estimate": estimate["ultra"] / max(estimate["interactions"], 1e-9)},
+    }
+
+
+def _load_config() -> Dict:
+    try:
+        from enhance_prompt import load_config
+        return load_config()
+    except ImportError:
+        return {}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Learning record sampling")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = subparsers.add_parser("simulate", help="Check the estimators on synthetic traffic")
+    simulate_parser.add_argument("--policy", choices=POLICIES)
+    simulate_parser.add_argument("--rate", type=float)
+    simulate_parser.add_argument("--count", type=int, default=20000)
+    simulate_parser.add_argument("--seed", type=int, default=0)
+    simulate_parser.add_argument("--json", action="store_true")
+
+    subparsers.add_parser("state", help="Show the shared arrival-rate estimate")
+
+    args = parser.parse_args(argv)
+    config = _load_config()
+
+    if args.command == "state":
+        settings = get_sampling_settings(config)
+        state = _read_state(settings["state_path"])
+        gap = state.get("gap_s")
+        print(json.dumps(dict(state, arrivals_per_second=(1.0 / gap) if gap else None,
+                              policy=settings["policy"], enabled=settings["enabled"]), indent=2))
+        return 0
+
+    section = config.setdefault("learning", {}).setdefault("sampling", {})
+    if args.policy:
+        section["policy"] = args.policy
+    if args.rate is not None:
+        section["rate"] = args.rate
+    result = simulate(config, args.count, args.seed)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print(f"{result['policy']}: wrote {result['written']}/{result['count']} records "
+          f"({result['written_share']:.1%})")
+    for key, true_value in result["truth"].items():
+        print(f"  {key:<13} true {true_value:>10}  estimated {result['estimate'][key]:>12.1f}"
+              f" ± {result['standard_error'][key]:.1f}")
+    print(f"  ultra rate    true {result['ultra_rate']['truth']:>10.4f}  "
+          f"estimated {result['ultra_rate']['estimate']:>12.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Background scheduler for learning maintenance
+
+Runs, outside the prompt hook's critical path:
+1. Rollup regeneration - incremental aggregation of analytics/interactions.log
+   from the last processed byte offset into analytics/rollup.json, with each
+   record scaled by its sample_weight (record_sampling.py)
+2. Template refinement - AdaptiveTemplateRefiner.run_refinement_cycle(), with
+   refined templates published atomically to refined_templates/<name>.txt,
+   which load_template() prefers over the shipped templates
+3. Learning cleanup - once a day, drops interactions older than
+   learning.cleanup_old_data_days from interactions.log (once the rollup has caught
+   up), and, independently of that log, runs HistoricalLearning.cleanup_old_data and
+   prunes enhancement store records (and their unreferenced blobs) of the same age
+4. Columnar export - appends new interactions to the day-partitioned export
+   (columnar_export.py), when analytics.columnar_export.enabled is set
+
+Each cycle respects a wall-clock and CPU budget and holds a lock file so that
+concurrent schedulers (thread + cron) never overlap.
+
+Usage:
+    python3 refinement_scheduler.py run [--budget-ms 2000]
+    python3 refinement_scheduler.py daemon [--interval 900]
+    python3 refinement_scheduler.py cron-line [--interval 900]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from file_utils import atomic_write_text, locked, try_lock
+
+logger = logging.getLogger(__name__)
+
+try:
+    from record_sampling import record_weight
+except ImportError:
+    def record_weight(record): return float(record.get("sample_weight", 1) or 1)
+
+LEARNING_DIR = Path.home() / ".claude" / "prompt-enhancer-learning"
+
+DEFAULT_INTERVAL_SECONDS = 900
+DEFAULT_BUDGET_MS = 2000
+DEFAULT_CPU_BUDGET_MS = 1000
+CLEANUP_INTERVAL_SECONDS = 24 * 3600
+
+
+def lower_priority(whole_process: bool = False):
+    """Lower scheduling priority of the current thread (Linux) or process"""
+    try:
+        if whole_process:
+            os.nice(10)
+        elif hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+            # On Linux, PRIO_PROCESS with a thread id only affects that thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (OSError, AttributeError):
+        pass
+
+
+class CycleBudget:
+    """Wall-clock and CPU time budget for one maintenance cycle"""
+
+    def __init__(self, budget_ms: float, cpu_budget_ms: float):
+        self.deadline = time.monotonic() + budget_ms / 1000.0
+        self.cpu_deadline = time.process_time() + cpu_budget_ms / 1000.0
+
+    def exhausted(self) -> bool:
+        return time.monotonic() >= self.deadline or time.process_time() >= self.cpu_deadline
+
+
+class RefinementScheduler:
+    """Runs refinement cycles, learning cleanup and rollup regeneration incrementally"""
+
+    def __init__(self, config: Optional[Dict] = None, learning_dir: Path = LEARNING_DIR):
+        self.config = config or {}
+        self.learning_dir = learning_dir
+        self.analytics_dir = learning_dir / "analytics"
+        self.refined_dir = learning_dir / "refined_templates"
+        self.state_file = learning_dir / "scheduler_state.json"
+        self.lock_path = learning_dir / "scheduler"  # locked as scheduler.lock
+
+        scheduler_config = self.config.get("learning", {}).get("scheduler", {})
+        self.budget_ms = scheduler_config.get("budget_ms", DEFAULT_BUDGET_MS)
+        self.cpu_budget_ms = scheduler_config.get("cpu_budget_ms", DEFAULT_CPU_BUDGET_MS)
+        self.interval_seconds = scheduler_config.get("interval_seconds", DEFAULT_INTERVAL_SECONDS)
+        self.cleanup_days = self.config.get("learning", {}).get("cleanup_old_data_days", 30)
+
+    def load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"interactions_offset": 0, "last_cycle": None, "last_cleanup": None,
+                    "last_learning_cleanup": None}
+
+    def save_state(self, state: Dict[str, Any]):
+        atomic_write_text(self.state_file, json.dumps(state, indent=2), durable=True)
+
+    def run_cycle(self, budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        """Run one budgeted maintenance cycle and return a summary"""
+        budget = CycleBudget(budget_ms or self.budget_ms, self.cpu_budget_ms)
+        summary = {"ran": False, "rollup_lines": 0, "published_templates": [], "cleaned": 0,
+                   "learning_cleanup": False, "pruned_enhancements": 0, "pruned_configs": 0,
+                   "exported_rows": 0, "skipped": []}
+
+        # Non-blocking: a second scheduler (thread + cron) skips instead of queueing
+        lock_handle = try_lock(self.lock_path)
+        if lock_handle is None:
+            summary["skipped"].append("another cycle is running")
+            return summary
+
+        with lock_handle:
+            summary["ran"] = True
+            state = self.load_state()
+
+            summary["rollup_lines"] = self.update_rollup(state, budget)
+
+            if budget.exhausted():
+                summary["skipped"].append("export: budget exhausted")
+            else:
+                summary["exported_rows"] = self.export_columnar()
+
+            if budget.exhausted():
+                summary["skipped"].append("refinement: budget exhausted")
+            else:
+                summary["published_templates"] = self.run_refinement()
+
+            now = time.time()
+            if budget.exhausted():
+                summary["skipped"].append("cleanup: budget exhausted")
+            else:
+                if now - (state.get("last_cleanup") or 0) >= CLEANUP_INTERVAL_SECONDS:
+                    summary["cleaned"] = self.cleanup(state)
+                if now - (state.get("last_learning_cleanup") or 0) >= CLEANUP_INTERVAL_SECONDS:
+                    summary["pruned_enhancements"] = self.cleanup_learning_data(state)
+                    summary["pruned_configs"] = self.prune_config_cache()
+                    summary["learning_cleanup"] = True
+
+            state["last_cycle"] = time.time()
+            self.save_state(state)
+
+        logger.info(f"Refinement cycle: {summary}")
+        return summary
+
+    def update_rollup(self, state: Dict[str, Any], budget: CycleBudget) -> int:
+        """Fold interactions appended since the last cycle into analytics/rollup.json"""
+        log_file = self.analytics_dir / "interactions.log"
+        if not log_file.exists():
+            return 0
+
+        offset = state.get("interactions_offset", 0)
+        if offset > log_file.stat().st_size:
+            # Log was truncated or replaced outside the scheduler
+            offset = 0
+
+        rollup_file = self.analytics_dir / "rollup.json"
+        try:
+            with open(rollup_file, "r") as f:
+                rollup = json.load(f)
+        except (OSError, ValueError):
+            rollup = {"days": {}, "totals": {}}
+
+        processed = 0
+        with open(log_file, "rb") as f:
+            f.seek(offset)
+            while not budget.exhausted():
+                line = f.readline()
+                if not line or not line.endswith(b"\n"):
+                    # EOF, or a record still being appended
+                    break
+                offset = f.tell()
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                _fold_record(rollup, record)
+                processed += 1
+
+        if processed:
+            atomic_write_text(rollup_file, json.dumps(rollup, indent=2, sort_keys=True), durable=True)
+        state["interactions_offset"] = offset
+        return processed
+
+    def export_columnar(self) -> int:
+        """Export interactions appended since the last export (before cleanup can drop them)"""
+        try:
+            from columnar_export import export_interactions, get_export_settings
+        except ImportError:
+            return 0
+        settings = get_export_settings(self.config)
+        if not settings["enabled"]:
+            return 0
+        if not self.config.get("learning", {}).get("interaction_log", {}).get("enabled", False):
+            logger.warning("analytics.columnar_export is enabled but learning.interaction_log is not; "
+                           "no new interactions will be exported")
+        summary = export_interactions(self.learning_dir, settings["directory"], settings["format"],
+                                      max_rows=settings["rows_per_part"])
+        return summary["rows"]
+
+    def run_refinement(self) -> List[str]:
+        """Run AdaptiveTemplateRefiner and publish refined templates atomically"""
+        if not self.config.get("learning", {}).get("adaptive_refinement_enabled", True):
+            return []
+
+        try:
+            from adaptive_template_refiner import AdaptiveTemplateRefiner
+            from historical_learning import HistoricalLearning
+        except ImportError:
+            logger.info("Adaptive template refiner not installed; skipping refinement")
+            return []
+
+        refiner = AdaptiveTemplateRefiner(HistoricalLearning(self.config), self.config)
+        refinements = refiner.run_refinement_cycle() or []
+
+        published = []
+        for refinement in refinements:
+            # Refinements carrying full template text are published; others are advisory
+            if not isinstance(refinement, dict):
+                continue
+            name = str(refinement.get("template", ""))
+            content = refinement.get("content")
+            if not content or not name.replace("_", "").isalnum():
+                continue
+            atomic_write_text(self.refined_dir / f"{name}.txt", content, durable=True)
+            published.append(name)
+        return published
+
+    def cleanup(self, state: Dict[str, Any]) -> int:
+        """Drop interactions older than cleanup_old_data_days from interactions.log
+
+        last_cleanup only advances when the log was compacted or had nothing to
+        drop; while the rollup lags behind, the next cycle tries again.
+        """
+        log_file = self.analytics_dir / "interactions.log"
+        if not log_file.exists():
+            state["last_cleanup"] = time.time()
+            return 0
+        if state.get("interactions_offset", 0) < log_file.stat().st_size:
+            # Only compact once everything has been rolled up
+            return 0
+
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.cleanup_days)).isoformat()
+        kept, dropped = [], 0
+        with open(log_file, "rb") as f:
+            for line in f:
+                try:
+                    if json.loads(line).get("timestamp", "") < cutoff:
+                        dropped += 1
+                        continue
+                except ValueError:
+                    pass
+                kept.append(line)
+            read_size = f.tell()
+
+        if not dropped:
+            state["last_cleanup"] = time.time()
+            return 0
+
+        # Appenders hold the same lock shared (IntegrationManager.record_interaction), so no
+        # line can land in the old file between reading its tail and replacing it
+        with locked(Path(str(log_file) + ".lock")):
+            with open(log_file, "rb") as f:
+                # Preserve anything appended while we were filtering
+                f.seek(read_size)
+                kept.append(f.read())
+            atomic_write_text(log_file, b"".join(kept).decode("utf-8", "replace"), durable=True)
+            state["interactions_offset"] = log_file.stat().st_size
+        state["last_cleanup"] = time.time()
+        return dropped
+
+    def cleanup_learning_data(self, state: Dict[str, Any]) -> int:
+        """Age out learning-system data and enhancement records; returns the pruned record count"""
+        state["last_learning_cleanup"] = time.time()
+        learning_system_cleanup = _learning_system_cleanup(self.config)
+        if learning_system_cleanup:
+            try:
+                learning_system_cleanup(self.cleanup_days)
+            except Exception as e:
+                logger.warning(f"Learning system cleanup failed: {e}")
+        return self.prune_enhancements()
+
+    def prune_enhancements(self) -> int:
+        """Drop enhancement store records older than cleanup_old_data_days"""
+        try:
+            from enhancement_store import EnhancementStore
+        except ImportError:
+            return 0
+        if not (self.learning_dir / "enhancements").exists():
+            return 0
+        return EnhancementStore(self.learning_dir).prune(self.cleanup_days)["records"]
+
+    def prune_config_cache(self) -> int:
+        """Drop per-directory config cache files unused for cleanup_old_data_days"""
+        try:
+            from config_overlays import prune_cache
+        except ImportError:
+            return 0
+        return prune_cache(self.cleanup_days, self.learning_dir / "config_cache")
+
+
+def _learning_system_cleanup(config: Dict):
+    """Return HistoricalLearning's cleanup hook, if the installed version has one"""
+    try:
+        from historical_learning import HistoricalLearning
+    except ImportError:
+        return None
+    return getattr(HistoricalLearning(config), "cleanup_old_data", None)
+
+
+def _fold_record(rollup: Dict[str, Any], record: Dict[str, Any]):
+    """Add one interaction record, scaled by its sample weight, to the per-day and total aggregates"""
+    day = str(record.get("timestamp", ""))[:10] or "unknown"
+    weight = record_weight(record)
+    for bucket in (rollup["days"].setdefault(day, {}), rollup["totals"]):
+        bucket["records"] = bucket.get("records", 0) + 1
+        bucket["interactions"] = bucket.get("interactions", 0) + weight
+        bucket["prompt_chars"] = (bucket.get("prompt_chars", 0)
+                                  + weight * int(record.get("prompt_length", 0) or 0))
+        bucket["enhancement_chars"] = (bucket.get("enhancement_chars", 0)
+                                       + weight * int(record.get("enhancement_length", 0) or 0))
+        feedback = record.get("user_feedback")
+        if feedback:
+            counts = bucket.setdefault("feedback", {})
+            counts[str(feedback)] = counts.get(str(feedback), 0) + weight
+
+
+# Background thread management (for long-lived processes)
+_scheduler_thread: Optional[threading.Thread] = None
+_scheduler_stop = threading.Event()
+
+
+def start_background_scheduler(config: Optional[Dict] = None,
+                               interval_seconds: Optional[float] = None) -> threading.Thread:
+    """Start (once) a low-priority daemon thread that runs cycles every interval"""
+    global _scheduler_thread
+    if _scheduler_thread is not None and _scheduler_thread.is_alive():
+        return _scheduler_thread
+
+    scheduler = RefinementScheduler(config)
+    interval = interval_seconds or scheduler.interval_seconds
+    _scheduler_stop.clear()
+
+    def _loop():
+        lower_priority()
+        while not _scheduler_stop.wait(interval):
+            try:
+                scheduler.run_cycle()
+            except Exception as e:
+                logger.warning(f"Refinement cycle failed: {e}")
+
+    _scheduler_thread = threading.Thread(target=_loop, name="refinement-scheduler", daemon=True)
+    _scheduler_thread.start()
+    return _scheduler_thread
+
+
+def stop_background_scheduler(timeout: float = 5.0):
+    """Signal the daemon thread to stop and wait for the current cycle"""
+    _scheduler_stop.set()
+    if _scheduler_thread is not None:
+        _scheduler_thread.join(timeout)
+
+
+def _load_config() -> Dict:
+    try:
+        from enhance_prompt import load_config
+        return load_config()
+    except ImportError:
+        return {}
+
+
+def cron_schedule(interval_seconds: int) -> Optional[str]:
+    """Crontab time fields for an interval (rounded down to whole minutes or hours); None above a day"""
+    if interval_seconds < 3600:
+        return f"*/{max(1, interval_seconds // 60)} * * * *"
+    if interval_seconds < 24 * 3600:
+        # Minute steps only go up to 59; longer intervals step the hour field instead
+        return f"0 */{interval_seconds // 3600} * * *"
+    if interval_seconds == 24 * 3600:
+        return "0 0 * * *"
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prompt enhancer learning maintenance scheduler")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run one cycle (for cron)")
+    run_parser.add_argument("--budget-ms", type=float, default=None)
+
+    daemon_parser = subparsers.add_parser("daemon", help="Run cycles forever in the foreground")
+    daemon_parser.add_argument("--interval", type=float, default=None)
+
+    cron_parser = subparsers.add_parser("cron-line", help="Print a crontab entry")
+    cron_parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL_SECONDS)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "cron-line":
+        schedule = cron_schedule(args.interval)
+        if schedule is None:
+            parser.error("cron-line supports intervals up to one day (86400 seconds)")
+        print(f"{schedule} {sys.executable} {Path(__file__).resolve()} run >/dev/null 2>&1")
+        return 0
+
+    lower_priority(whole_process=True)
+    scheduler = RefinementScheduler(_load_config())
+
+    if args.command == "run":
+        print(json.dumps(scheduler.run_cycle(args.budget_ms), indent=2))
+        return 0
+
+    interval = args.interval or scheduler.interval_seconds
+    try:
+        while True:
+            scheduler.run_cycle()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
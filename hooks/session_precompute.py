@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Speculative per-session precomputation from non-prompt hook events
+
+Registered for SessionStart, PostToolUse and Stop, this entry point runs
+while the user is idle or reading. It analyses the session's recent conversation
+(read incrementally by transcript_reader.py) and persists the results:
+- technology stack and project-type indicators found in the history
+- function names mentioned in the history (detect_functions_from_history)
+- conversation patterns (message count, technical depth)
+- the enabled enrichment templates, rendered against the current config
+SessionStart also starts the workspace index build for the session's cwd.
+
+The UserPromptSubmit hook loads this state through load_session_state(). It
+then only analyses the new prompt text and merges in the precomputed state.
+Rendered templates are only reused while the config digest still matches.
+
+Hook command (reads the hook payload on stdin, prints nothing, always exits 0):
+    python3 ~/.claude/hooks/session_precompute.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from file_utils import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DIR = Path.home() / ".claude" / "prompt-enhancer-sessions"
+TEMPLATE_NAMES = ("design_guidance", "excellence_criteria", "tool_preferences", "workspace_methodology")
+_FORMAT_VERSION = 1
+
+
+def get_session_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("performance", {}).get("session_precompute", {})
+    return {
+        "enabled": bool(section.get("enabled", False)),
+        "directory": Path(os.path.expanduser(section.get("directory", str(DEFAULT_SESSION_DIR)))),
+        "max_age_seconds": float(section.get("max_age_seconds", 86400)),
+        "min_interval_seconds": float(section.get("min_interval_seconds", 5)),
+        "retention_days": float(section.get("retention_days", 7)),
+    }
+
+
+def config_digest(config: Dict) -> str:
+    return hashlib.blake2b(json.dumps(config, sort_keys=True, default=str).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+def session_file(directory: Path, session_id: str) -> Optional[Path]:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(session_id))[:128].lstrip(".")
+    return directory / f"{safe_id}.json" if safe_id else None
+
+
+def session_history(payload: Dict, config: Dict) -> List[Dict[str, str]]:
+    """Recent conversation history from the transcript, falling back to the payload itself"""
+    from transcript_reader import attach_transcript_history
+    history = attach_transcript_history(payload, config).get("conversationHistory", [])
+    return [m for m in history if isinstance(m, dict)] if isinstance(history, list) else []
+
+
+def build_session_state(payload: Dict, config: Dict) -> Dict[str, Any]:
+    """Run the history analysers and pre-render templates for one session"""
+    import enhance_prompt
+
+    history = session_history(payload, config)
+    history_input = {"conversationHistory": history}
+    history_text = " ".join(m.get("content", "") for m in history)
+
+    templates = {}
+    layers = config.get("enrichment", {}).get("layers", {})
+    for name in TEMPLATE_NAMES:
+        if layers.get(name, True):
+            content = enhance_prompt.load_template(name, config)
+            if content:
+                templates[name] = content
+
+    return {
+        "version": _FORMAT_VERSION,
+        "session_id": payload.get("session_id"),
+        "event": payload.get("hook_event_name", "unknown"),
+        "updated_at": time.time(),
+        "history_messages": len(history),
+        "technology_stack": enhance_prompt.technology_stack_hits(history_text),
+        "project_type_hits": enhance_prompt.project_type_hits(history_text),
+        "history_functions": enhance_prompt.detect_functions_from_history(history_input),
+        "conversation_patterns": enhance_prompt.analyze_conversation_patterns(history_input),
+        "config_digest": config_digest(config),
+        "templates": templates,
+    }
+
+
+def _write_state(path: Path, state: Dict):
+    atomic_write_text(path, json.dumps(state))
+
+
+def cleanup_sessions(directory: Path, retention_days: float) -> int:
+    """Remove session state files not updated within retention_days"""
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+    for path in directory.glob("*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def _warm_workspace_index(cwd: Optional[str], config: Dict):
+    """Start building the workspace index before the first prompt needs it"""
+    try:
+        from workspace_index import ensure_index, get_index_settings
+    except ImportError:
+        return
+    if cwd and get_index_settings(config)["enabled"] and os.path.isdir(cwd):
+        index = ensure_index(cwd, config)
+        if index is not None:
+            index.close()
+
+
+def precompute_session(payload: Dict, config: Dict) -> Optional[Dict]:
+    """Refresh the session's state file unless it was refreshed moments ago"""
+    settings = get_session_settings(config)
+    if not settings["enabled"] or not payload.get("session_id"):
+        return None
+
+    path = session_file(settings["directory"], payload["session_id"])
+    if path is None:
+        return None
+    if payload.get("hook_event_name") == "SessionStart":
+        cleanup_sessions(settings["directory"], settings["retention_days"])
+        _warm_workspace_index(payload.get("cwd"), config)
+    elif path.exists() and time.time() - path.stat().st_mtime < settings["min_interval_seconds"]:
+        return None
+
+    state = build_session_state(payload, config)
+    _write_state(path, state)
+    return state
+
+
+def load_session_state(input_data: Dict, config: Dict) -> Optional[Dict]:
+    """Precomputed state for the prompt's session, or None if absent or stale"""
+    settings = get_session_settings(config)
+    session_id = input_data.get("session_id") if isinstance(input_data, dict) else None
+    if not settings["enabled"] or not session_id:
+        return None
+
+    path = session_file(settings["directory"], session_id)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError, TypeError):
+        return None
+
+    if state.get("version") != _FORMAT_VERSION or time.time() - state.get("updated_at", 0) > settings["max_age_seconds"]:
+        return None
+    if state.get("config_digest") != config_digest(config):
+        state["templates"] = {}
+    return state
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    try:
+        payload = json.loads(sys.stdin.read() or "{}")
+        import enhance_prompt
+        config = enhance_prompt.load_config(payload.get("cwd"))
+        enhance_prompt.configure_parallel_extraction(config.get("performance", {}).get("parallel_extraction", {}))
+        precompute_session(payload, config)
+    except Exception as e:
+        # Never interfere with the session: this hook is purely speculative
+        logger.warning(f"Session precompute failed: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Opt-in capture of raw hook payloads for record-and-replay
+
+When enabled, main() appends each incoming payload (after redaction) to a
+gzip capture file. Each append is its own gzip member, so the file stays
+readable while it is being written and concurrent hooks only need a short lock.
+replay_traffic.py runs a capture through two pipelines and compares them.
+
+Redaction replaces every match of the configured regexes in any string value
+with [REDACTED] and drops the configured top-level fields entirely.
+
+Usage:
+    python3 traffic_capture.py info [--path capture.jsonl.gz]
+    python3 traffic_capture.py show [--limit 5]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from file_utils import locked
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPTURE_PATH = Path.home() / ".claude" / "prompt-enhancer-captures" / "capture.jsonl.gz"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+REDACTED = "[REDACTED]"
+
+DEFAULT_REDACT_PATTERNS = [
+    r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b",                           # email addresses
+    r"\b(?:sk|pk|rk)-[A-Za-z0-9_-]{16,}\b",                    # API keys (sk-..., pk-...)
+    r"\bAKIA[0-9A-Z]{16}\b",                                   # AWS access key ids
+    r"\bgh[pousr]_[A-Za-z0-9]{30,}\b",                         # GitHub tokens
+    r"(?i)\bbearer\s+[A-Za-z0-9._~+/-]{16,}=*",                # bearer tokens
+    r"(?i)\b(?:password|passwd|secret|token)\s*[:=]\s*\S+",    # key=value secrets
+]
+
+
+def get_capture_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    """Resolve capture settings; CLAUDE_ENHANCER_CAPTURE=1/0 overrides the config flag"""
+    section = (config or {}).get("analytics", {}).get("capture", {})
+    settings = {
+        "enabled": bool(section.get("enabled", False)),
+        "path": Path(os.path.expanduser(section.get("path", str(DEFAULT_CAPTURE_PATH)))),
+        "max_bytes": int(section.get("max_bytes", DEFAULT_MAX_BYTES)),
+        "redact_patterns": section.get("redact_patterns", DEFAULT_REDACT_PATTERNS),
+        "drop_fields": section.get("drop_fields", []),
+    }
+
+    env_value = os.environ.get("CLAUDE_ENHANCER_CAPTURE", "").strip().lower()
+    if env_value in ("1", "true", "yes", "on"):
+        settings["enabled"] = True
+    elif env_value in ("0", "false", "no", "off"):
+        settings["enabled"] = False
+
+    env_path = os.environ.get("CLAUDE_ENHANCER_CAPTURE_PATH")
+    if env_path:
+        settings["path"] = Path(os.path.expanduser(env_path))
+    return settings
+
+
+_compiled_patterns: Dict[tuple, List[re.Pattern]] = {}
+
+
+def _patterns(sources: List[str]) -> List[re.Pattern]:
+    key = tuple(sources)
+    if key not in _compiled_patterns:
+        compiled = []
+        for source in sources:
+            try:
+                compiled.append(re.compile(source))
+            except re.error as e:
+                logger.warning(f"Ignoring invalid redaction pattern {source!r}: {e}")
+        _compiled_patterns[key] = compiled
+    return _compiled_patterns[key]
+
+
+def redact(value: Any, patterns: List[re.Pattern]) -> Any:
+    """Apply redaction patterns to every string inside value"""
+    if isinstance(value, str):
+        for pattern in patterns:
+            value = pattern.sub(REDACTED, value)
+        return value
+    if isinstance(value, dict):
+        return {key: redact(item, patterns) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item, patterns) for item in value]
+    return value
+
+
+def redact_text(text: str, config: Optional[Dict] = None) -> str:
+    """text with the configured capture redaction patterns applied"""
+    return redact(text, _patterns(get_capture_settings(config)["redact_patterns"]))
+
+
+def _rotate(path: Path, max_bytes: int):
+    try:
+        if path.stat().st_size >= max_bytes:
+            os.replace(str(path), str(path.with_name(path.name + ".1")))
+    except FileNotFoundError:
+        pass
+
+
+def capture_payload(input_data: Dict, config: Dict) -> bool:
+    """Append one redacted payload to the capture file if capture is enabled"""
+    settings = get_capture_settings(config)
+    if not settings["enabled"] or not isinstance(input_data, dict):
+        return False
+
+    payload = {k: v for k, v in input_data.items() if k not in settings["drop_fields"]}
+    record = {"ts": round(time.time(), 3),
+              "payload": redact(payload, _patterns(settings["redact_patterns"]))}
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    path = settings["path"]
+    with locked(Path(str(path) + ".lock")):
+        _rotate(path, settings["max_bytes"])
+        # One gzip member per record: appends never rewrite earlier data
+        with open(path, "ab") as f:
+            f.write(gzip.compress(line, compresslevel=6))
+    return True
+
+
+def read_capture(path: Path) -> Iterator[Dict]:
+    """Yield captured records; a truncated trailing member is ignored"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping unreadable capture record")
+        except (EOFError, OSError) as e:
+            logger.warning(f"Capture file ends with a truncated record: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect hook traffic captures")
+    parser.add_argument("--path", type=Path, default=DEFAULT_CAPTURE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Record count, time range and size")
+    show_parser = subparsers.add_parser("show", help="Print captured prompts")
+    show_parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    records = list(read_capture(args.path))
+    if args.command == "info":
+        timestamps = [r.get("ts", 0) for r in records]
+        print(f"{args.path}: {len(records)} records, {args.path.stat().st_size} bytes")
+        if timestamps:
+            print(f"From {time.ctime(min(timestamps))} to {time.ctime(max(timestamps))}")
+    else:
+        for record in records[-args.limit:]:
+            prompt = str(record.get("payload", {}).get("prompt", ""))
+            print(f"{time.ctime(record.get('ts', 0))}  {len(prompt):>7} chars  {prompt[:80]!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
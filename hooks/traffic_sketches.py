@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory streaming sketches for prompt and keyword analytics
+
+Fed from analyze_prompt_context() output on each enhancement:
+- Count-Min sketch + per-category top-k candidates for heavy hitters
+  (technical keywords, file extensions, domains, ultra triggers)
+- HyperLogLog for distinct prompts and distinct referenced files
+- Reservoir samples per complexity level: by default only metadata of each
+  sampled prompt (length, word count, short hash); with sketches.excerpts,
+  160-char excerpts passed through traffic_capture's redaction patterns
+
+State lives in one small binary file whose size is fixed by the sketch
+parameters (candidate lists and reservoirs are capped), and sketches from
+several machines can be merged because all hashing is deterministic. With
+excerpts off, excerpts already in a sketch (or merged in from another one)
+are replaced by their metadata on the next update.
+
+Usage:
+    python3 traffic_sketches.py top [--category keywords] [-k 10]
+    python3 traffic_sketches.py cardinality
+    python3 traffic_sketches.py samples [--level high]
+    python3 traffic_sketches.py merge other.sketch [more.sketch ...] [--output merged.sketch]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_utils import atomic_write_bytes, try_lock
+
+logger = logging.getLogger(__name__)
+
+try:
+    from traffic_capture import redact_text
+    REDACTION_AVAILABLE = True
+except ImportError:
+    REDACTION_AVAILABLE = False
+
+DEFAULT_SKETCH_PATH = Path.home() / ".claude" / "prompt-enhancer-learning" / "analytics" / "traffic.sketch"
+
+CATEGORIES = ("keywords", "extensions", "domains", "ultra_triggers")
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+HLL_PRECISION = 12
+TOP_CANDIDATES = 32
+RESERVOIR_SIZE = 8
+EXCERPT_CHARS = 160
+
+_MAGIC = b"PESK"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHHHI")
+
+
+def prompt_metadata(text: str) -> Dict[str, Any]:
+    """What a reservoir keeps of a prompt when excerpts are off"""
+    normalized = " ".join(text.split())
+    return {"chars": len(text), "words": len(normalized.split()),
+            "hash": hashlib.blake2b(normalized.encode("utf-8", "surrogatepass"), digest_size=6).hexdigest()}
+
+
+def sample_item(prompt: str, config: Optional[Dict] = None) -> Any:
+    """Reservoir entry for a prompt: a redacted excerpt if enabled, else its metadata"""
+    settings = (config or {}).get("analytics", {}).get("sketches", {})
+    if settings.get("excerpts", False) and REDACTION_AVAILABLE:
+        return redact_text(" ".join(prompt.split()), config)[:EXCERPT_CHARS]
+    return prompt_metadata(prompt)
+
+
+def _hash64(key: str, salt: bytes = b"") -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=8,
+                                          salt=salt).digest(), "little")
+
+
+class CountMinSketch:
+    """Count-Min sketch with conservative update over uint32 counters"""
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = array("I", bytes(4 * width * depth))
+
+    def _cells(self, key: str) -> List[int]:
+        h = _hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        cells = self._cells(key)
+        target = min(self.counters[c] for c in cells) + count
+        for c in cells:
+            if self.counters[c] < target:
+                self.counters[c] = min(target, 0xFFFFFFFF)
+        return target
+
+    def estimate(self, key: str) -> int:
+        return min(self.counters[c] for c in self._cells(key))
+
+    def merge(self, other: "CountMinSketch"):
+        for i, value in enumerate(other.counters):
+            self.counters[i] = min(self.counters[i] + value, 0xFFFFFFFF)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**precision one-byte registers"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key: str):
+        h = _hash64(key, salt=b"hll")
+        index = h >> (64 - self.precision)
+        remaining = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 1
+        while rank <= 64 - self.precision and not remaining & (1 << 63):
+            rank += 1
+            remaining <<= 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def cardinality(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog"):
+        for i, value in enumerate(other.registers):
+            if value > self.registers[i]:
+                self.registers[i] = value
+
+
+class TrafficSketch:
+    """All traffic sketches plus their bounded side state"""
+
+    def __init__(self):
+        self.cms = CountMinSketch()
+        self.distinct_prompts = HyperLogLog()
+        self.distinct_files = HyperLogLog()
+        self.candidates: Dict[str, Dict[str, int]] = {c: {} for c in CATEGORIES}
+        self.reservoirs: Dict[str, Dict[str, Any]] = {}
+        self.total = 0
+
+    def _add_heavy_hitter(self, category: str, item: str):
+        estimate = self.cms.add(f"{category}:{item}")
+        candidates = self.candidates.setdefault(category, {})
+        if item in candidates or len(candidates) < TOP_CANDIDATES:
+            candidates[item] = estimate
+            return
+        weakest = min(candidates, key=candidates.get)
+        if estimate > candidates[weakest]:
+            del candidates[weakest]
+            candidates[item] = estimate
+
+    def _sample(self, level: str, item: Any, rng: random.Random):
+        reservoir = self.reservoirs.setdefault(level, {"seen": 0, "items": []})
+        reservoir["seen"] += 1
+        if len(reservoir["items"]) < RESERVOIR_SIZE:
+            reservoir["items"].append(item)
+        else:
+            slot = rng.randrange(reservoir["seen"])
+            if slot < RESERVOIR_SIZE:
+                reservoir["items"][slot] = item
+
+    def scrub_excerpts(self) -> int:
+        """Replace stored excerpts by their metadata; returns how many were replaced"""
+        replaced = 0
+        for reservoir in self.reservoirs.values():
+            for index, item in enumerate(reservoir["items"]):
+                if isinstance(item, str):
+                    reservoir["items"][index] = prompt_metadata(item)
+                    replaced += 1
+        return replaced
+
+    def record(self, prompt: str, context: Dict, rng: Optional[random.Random] = None,
+               config: Optional[Dict] = None):
+        """Fold one analysed prompt into the sketches"""
+        rng = rng or random.Random()
+        self.total += 1
+        self.distinct_prompts.add(prompt)
+
+        for keyword in context.get("technical_keywords", []):
+            self._add_heavy_hitter("keywords", str(keyword).lower())
+        for file_ref in context.get("file_references", []):
+            file_ref = str(file_ref)
+            self.distinct_files.add(file_ref)
+            self._add_heavy_hitter("extensions", file_ref.rsplit(".", 1)[-1].lower())
+        for domain in context.get("domain_specific", []):
+            self._add_heavy_hitter("domains", str(domain))
+        for trigger in context.get("ultra_mode_triggers", []):
+            self._add_heavy_hitter("ultra_triggers", str(trigger))
+
+        level = context.get("complexity_indicators", {}).get("level", "unknown")
+        self._sample(level, sample_item(prompt, config), rng)
+
+    def top(self, category: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Heavy hitters of a category, re-estimated from the Count-Min sketch"""
+        items = [(item, self.cms.estimate(f"{category}:{item}"))
+                 for item in self.candidates.get(category, {})]
+        return sorted(items, key=lambda pair: (-pair[1], pair[0]))[:k]
+
+    def cardinalities(self) -> Dict[str, int]:
+        return {"prompts": self.distinct_prompts.cardinality(),
+                "files": self.distinct_files.cardinality(),
+                "total_prompts": self.total}
+
+    def merge(self, other: "TrafficSketch", rng: Optional[random.Random] = None):
+        """Merge another machine's sketch into this one"""
+        rng = rng or random.Random()
+        self.cms.merge(other.cms)
+        self.distinct_prompts.merge(other.distinct_prompts)
+        self.distinct_files.merge(other.distinct_files)
+        self.total += other.total
+
+        for category in CATEGORIES:
+            merged = set(self.candidates.get(category, {})) | set(other.candidates.get(category, {}))
+            ranked = sorted(((item, self.cms.estimate(f"{category}:{item}")) for item in merged),
+                            key=lambda pair: -pair[1])[:TOP_CANDIDATES]
+            self.candidates[category] = dict(ranked)
+
+        for level, theirs in other.reservoirs.items():
+            ours = self.reservoirs.setdefault(level, {"seen": 0, "items": []})
+            # Draw each slot from either side in proportion to how many prompts it saw
+            pool_a, pool_b = list(ours["items"]), list(theirs["items"])
+            seen_a, seen_b = ours["seen"], theirs["seen"]
+            merged_items = []
+            while len(merged_items) < RESERVOIR_SIZE and (pool_a or pool_b):
+                take_a = pool_a and (not pool_b or rng.random() < seen_a / max(seen_a + seen_b, 1))
+                source = pool_a if take_a else pool_b
+                merged_items.append(source.pop(rng.randrange(len(source))))
+            ours["items"] = merged_items
+            ours["seen"] = seen_a + seen_b
+
+    def to_bytes(self) -> bytes:
+        side = json.dumps({"total": self.total, "candidates": self.candidates,
+                           "reservoirs": self.reservoirs}, separators=(",", ":")).encode("utf-8")
+        return b"".join([
+            _HEADER.pack(_MAGIC, _FORMAT_VERSION, self.cms.width, self.cms.depth,
+                         self.distinct_prompts.precision, len(side)),
+            self.cms.counters.tobytes(),
+            bytes(self.distinct_prompts.registers),
+            bytes(self.distinct_files.registers),
+            side,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TrafficSketch":
+        magic, version, width, depth, precision, side_len = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("Not a traffic sketch file")
+        if (width, depth, precision) != (CMS_WIDTH, CMS_DEPTH, HLL_PRECISION):
+            raise ValueError("Sketch parameters differ; cannot load or merge")
+
+        sketch = cls()
+        offset = _HEADER.size
+        cms_bytes = 4 * width * depth
+        sketch.cms.counters = array("I", data[offset:offset + cms_bytes])
+        offset += cms_bytes
+        registers = 1 << precision
+        sketch.distinct_prompts.registers = bytearray(data[offset:offset + registers])
+        offset += registers
+        sketch.distinct_files.registers = bytearray(data[offset:offset + registers])
+        offset += registers
+        side = json.loads(data[offset:offset + side_len].decode("utf-8"))
+        sketch.total = side.get("total", 0)
+        sketch.candidates.update(side.get("candidates", {}))
+        sketch.reservoirs = side.get("reservoirs", {})
+        return sketch
+
+
+def load_sketch(path: Path = DEFAULT_SKETCH_PATH) -> TrafficSketch:
+    try:
+        return TrafficSketch.from_bytes(path.read_bytes())
+    except FileNotFoundError:
+        return TrafficSketch()
+
+
+def save_sketch(sketch: TrafficSketch, path: Path = DEFAULT_SKETCH_PATH):
+    """Atomically replace the sketch file"""
+    atomic_write_bytes(path, sketch.to_bytes())
+
+
+def record_traffic(prompt: str, context: Dict, config: Dict) -> bool:
+    """Update the persisted sketches with one enhancement (skipped if the lock is busy)"""
+    settings = config.get("analytics", {}).get("sketches", {})
+    if not settings.get("enabled", False):
+        return False
+
+    path = Path(os.path.expanduser(settings.get("path", str(DEFAULT_SKETCH_PATH))))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_handle = try_lock(path, settings.get("lock_wait_ms", 50))
+    if lock_handle is None:
+        logger.info("Traffic sketch busy; skipping update")
+        return False
+    try:
+        try:
+            sketch = load_sketch(path)
+        except ValueError as e:
+            logger.warning(f"Resetting unreadable traffic sketch: {e}")
+            sketch = TrafficSketch()
+        if not settings.get("excerpts", False):
+            sketch.scrub_excerpts()
+        sketch.record(prompt, context, config=config)
+        save_sketch(sketch, path)
+        return True
+    finally:
+        lock_handle.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prompt traffic sketch queries")
+    parser.add_argument("--path", type=Path, default=DEFAULT_SKETCH_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    top_parser = subparsers.add_parser("top", help="Heavy hitters per category")
+    top_parser.add_argument("--category", choices=CATEGORIES)
+    top_parser.add_argument("-k", type=int, default=10)
+
+    subparsers.add_parser("cardinality", help="Distinct prompts and files")
+
+    samples_parser = subparsers.add_parser("samples", help="Reservoir samples per complexity level")
+    samples_parser.add_argument("--level")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge sketch files from other machines")
+    merge_parser.add_argument("others", nargs="+", type=Path)
+    merge_parser.add_argument("--output", type=Path, help="Defaults to --path")
+
+    args = parser.parse_args(argv)
+    sketch = load_sketch(args.path)
+
+    if args.command == "top":
+        for category in [args.category] if args.category else CATEGORIES:
+            print(f"{category}:")
+            for item, count in sketch.top(category, args.k):
+                print(f"  {count:>8}  {item}")
+    elif args.command == "cardinality":
+        for name, value in sketch.cardinalities().items():
+            print(f"{name:<14} {value}")
+    elif args.command == "samples":
+        for level, reservoir in sorted(sketch.reservoirs.items()):
+            if args.level and level != args.level:
+                continue
+            print(f"{level} (seen {reservoir['seen']}):")
+            for item in reservoir["items"]:
+                if isinstance(item, dict):
+                    item = f"[{item.get('chars')} chars, {item.get('words')} words, #{item.get('hash')}]"
+                print(f"  - {item}")
+    elif args.command == "merge":
+        for other in args.others:
+            sketch.merge(load_sketch(other))
+        output = args.output or args.path
+        save_sketch(sketch, output)
+        print(f"Merged {len(args.others)} sketch(es) into {output} "
+              f"({output.stat().st_size} bytes, {sketch.total} prompts)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
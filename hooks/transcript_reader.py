@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Incremental memory-mapped reader for Claude Code transcript files
+
+Hook payloads carry a transcript_path to the session's JSONL transcript,
+which can grow to tens of MB. Rather than loading it whole, this reader:
+- memory-maps the file and scans backwards from the last complete line,
+  stopping after max_messages user/assistant messages or max_bytes
+- remembers the read offset, inode and recent message window per session,
+  so the next prompt maps only the lines appended since the previous one
+- starts a fresh tail scan when the file was replaced or truncated
+
+The resulting window is handed to the existing history analysers as
+conversationHistory.
+
+Usage:
+    python3 transcript_reader.py tail ~/.claude/projects/.../session.jsonl [--messages 20]
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_utils import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_DIR = Path.home() / ".claude" / "prompt-enhancer-sessions"
+DEFAULT_MAX_MESSAGES = 100
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+MAX_MESSAGE_CHARS = 8192  # per-message cap inside the persisted window
+_FORMAT_VERSION = 1
+
+
+def get_transcript_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("performance", {}).get("transcript", {})
+    return {
+        "enabled": bool(section.get("enabled", True)),
+        "max_messages": int(section.get("max_messages", DEFAULT_MAX_MESSAGES)),
+        "max_bytes": int(section.get("max_bytes", DEFAULT_MAX_BYTES)),
+        "state_dir": Path(os.path.expanduser(section.get("state_dir", str(DEFAULT_STATE_DIR)))),
+    }
+
+
+def message_text(content: Any) -> str:
+    """Text of a message content field (a string or a list of content blocks)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content
+                         if isinstance(block, dict) and block.get("type") == "text")
+    return ""
+
+
+def parse_line(line: bytes) -> Optional[Dict[str, str]]:
+    """A {role, content} message from one transcript line, or None"""
+    if not line.strip():
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    message = entry.get("message") if isinstance(entry, dict) else None
+    if not isinstance(message, dict) or message.get("role") not in ("user", "assistant"):
+        return None
+    text = message_text(message.get("content"))
+    return {"role": message["role"], "content": text[:MAX_MESSAGE_CHARS]} if text else None
+
+
+def scan_backwards(buffer, start: int, end: int, max_messages: int, max_bytes: int) -> List[Dict[str, str]]:
+    """Messages from complete lines in buffer[start:end], newest first, within the limits"""
+    messages = []
+    floor = max(start, end - max_bytes)
+    pos = end
+    while pos > floor and len(messages) < max_messages:
+        newline = buffer.rfind(b"\n", floor, pos - 1)
+        if newline < 0 and floor > start:
+            break  # the line at the byte budget boundary is incomplete
+        line_start = newline + 1 if newline >= 0 else start
+        message = parse_line(buffer[line_start:pos])
+        if message:
+            messages.append(message)
+        pos = line_start
+    return messages
+
+
+def scan_forward(buffer, start: int, end: int) -> List[Dict[str, str]]:
+    """Messages from the complete lines in buffer[start:end], oldest first"""
+    return [m for m in (parse_line(line) for line in buffer[start:end].split(b"\n")) if m]
+
+
+def read_tail(path: str, max_messages: int = DEFAULT_MAX_MESSAGES, max_bytes: int = DEFAULT_MAX_BYTES,
+              state: Optional[Dict] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Return (messages, new_state). With a state from a previous call on the
+    same file, only bytes appended after state["offset"] are read.
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return [], {"version": _FORMAT_VERSION, "path": path, "inode": stat.st_ino, "offset": 0, "messages": []}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            # Ignore a trailing line that is still being written
+            end = buffer.rfind(b"\n") + 1
+
+            incremental = (state and state.get("version") == _FORMAT_VERSION and state.get("path") == path
+                           and state.get("inode") == stat.st_ino and 0 <= state.get("offset", -1) <= end)
+            if incremental and end - state["offset"] <= max_bytes:
+                messages = list(state.get("messages", [])) + scan_forward(buffer, state["offset"], end)
+            else:
+                messages = scan_backwards(buffer, 0, end, max_messages, max_bytes)[::-1]
+
+    messages = messages[-max_messages:]
+    return messages, {"version": _FORMAT_VERSION, "path": path, "inode": stat.st_ino,
+                      "offset": end, "messages": messages}
+
+
+def _state_file(state_dir: Path, session_id: str) -> Path:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(session_id))[:128].lstrip(".") or "default"
+    return state_dir / f"{safe_id}.transcript.json"
+
+
+def read_session_history(session_id: Optional[str], transcript_path: str,
+                         config: Optional[Dict] = None) -> List[Dict[str, str]]:
+    """Recent transcript messages, reading incrementally when the session is known"""
+    settings = get_transcript_settings(config)
+    path = os.path.expanduser(transcript_path)
+    if not session_id:
+        return read_tail(path, settings["max_messages"], settings["max_bytes"])[0]
+
+    state_file = _state_file(settings["state_dir"], session_id)
+    try:
+        state = json.loads(state_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        state = None
+
+    messages, new_state = read_tail(path, settings["max_messages"], settings["max_bytes"], state)
+    if state is None or new_state["offset"] != state.get("offset"):
+        atomic_write_text(state_file, json.dumps(new_state))
+    return messages
+
+
+def attach_transcript_history(input_data: Dict, config: Dict) -> Dict:
+    """
+    Copy of input_data with conversationHistory filled from transcript_path,
+    unless the payload already carries a history or the reader is disabled.
+    """
+    if not isinstance(input_data, dict) or not input_data.get("transcript_path"):
+        return input_data
+    if any(input_data.get(key) for key in ("conversationHistory", "messages", "history")):
+        return input_data
+    if not get_transcript_settings(config)["enabled"]:
+        return input_data
+    if not os.path.exists(os.path.expanduser(input_data["transcript_path"])):
+        return input_data
+
+    history = read_session_history(input_data.get("session_id"), input_data["transcript_path"], config)
+    return dict(input_data, conversationHistory=history)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcript tail reader")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    tail_parser = subparsers.add_parser("tail", help="Print the last messages of a transcript")
+    tail_parser.add_argument("path")
+    tail_parser.add_argument("--messages", type=int, default=20)
+    tail_parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    args = parser.parse_args(argv)
+
+    messages, state = read_tail(os.path.expanduser(args.path), args.messages, args.max_bytes)
+    for message in messages:
+        print(f"[{message['role']}] {message['content'][:200]!r}")
+    print(f"\n{len(messages)} messages, offset {state['offset']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Incremental workspace file and symbol index, keyed by the repository root
+
+Grounds the file references and function names extracted from a prompt:
+"utils.py" resolves to "src/app/utils.py" and "parse_config()" to
+"src/config.py:42", so the model does not have to search for them.
+
+The workspace is the repository containing the hook's cwd: the nearest
+directory at or above it with a .git entry (config_overlays.repository_root),
+so every subdirectory of a repository shares one index. A cwd outside any
+repository ($HOME, /tmp, ...) is never indexed automatically.
+
+The index is one binary file per workspace, memory-mapped for queries:
+    header | paths blob | path offsets | path ids sorted by basename
+           | per-file (mtime_ns, size) | symbol names blob | symbols sorted by name
+A lookup is a binary search over the mapped arrays (O(log n)), so nothing is
+parsed or loaded up front, even for 100k-file monorepos.
+
+Updates never run inside the prompt hook. A stale or missing index starts a
+detached `workspace_index.py update` process. The update holds an exclusive
+lock on <index>.lock from start to finish, so a second updater for the same
+workspace exits at once, however long the first one takes; the hook does not
+spawn one while the lock is held, and spawns at most one per minute. The
+update walks the tree (skipping vendored and build directories) and
+re-extracts top-level symbols only for files whose mtime or size changed. It
+then atomically replaces the index file.
+
+Usage:
+    python3 workspace_index.py [--cwd .] update
+    python3 workspace_index.py [--cwd .] find utils.py
+    python3 workspace_index.py [--cwd .] symbol parse_config
+    python3 workspace_index.py [--cwd .] info
+"""
+
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_utils import atomic_write_bytes, try_lock
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config_overlays import repository_root
+except ImportError:
+    def repository_root(cwd):
+        for directory in [Path(cwd)] + list(Path(cwd).parents):
+            if os.path.lexists(directory / ".git"):
+                return directory
+        return None
+
+DEFAULT_INDEX_DIR = Path.home() / ".claude" / "prompt-enhancer-index"
+DEFAULT_MAX_FILES = 200000
+DEFAULT_REFRESH_SECONDS = 3600
+SPAWN_INTERVAL_SECONDS = 60
+MAX_SYMBOL_SCAN_BYTES = 256 * 1024
+DEFAULT_SKIP_DIRS = [".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+                     ".mypy_cache", ".pytest_cache", "dist", "build", "target", ".next", ".idea"]
+
+_MAGIC = b"PEWX"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHII9Q")
+_SYMBOL = struct.Struct("<IHBBII")   # name offset, name length, kind, pad, path id, line
+_META = struct.Struct("<QQ")         # mtime_ns, size
+
+SYMBOL_KINDS = ("function", "class", "variable", "type")
+
+# Top-level definitions per language: (pattern, kind); group 1 is the name
+_SYMBOL_PATTERNS = {
+    ".py": [(r"^(?:async\s+)?def\s+([A-Za-z_]\w*)", 0), (r"^class\s+([A-Za-z_]\w*)", 1)],
+    ".js": [(r"^(?:export\s+(?:default\s+)?)?(?:async\s+)?function\*?\s+([A-Za-z_$][\w$]*)", 0),
+            (r"^(?:export\s+(?:default\s+)?)?class\s+([A-Za-z_$][\w$]*)", 1),
+            (r"^(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)", 2)],
+    ".go": [(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)", 0), (r"^type\s+([A-Za-z_]\w*)", 3)],
+    ".rs": [(r"^(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn\s+([A-Za-z_]\w*)", 0),
+            (r"^(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait)\s+([A-Za-z_]\w*)", 3)],
+    ".java": [(r"^(?:public\s+|final\s+|abstract\s+)*(?:class|interface|enum|record)\s+([A-Za-z_]\w*)", 1)],
+    ".rb": [(r"^def\s+(?:self\.)?([A-Za-z_]\w*[?!]?)", 0), (r"^(?:class|module)\s+([A-Z]\w*)", 1)],
+    ".php": [(r"^function\s+([A-Za-z_]\w*)", 0), (r"^(?:abstract\s+|final\s+)?class\s+([A-Za-z_]\w*)", 1)],
+}
+for _alias, _lang in ((".jsx", ".js"), (".ts", ".js"), (".tsx", ".js"), (".mjs", ".js"), (".kt", ".java"),
+                      (".scala", ".java"), (".swift", ".java")):
+    _SYMBOL_PATTERNS[_alias] = _SYMBOL_PATTERNS[_lang]
+_COMPILED_PATTERNS: Dict[str, List[Tuple[re.Pattern, int]]] = {}
+
+
+def get_index_settings(config: Optional[Dict] = None) -> Dict[str, Any]:
+    section = (config or {}).get("performance", {}).get("workspace_index", {})
+    return {
+        "enabled": bool(section.get("enabled", False)),
+        "directory": Path(os.path.expanduser(section.get("directory", str(DEFAULT_INDEX_DIR)))),
+        "max_files": int(section.get("max_files", DEFAULT_MAX_FILES)),
+        "refresh_seconds": float(section.get("refresh_seconds", DEFAULT_REFRESH_SECONDS)),
+        "skip_dirs": list(section.get("skip_dirs", DEFAULT_SKIP_DIRS)),
+        "auto_update": bool(section.get("auto_update", True)),
+        "max_results": int(section.get("max_results", 3)),
+    }
+
+
+def index_path(cwd: str, directory: Path = DEFAULT_INDEX_DIR) -> Path:
+    root = os.path.realpath(os.path.expanduser(cwd))
+    return directory / f"{hashlib.blake2b(root.encode('utf-8'), digest_size=8).hexdigest()}.idx"
+
+
+def extract_symbols(path: str, suffix: str) -> List[Tuple[str, int, int]]:
+    """Top-level (name, kind, line) definitions in a source file"""
+    if suffix not in _SYMBOL_PATTERNS:
+        return []
+    if suffix not in _COMPILED_PATTERNS:
+        _COMPILED_PATTERNS[suffix] = [(re.compile(p), kind) for p, kind in _SYMBOL_PATTERNS[suffix]]
+    patterns = _COMPILED_PATTERNS[suffix]
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read(MAX_SYMBOL_SCAN_BYTES)
+    except OSError:
+        return []
+    symbols = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line or line[0] in " \t#/*":
+            continue
+        for pattern, kind in patterns:
+            match = pattern.match(line)
+            if match:
+                symbols.append((match.group(1), kind, number))
+                break
+    return symbols
+
+
+class WorkspaceIndex:
+    """Read-only view over a memory-mapped index file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = _HEADER.unpack_from(self._buffer, 0)
+        if fields[0] != _MAGIC or fields[1] != _FORMAT_VERSION:
+            raise ValueError(f"not a workspace index (version {fields[1]})")
+        (_, _, _, self.n_files, self.n_symbols, self.built_at, self._paths_off, self._paths_len,
+         self._offsets_off, self._by_name_off, self._meta_off, self._names_off, self._names_len,
+         self._symbols_off) = fields
+        self._root_len = self._buffer[_HEADER.size:self._paths_off].find(b"\0")
+        self.root = self._buffer[_HEADER.size:_HEADER.size + self._root_len].decode("utf-8")
+
+    def close(self):
+        self._buffer.close()
+
+    def file_path(self, path_id: int) -> str:
+        start, end = struct.unpack_from("<II", self._buffer, self._offsets_off + 4 * path_id)
+        return self._buffer[self._paths_off + start:self._paths_off + end].decode("utf-8")
+
+    def _basename_at(self, rank: int) -> str:
+        path_id = struct.unpack_from("<I", self._buffer, self._by_name_off + 4 * rank)[0]
+        return self.file_path(path_id).rsplit("/", 1)[-1]
+
+    def file_meta(self, path_id: int) -> Tuple[int, int]:
+        return _META.unpack_from(self._buffer, self._meta_off + _META.size * path_id)
+
+    def _symbol(self, rank: int) -> Tuple[str, int, int, int]:
+        name_off, name_len, kind, _, path_id, line = _SYMBOL.unpack_from(
+            self._buffer, self._symbols_off + _SYMBOL.size * rank)
+        start = self._names_off + name_off
+        return self._buffer[start:start + name_len].decode("utf-8"), kind, path_id, line
+
+    def _lower_bound(self, count: int, key_at, key: str) -> int:
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_file(self, reference: str, limit: int = 3) -> List[str]:
+        """Indexed paths equal to, or ending in, reference (shortest first)"""
+        reference = reference.strip()
+        if reference.startswith("./"):
+            reference = reference[2:]
+        basename = reference.rsplit("/", 1)[-1]
+        rank = self._lower_bound(self.n_files, self._basename_at, basename)
+        matches = []
+        while rank < self.n_files and self._basename_at(rank) == basename:
+            path_id = struct.unpack_from("<I", self._buffer, self._by_name_off + 4 * rank)[0]
+            path = self.file_path(path_id)
+            if path == reference or path.endswith("/" + reference):
+                matches.append(path)
+            rank += 1
+        return sorted(matches, key=lambda p: (p.count("/"), p))[:limit]
+
+    def find_symbol(self, name: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """Top-level definitions named name"""
+        rank = self._lower_bound(self.n_symbols, lambda r: self._symbol(r)[0], name)
+        matches = []
+        while rank < self.n_symbols and len(matches) < limit:
+            symbol, kind, path_id, line = self._symbol(rank)
+            if symbol != name:
+                break
+            matches.append({"path": self.file_path(path_id), "line": line, "kind": SYMBOL_KINDS[kind]})
+            rank += 1
+        return matches
+
+    def files(self) -> Dict[str, Tuple[int, int]]:
+        return {self.file_path(i): self.file_meta(i) for i in range(self.n_files)}
+
+    def symbols_by_file(self) -> Dict[str, List[Tuple[str, int, int]]]:
+        result: Dict[str, List[Tuple[str, int, int]]] = {}
+        for rank in range(self.n_symbols):
+            name, kind, path_id, line = self._symbol(rank)
+            result.setdefault(self.file_path(path_id), []).append((name, kind, line))
+        return result
+
+
+def write_index(path: Path, root: str, files: Dict[str, Tuple[int, int]],
+                symbols: Dict[str, List[Tuple[str, int, int]]]):
+    """Serialize files {relpath: (mtime_ns, size)} and symbols {relpath: [(name, kind, line)]}"""
+    paths = sorted(files)
+    path_ids = {p: i for i, p in enumerate(paths)}
+    encoded = [p.encode("utf-8") for p in paths]
+
+    offsets = array("I", [0])
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    by_name = array("I", sorted(range(len(paths)), key=lambda i: (paths[i].rsplit("/", 1)[-1], paths[i])))
+    meta = b"".join(_META.pack(*files[p]) for p in paths)
+
+    entries = sorted((name, path_ids[p], line, kind) for p, defs in symbols.items() if p in path_ids
+                     for name, kind, line in defs)
+    names, name_offsets, symbol_table = bytearray(), {}, bytearray()
+    for name, path_id, line, kind in entries:
+        raw = name.encode("utf-8")[:65535]
+        if name not in name_offsets:
+            name_offsets[name] = len(names)
+            names += raw
+        symbol_table += _SYMBOL.pack(name_offsets[name], len(raw), kind, 0, path_id, line)
+
+    root_raw = root.encode("utf-8") + b"\0"
+    paths_off = _HEADER.size + len(root_raw)
+    paths_blob = b"".join(encoded)
+    offsets_off = paths_off + len(paths_blob)
+    by_name_off = offsets_off + 4 * len(offsets)
+    meta_off = by_name_off + 4 * len(by_name)
+    names_off = meta_off + len(meta)
+    symbols_off = names_off + len(names)
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, 0, len(paths), len(entries), int(time.time()),
+                          paths_off, len(paths_blob), offsets_off, by_name_off, meta_off,
+                          names_off, len(names), symbols_off)
+
+    atomic_write_bytes(path, (header, root_raw, paths_blob, offsets.tobytes(), by_name.tobytes(), meta,
+                              bytes(names), bytes(symbol_table)))
+
+
+def scan_workspace(root: str, skip_dirs: List[str], max_files: int) -> Dict[str, Tuple[int, int]]:
+    """Walk root and return {relpath: (mtime_ns, size)} for regular files"""
+    files: Dict[str, Tuple[int, int]] = {}
+    skip = set(skip_dirs)
+    stack = [""]
+    while stack and len(files) < max_files:
+        relative_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative_dir) if relative_dir else root)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                relative = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip:
+                            stack.append(relative)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files[relative] = (stat.st_mtime_ns, stat.st_size)
+                        if len(files) >= max_files:
+                            break
+                except OSError:
+                    continue
+    return files
+
+
+def update_index(cwd: str, config: Optional[Dict] = None) -> Dict[str, int]:
+    """Build or incrementally refresh the index for cwd"""
+    settings = get_index_settings(config)
+    root = os.path.realpath(os.path.expanduser(cwd))
+    path = index_path(root, settings["directory"])
+
+    previous_files: Dict[str, Tuple[int, int]] = {}
+    previous_symbols: Dict[str, List[Tuple[str, int, int]]] = {}
+    if path.exists():
+        try:
+            previous = WorkspaceIndex(path)
+            previous_files, previous_symbols = previous.files(), previous.symbols_by_file()
+            previous.close()
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Rebuilding unreadable workspace index: {e}")
+
+    files = scan_workspace(root, settings["skip_dirs"], settings["max_files"])
+    symbols, reparsed = {}, 0
+    for relative, meta in files.items():
+        if previous_files.get(relative) == meta and relative in previous_symbols:
+            symbols[relative] = previous_symbols[relative]
+            continue
+        suffix = os.path.splitext(relative)[1].lower()
+        if suffix in _SYMBOL_PATTERNS and meta[1] > 0:
+            reparsed += 1
+            found = extract_symbols(os.path.join(root, relative), suffix)
+            if found:
+                symbols[relative] = found
+
+    write_index(path, root, files, symbols)
+    return {"files": len(files), "reparsed": reparsed,
+            "removed": len(set(previous_files) - set(files)),
+            "symbols": sum(len(v) for v in symbols.values())}
+
+
+def workspace_root(cwd: str) -> Optional[str]:
+    """Repository root containing cwd (the index key), or None outside a repository"""
+    root = repository_root(os.path.realpath(os.path.expanduser(cwd)))
+    return str(root) if root is not None else None
+
+
+def _spawn_update(cwd: str, settings: Dict[str, Any]):
+    """Start a detached updater unless one is running or was started in the last minute"""
+    path = index_path(cwd, settings["directory"])
+    lock_handle = try_lock(path)
+    if lock_handle is None:
+        return
+    lock_handle.close()
+    # Only throttles spawning (e.g. an updater that keeps failing); the lock does the exclusion
+    marker = path.with_suffix(".spawned")
+    try:
+        if time.time() - marker.stat().st_mtime < SPAWN_INTERVAL_SECONDS:
+            return
+    except FileNotFoundError:
+        pass
+    marker.touch()
+    # Run as a module: under the zipapp __file__ is inside enhance_prompt.pyz, which
+    # zipimport can load from PYTHONPATH but which cannot be executed as a script
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [module_dir, os.path.dirname(module_dir)] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+    subprocess.Popen([sys.executable, "-m", "workspace_index", "--cwd", cwd, "update"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     env=env, start_new_session=True, close_fds=True)
+
+
+def ensure_index(cwd: str, config: Optional[Dict] = None) -> Optional[WorkspaceIndex]:
+    """Open the index for cwd, scheduling a background refresh when missing or stale"""
+    settings = get_index_settings(config)
+    path = index_path(cwd, settings["directory"])
+    index = None
+    try:
+        index = WorkspaceIndex(path)
+    except (OSError, ValueError, struct.error):
+        pass
+
+    stale = index is None or time.time() - index.built_at > settings["refresh_seconds"]
+    if stale and settings["auto_update"]:
+        try:
+            _spawn_update(cwd, settings)
+        except OSError as e:
+            logger.warning(f"Could not start workspace index update: {e}")
+    return index
+
+
+def resolve_references(cwd: Optional[str], file_references: List[str], function_names: List[str],
+                       config: Optional[Dict] = None) -> Dict[str, Any]:
+    """Map extracted file references and function names to indexed locations (paths relative to the repository root)"""
+    settings = get_index_settings(config)
+    if not settings["enabled"] or not cwd or not os.path.isdir(os.path.expanduser(cwd)):
+        return {}
+    root = workspace_root(cwd)
+    if root is None:
+        return {}
+    index = ensure_index(root, config)
+    if index is None:
+        return {}
+    try:
+        files = {ref: found for ref in file_references
+                 if (found := index.find_file(ref, settings["max_results"]))}
+        symbols = {name: found for name in function_names
+                   if (found := index.find_symbol(name, settings["max_results"]))}
+    finally:
+        index.close()
+    return {"files": files, "symbols": symbols} if files or symbols else {}
+
+
+def format_resolved_references(resolved: Dict[str, Any]) -> str:
+    """One-line summary of resolved references for the evaluation wrapper"""
+    parts = [f"{ref} → {', '.join(paths)}" for ref, paths in resolved.get("files", {}).items()]
+    for name, matches in resolved.get("symbols", {}).items():
+        locations = ", ".join(f"{m['path']}:{m['line']}" for m in matches)
+        parts.append(f"{name}() → {locations}")
+    return "; ".join(parts)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Workspace file and symbol index")
+    parser.add_argument("--cwd", default=os.getcwd(),
+                        help="Any directory in the workspace; indexed from its repository root, else as given")
+    parser.add_argument("--index-dir", type=Path, help="Defaults to the configured directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("update", help="Build or incrementally refresh the index")
+    find_parser = subparsers.add_parser("find", help="Resolve a file reference")
+    find_parser.add_argument("reference")
+    symbol_parser = subparsers.add_parser("symbol", help="Resolve a top-level symbol")
+    symbol_parser.add_argument("name")
+    subparsers.add_parser("info", help="Index size and age")
+    args = parser.parse_args(argv)
+
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from enhance_prompt import load_config
+        config = load_config()
+    except ImportError:
+        config = {}
+    if args.index_dir:
+        config = {"performance": {"workspace_index": dict(
+            config.get("performance", {}).get("workspace_index", {}), directory=str(args.index_dir))}}
+    root = workspace_root(args.cwd) or args.cwd
+    path = index_path(root, get_index_settings(config)["directory"])
+
+    if args.command == "update":
+        lock_handle = try_lock(path)
+        if lock_handle is None:
+            print(f"Another update of {root} is running")
+            return 0
+        start = time.perf_counter()
+        try:
+            result = update_index(root, config)
+        finally:
+            lock_handle.close()
+        print(f"Indexed {result['files']} files, {result['symbols']} symbols "
+              f"({result['reparsed']} reparsed, {result['removed']} removed) "
+              f"in {(time.perf_counter() - start) * 1000:.0f}ms -> {path}")
+        return 0
+
+    index = WorkspaceIndex(path)
+    if args.command == "find":
+        for match in index.find_file(args.reference, limit=20):
+            print(match)
+    elif args.command == "symbol":
+        for match in index.find_symbol(args.name, limit=20):
+            print(f"{match['path']}:{match['line']}  {match['kind']}")
+    else:
+        print(f"{index.root}: {index.n_files} files, {index.n_symbols} symbols, "
+              f"{path.stat().st_size} bytes, built {time.ctime(index.built_at)}")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
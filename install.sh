@@ -48,6 +48,7 @@ chmod +x "$CLAUDE_DIR/hooks/enhance_prompt_wrapper.sh"
 echo "   • Installing optimized configuration with ToT + Reflection..."
 mkdir -p "$CLAUDE_DIR/hooks/config"
 cp "$SCRIPT_DIR/hooks/config/default_config.json" "$CLAUDE_DIR/hooks/config/"
+cp "$SCRIPT_DIR/hooks/config/dedup_plan.json" "$CLAUDE_DIR/hooks/config/"
 
 # Copy templates
 echo "   • Installing enhanced templates..."
@@ -57,6 +58,90 @@ cp -r "$SCRIPT_DIR/hooks/templates/" "$CLAUDE_DIR/hooks/"
 echo "   • Installing integration manager..."
 cp "$SCRIPT_DIR/integration_manager.py" "$CLAUDE_DIR/hooks/"
 
+# Copy profiling support
+echo "   • Installing hook profiler..."
+cp "$SCRIPT_DIR/hooks/hook_profiler.py" "$CLAUDE_DIR/hooks/"
+
+# Copy bounded cache layer
+echo "   • Installing memory-bounded caches..."
+cp "$SCRIPT_DIR/hooks/bounded_cache.py" "$CLAUDE_DIR/hooks/"
+
+# Copy shared lock and atomic-write helpers
+echo "   • Installing file helpers..."
+cp "$SCRIPT_DIR/hooks/file_utils.py" "$CLAUDE_DIR/hooks/"
+
+# Copy background refinement scheduler
+echo "   • Installing refinement scheduler..."
+cp "$SCRIPT_DIR/hooks/refinement_scheduler.py" "$CLAUDE_DIR/hooks/"
+
+# Copy enrichment layer providers
+echo "   • Installing parallel layer providers..."
+cp "$SCRIPT_DIR/hooks/layer_providers.py" "$CLAUDE_DIR/hooks/"
+
+# Copy traffic analytics sketches
+echo "   • Installing traffic sketches..."
+cp "$SCRIPT_DIR/hooks/traffic_sketches.py" "$CLAUDE_DIR/hooks/"
+
+# Copy latency histograms
+echo "   • Installing latency histograms..."
+cp "$SCRIPT_DIR/hooks/latency_histograms.py" "$CLAUDE_DIR/hooks/"
+
+# Copy traffic capture recorder
+echo "   • Installing traffic capture..."
+cp "$SCRIPT_DIR/hooks/traffic_capture.py" "$CLAUDE_DIR/hooks/"
+
+# Copy session precompute entry point (SessionStart/PostToolUse/Stop hooks)
+echo "   • Installing session precompute hook..."
+cp "$SCRIPT_DIR/hooks/session_precompute.py" "$CLAUDE_DIR/hooks/"
+
+# Copy transcript tail reader
+echo "   • Installing transcript reader..."
+cp "$SCRIPT_DIR/hooks/transcript_reader.py" "$CLAUDE_DIR/hooks/"
+
+# Copy deduplicated enhancement store
+echo "   • Installing enhancement store..."
+cp "$SCRIPT_DIR/hooks/enhancement_store.py" "$CLAUDE_DIR/hooks/"
+
+# Copy workspace file and symbol index
+echo "   • Installing workspace index..."
+cp "$SCRIPT_DIR/hooks/workspace_index.py" "$CLAUDE_DIR/hooks/"
+
+# Copy columnar interaction export
+echo "   • Installing columnar export..."
+cp "$SCRIPT_DIR/hooks/columnar_export.py" "$CLAUDE_DIR/hooks/"
+
+# Copy matcher backends
+echo "   • Installing matcher backends..."
+cp "$SCRIPT_DIR/hooks/matcher_backends.py" "$CLAUDE_DIR/hooks/"
+
+# Copy parallel extraction
+echo "   • Installing parallel extraction..."
+cp "$SCRIPT_DIR/hooks/parallel_extraction.py" "$CLAUDE_DIR/hooks/"
+
+# Copy cross-layer directive dedup
+echo "   • Installing directive dedup..."
+cp "$SCRIPT_DIR/hooks/directive_dedup.py" "$CLAUDE_DIR/hooks/"
+
+# Copy learning record sampling
+echo "   • Installing record sampling..."
+cp "$SCRIPT_DIR/hooks/record_sampling.py" "$CLAUDE_DIR/hooks/"
+
+# Copy per-project config overlays
+echo "   • Installing project config overlays..."
+cp "$SCRIPT_DIR/hooks/config_overlays.py" "$CLAUDE_DIR/hooks/"
+
+# Copy trivial-prompt fast path
+echo "   • Installing fast path..."
+cp "$SCRIPT_DIR/hooks/fast_path.py" "$CLAUDE_DIR/hooks/"
+
+# Build self-contained zipapp launched directly by the wrapper
+echo "   • Building zipapp launcher..."
+if python3 "$SCRIPT_DIR/build_zipapp.py" build --output "$CLAUDE_DIR/hooks/enhance_prompt.pyz" >/dev/null; then
+    echo "     ✓ enhance_prompt.pyz built"
+else
+    echo "     ⚠️  Zipapp build failed, wrapper will run the source hook"
+fi
+
 # Clean up old duplicate files
 if [ -f "$CLAUDE_DIR/hooks/enhance-prompt.py" ]; then
     echo "   • Removing old duplicate file..."
@@ -11,12 +11,25 @@ Connects the optimized core with:
 
 import json
 import logging
+import re
 from pathlib import Path
 from typing import Dict, Any, Optional
 import datetime
 
 logger = logging.getLogger(__name__)
 
+try:
+    from enhancement_store import store_enhancement
+    ENHANCEMENT_STORE_AVAILABLE = True
+except ImportError:
+    ENHANCEMENT_STORE_AVAILABLE = False
+
+try:
+    from matcher_backends import compile_learned_pattern
+    MATCHER_BACKENDS_AVAILABLE = True
+except ImportError:
+    MATCHER_BACKENDS_AVAILABLE = False
+
 class IntegrationManager:
     """Manages integration between optimized core and learning components"""
 
@@ -24,17 +37,41 @@ class IntegrationManager:
         self.claude_dir = Path.home() / ".claude"
         self.learning_dir = self.claude_dir / "prompt-enhancer-learning"
         self.config_dir = self.claude_dir / "hooks" / "config"
+        self._pattern_matchers: Dict[str, Any] = {}
 
-    def load_patterns(self) -> Dict[str, Any]:
-        """Load learning patterns from the learning system"""
+    def load_patterns(self, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Load learning patterns and validate/compile their pattern_regex entries
+
+        Matchers are built with performance.matcher from config (the hook's merged
+        config), falling back to default_config.json.
+        """
         patterns_file = self.learning_dir / "patterns.json"
         try:
             with open(patterns_file, 'r') as f:
-                return json.load(f)
+                patterns = json.load(f)
         except Exception as e:
             logger.warning(f"Could not load patterns: {e}")
             return {}
 
+        if config is None:
+            config = self.get_config()
+        matcher_config = config.get("performance", {}).get("matcher", {})
+        for pattern_data in patterns.values():
+            regex = pattern_data.get("pattern_regex") if isinstance(pattern_data, dict) else None
+            if regex and regex not in self._pattern_matchers:
+                self._pattern_matchers[regex] = self._compile_pattern(regex, matcher_config)
+        return patterns
+
+    @staticmethod
+    def _compile_pattern(regex: str, matcher_config: Dict[str, Any]):
+        """Compiled matcher for a learned pattern, or None if it is invalid or unsafe"""
+        if MATCHER_BACKENDS_AVAILABLE:
+            return compile_learned_pattern(regex, matcher_config)
+        try:
+            return re.compile(regex, re.IGNORECASE)
+        except (re.error, TypeError):
+            return None
+
     def load_success_metrics(self) -> Dict[str, Any]:
         """Load success metrics from the learning system"""
         metrics_file = self.learning_dir / "success_metrics.json"
@@ -55,9 +92,10 @@ class IntegrationManager:
             logger.error(f"Could not load config: {e}")
             return {}
 
-    def enhance_with_learning(self, base_enhancement: str, prompt: str) -> str:
+    def enhance_with_learning(self, base_enhancement: str, prompt: str,
+                              config: Optional[Dict[str, Any]] = None) -> str:
         """Enhance the base enhancement with learning insights"""
-        patterns = self.load_patterns()
+        patterns = self.load_patterns(config)
         metrics = self.load_success_metrics()
 
         # Add pattern-based insights
@@ -81,17 +119,18 @@ class IntegrationManager:
 
         for pattern_id, pattern_data in patterns.items():
             if pattern_data.get("pattern_regex"):
-                import re
-                try:
-                    if re.search(pattern_data["pattern_regex"], prompt_lower, re.IGNORECASE):
-                        confidence = pattern_data.get("confidence_threshold", 0.7)
-                        success_rate = pattern_data.get("success_rate", 0.0)
-                        insights.append(
-                            f"• Pattern detected: {pattern_id} "
-                            f"(confidence: {confidence:.1%}, success_rate: {success_rate:.1%})"
-                        )
-                except re.error:
-                    continue
+                # Compiled (and checked for catastrophic backtracking) by load_patterns
+                regex = pattern_data["pattern_regex"]
+                if regex not in self._pattern_matchers:
+                    self._pattern_matchers[regex] = self._compile_pattern(regex, {})
+                matcher = self._pattern_matchers[regex]
+                if matcher is not None and matcher.search(prompt_lower):
+                    confidence = pattern_data.get("confidence_threshold", 0.7)
+                    success_rate = pattern_data.get("success_rate", 0.0)
+                    insights.append(
+                        f"• Pattern detected: {pattern_id} "
+                        f"(confidence: {confidence:.1%}, success_rate: {success_rate:.1%})"
+                    )
 
         return "\n".join(insights) if insights else ""
 
@@ -108,8 +147,14 @@ class IntegrationManager:
         return "\n".join(guidance) if guidance else ""
 
     def record_interaction(self, prompt: str, enhancement: str,
-                          user_feedback: Optional[str] = None):
-        """Record interaction for learning"""
+                          user_feedback: Optional[str] = None,
+                          metrics: Optional[Dict[str, Any]] = None,
+                          config: Optional[Dict[str, Any]] = None):
+        """Record interaction for learning (metrics: context analysis and stage_ms timings)
+
+        config is the hook's merged config (defaults, user config and project
+        overlays); without it only default_config.json is consulted.
+        """
         try:
             interaction_data = {
                 "timestamp": datetime.datetime.now().isoformat(),
@@ -117,15 +162,35 @@ class IntegrationManager:
                 "enhancement_length": len(enhancement),
                 "user_feedback": user_feedback
             }
+            if metrics:
+                interaction_data.update({k: v for k, v in metrics.items() if k not in interaction_data})
+
+            # Keep the output itself as a deduplicated, compressed reference (unless the
+            # hook already stored it for the learning record)
+            if config is None:
+                config = self.get_config()
+            store_config = config.get("learning", {}).get("enhancement_store", {})
+            if (ENHANCEMENT_STORE_AVAILABLE and enhancement and store_config.get("enabled", True)
+                    and "enhancement_ref" not in interaction_data):
+                record_id = store_enhancement(enhancement, self.learning_dir)
+                if record_id:
+                    interaction_data["enhancement_ref"] = record_id
 
             # Store in learning system
             analytics_dir = self.learning_dir / "analytics"
             analytics_dir.mkdir(exist_ok=True)
 
-            # Simple rolling log
+            # Simple rolling log. Appenders share interactions.log.lock; the refinement
+            # scheduler's cleanup takes it exclusively while it swaps in the compacted log
             log_file = analytics_dir / "interactions.log"
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(interaction_data) + "\n")
+            with open(str(log_file) + ".lock", "a") as lock_handle:
+                try:
+                    import fcntl
+                    fcntl.flock(lock_handle, fcntl.LOCK_SH)
+                except ImportError:
+                    pass
+                with open(log_file, 'a') as f:
+                    f.write(json.dumps(interaction_data) + "\n")
 
         except Exception as e:
             logger.warning(f"Could not record interaction: {e}")
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Adversarial performance fuzzer for the prompt analysis extractors
+
+Searches for inputs that maximise wall-clock time per input byte in:
+- extract_file_references, extract_function_names, escape_prompt (prompt text)
+- detect_functions_from_history (conversation history payloads)
+
+Candidates are mutated from the stress-test prompt mix and the current
+corpus (token splices, tandem repeats, slice duplication, crossover, and
+message split/merge for history payloads). Each is timed in-process, best
+of --repeat runs, and scored in nanoseconds per byte. The slowest inputs
+per extractor are kept in perf_corpus.json, along with "pinned" entries
+that once triggered a regression (e.g. quadratic file-reference matching).
+
+Commands:
+- fuzz    search for slow inputs and merge them into the corpus
+- scale   time each corpus entry tiled to growing sizes; report ns/byte and
+          the fitted growth exponent (1.0 linear, 2.0 quadratic)
+- replay  regression benchmark: every corpus entry, tiled to --bytes, must stay
+          under --budget-ms and --max-exponent; exits non-zero otherwise
+
+Usage:
+    python3 perf_fuzz.py fuzz --seconds 120
+    python3 perf_fuzz.py scale --sizes 1024,4096,16384,65536
+    python3 perf_fuzz.py replay --bytes 65536 --budget-ms 50
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "hooks"))
+
+import enhance_prompt  # noqa: E402
+from stress_test import HISTORY, PROMPT_MIX  # noqa: E402
+
+DEFAULT_CORPUS = ROOT / "perf_corpus.json"
+CORPUS_VERSION = 1
+
+
+def _history_payload(messages: List[str]) -> Dict[str, Any]:
+    roles = ("user", "assistant")
+    return {"conversationHistory": [{"role": roles[i % 2], "content": m} for i, m in enumerate(messages)]}
+
+
+# target -> (callable over a list of message strings, True if it takes a history payload)
+TARGETS: Dict[str, Any] = {
+    "extract_file_references": (lambda messages: enhance_prompt.extract_file_references(messages[0]), False),
+    "extract_function_names": (lambda messages: enhance_prompt.extract_function_names(messages[0]), False),
+    "detect_functions_from_history": (lambda messages: enhance_prompt.detect_functions_from_history(
+        _history_payload(messages)), True),
+    "escape_prompt": (lambda messages: enhance_prompt.escape_prompt(messages[0]), False),
+}
+
+# Fragments of the extractor patterns: path characters, extensions, call
+# parentheses, definition keywords, escape-relevant quotes and non-ASCII words
+TOKENS = [
+    "a", "A", "_", "1", "é", " ", "\n", "\t", ".", "-", "/", "./", "../", "..", "a.", "a-", "a/",
+    ".py", ".c", ".cpp", ".json", ".config", ".md", ".x", "py", "json", "(", ")", "()", "a()", "a(",
+    "def ", "def", "function ", "func ", "class ", "interface ", " method", " function", "A ",
+    "implement ", "create a function ", "add ", "\\", "\\\\", '"', "'", "`", " ", " ",
+]
+
+
+def _input_bytes(messages: List[str]) -> int:
+    return sum(len(m.encode("utf-8")) for m in messages)
+
+
+def _input_id(target: str, messages: List[str]) -> str:
+    return hashlib.sha1(json.dumps([target, messages]).encode("utf-8")).hexdigest()[:12]
+
+
+def _truncate(text: str, max_bytes: int) -> str:
+    return text.encode("utf-8")[:max(max_bytes, 0)].decode("utf-8", "ignore")
+
+
+def fit_input(messages: List[str], max_bytes: int) -> List[str]:
+    """Trim every message proportionally so the input is at most max_bytes"""
+    total = _input_bytes(messages)
+    if total <= max_bytes:
+        return messages
+    share = max_bytes / total
+    return [_truncate(m, int(len(m.encode("utf-8")) * share)) for m in messages]
+
+
+def scale_input(messages: List[str], target_bytes: int) -> List[str]:
+    """Tile every message so the input grows to about target_bytes"""
+    total = max(_input_bytes(messages), 1)
+    factor = math.ceil(target_bytes / total)
+    return fit_input([m * factor for m in messages], target_bytes)
+
+
+def time_call(func: Callable, messages: List[str], repeat: int) -> float:
+    """Best-of-repeat wall time in seconds; slow inputs are not repeated"""
+    best = float("inf")
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            func(messages)
+            best = min(best, time.perf_counter() - start)
+            if best > 0.5:
+                break
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def score(target: str, messages: List[str], repeat: int, min_bytes: int) -> Dict[str, Any]:
+    """Timed corpus entry; short inputs are tiled to min_bytes so call overhead does not dominate"""
+    if _input_bytes(messages) < min_bytes:
+        messages = scale_input(messages, min_bytes)
+    seconds = time_call(TARGETS[target][0], messages, repeat)
+    size = max(_input_bytes(messages), 1)
+    return {
+        "id": _input_id(target, messages),
+        "messages": messages,
+        "bytes": size,
+        "ms": round(seconds * 1000, 4),
+        "ns_per_byte": round(seconds * 1e9 / size, 2),
+    }
+
+
+def seed_inputs(history: bool) -> List[List[str]]:
+    seeds = [[prompt] for _, prompt in PROMPT_MIX]
+    seeds += [["a." * 64], ["a(" * 64], ["def " * 32], ['\\"' * 64]]
+    if history:
+        seeds.append([m["content"] for m in HISTORY])
+    return seeds
+
+
+def mutate(messages: List[str], rng: random.Random, pool: List[List[str]], history: bool,
+           max_bytes: int) -> List[str]:
+    """One to four random edits of a copy of messages"""
+    messages = list(messages) or [""]
+    for _ in range(rng.randint(1, 4)):
+        index = rng.randrange(len(messages))
+        text = messages[index]
+        pos = rng.randint(0, len(text))
+        end = rng.randint(pos, min(len(text), pos + 64))
+        op = rng.randrange(9 if history else 7)
+        if op == 0:
+            text = text[:pos] + rng.choice(TOKENS) + text[pos:]
+        elif op == 1:
+            text = text[:pos] + rng.choice(TOKENS) + text[end:]
+        elif op == 2:
+            text = text[:pos] + text[end:]
+        elif op == 3:
+            text = text[:pos] + text[pos:end] * 2 + text[end:]
+        elif op == 4:
+            # Tandem repeat of a short motif - the usual shape of backtracking blowups
+            motif = text[pos:end][:8] or rng.choice(TOKENS)
+            text = text[:pos] + motif * rng.randint(2, 256) + text[pos:]
+        elif op == 5:
+            other = rng.choice(rng.choice(pool)) if pool else ""
+            cut = rng.randint(0, len(other))
+            text = text[:pos] + other[cut:cut + rng.randint(1, 256)] + text[end:]
+        elif op == 6:
+            text = text * 2
+        elif op == 7:
+            messages[index:index + 1] = [text[:pos], text[pos:]]
+            continue
+        elif len(messages) > 1:
+            messages[index:index + 2] = ["".join(messages[index:index + 2])]
+            continue
+        messages[index] = text
+    if not history:
+        messages = ["".join(messages)]
+    return fit_input(messages, max_bytes)
+
+
+def load_corpus(path: Path) -> Dict[str, Any]:
+    if path.exists():
+        try:
+            corpus = json.loads(path.read_text(encoding="utf-8"))
+            if corpus.get("version") == CORPUS_VERSION:
+                return corpus
+        except ValueError:
+            print(f"Ignoring unreadable corpus {path}", file=sys.stderr)
+    return {"version": CORPUS_VERSION, "targets": {}}
+
+
+def save_corpus(path: Path, corpus: Dict[str, Any]):
+    corpus["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    path.write_text(json.dumps(corpus, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def fuzz_target(target: str, entries: List[Dict], seconds: float, keep: int, max_bytes: int,
+                min_bytes: int, repeat: int, rng: random.Random) -> List[Dict]:
+    """Search for slow inputs; returns the `keep` slowest by ns/byte"""
+    history = TARGETS[target][1]
+    found = {}
+    for messages in [e["messages"] for e in entries] + seed_inputs(history):
+        entry = score(target, fit_input(messages, max_bytes), repeat, min_bytes)
+        found.setdefault(entry["id"], entry)
+
+    evaluations = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        ranked = sorted(found.values(), key=lambda e: e["ns_per_byte"], reverse=True)
+        elite = ranked[:keep]
+        # Tournament selection biased towards the slowest inputs
+        parent = max(rng.sample(elite, min(3, len(elite))), key=lambda e: e["ns_per_byte"])
+        child = mutate(parent["messages"], rng, [e["messages"] for e in elite], history, max_bytes)
+        entry = score(target, child, repeat, min_bytes)
+        evaluations += 1
+        if entry["id"] not in found and (len(elite) < keep or entry["ns_per_byte"] > elite[-1]["ns_per_byte"]):
+            entry["found"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            found[entry["id"]] = entry
+
+    ranked = sorted(found.values(), key=lambda e: e["ns_per_byte"], reverse=True)[:keep]
+    # Pinned entries are past regressions and stay in the corpus however fast they became
+    ranked += [e for e in entries if e.get("pinned") and e["id"] not in {r["id"] for r in ranked}]
+    print(f"{target:<32} {evaluations:>7} evals  worst={ranked[0]['ns_per_byte']:>10} ns/byte "
+          f"({ranked[0]['bytes']} bytes, {ranked[0]['ms']}ms)")
+    return ranked
+
+
+def growth(target: str, messages: List[str], sizes: List[int], repeat: int) -> Dict[str, Any]:
+    """ns/byte at each size and the least-squares exponent of time vs. bytes"""
+    points = []
+    for size in sizes:
+        scaled = scale_input(messages, size)
+        seconds = max(time_call(TARGETS[target][0], scaled, repeat), 1e-9)
+        points.append((max(_input_bytes(scaled), 1), seconds))
+    xs = [math.log(b) for b, _ in points]
+    ys = [math.log(s) for _, s in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    exponent = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread if spread else 0.0
+    return {
+        "sizes": [b for b, _ in points],
+        "ms": [round(s * 1000, 3) for _, s in points],
+        "ns_per_byte": [round(s * 1e9 / b, 2) for b, s in points],
+        "exponent": round(exponent, 2),
+    }
+
+
+def _selected_targets(names: Optional[str]) -> List[str]:
+    if not names:
+        return list(TARGETS)
+    selected = [n.strip() for n in names.split(",") if n.strip()]
+    unknown = [n for n in selected if n not in TARGETS]
+    if unknown:
+        raise SystemExit(f"Unknown target(s): {', '.join(unknown)}; choose from {', '.join(TARGETS)}")
+    return selected
+
+
+def _configure_backend(backend: Optional[str]):
+    if backend:
+        enhance_prompt.configure_matchers({"backend": backend})
+        enhance_prompt._COMPILED_REGEXES.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Adversarial performance fuzzer for the prompt extractors")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("fuzz", "Search for slow inputs and merge them into the corpus"),
+                            ("scale", "Report ns/byte scaling of the corpus per extractor"),
+                            ("replay", "Replay the corpus as a regression benchmark")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+        sub.add_argument("--targets", help=f"Comma-separated subset of: {', '.join(TARGETS)}")
+        sub.add_argument("--backend", choices=["stdlib", "linear", "re2"],
+                         help="Matcher backend (default: stdlib)")
+        sub.add_argument("--repeat", type=int, default=3, help="Timed runs per input (best is kept)")
+        sub.add_argument("--json", action="store_true", help="Print the report as JSON")
+    fuzz_parser = subparsers.choices["fuzz"]
+    fuzz_parser.add_argument("--seconds", type=float, default=60.0, help="Search time per extractor")
+    fuzz_parser.add_argument("--keep", type=int, default=4, help="Slowest inputs kept per extractor")
+    fuzz_parser.add_argument("--max-bytes", type=int, default=4096)
+    fuzz_parser.add_argument("--min-bytes", type=int, default=256,
+                             help="Shorter inputs are tiled up to this size before timing")
+    fuzz_parser.add_argument("--seed", type=int, default=1)
+    subparsers.choices["scale"].add_argument("--sizes", default="1024,4096,16384,65536")
+    replay_parser = subparsers.choices["replay"]
+    replay_parser.add_argument("--bytes", type=int, default=65536, help="Size each entry is tiled to")
+    replay_parser.add_argument("--budget-ms", type=float, default=50.0)
+    replay_parser.add_argument("--max-exponent", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    _configure_backend(args.backend)
+    targets = _selected_targets(args.targets)
+    corpus = load_corpus(args.corpus)
+
+    if args.command == "fuzz":
+        rng = random.Random(args.seed)
+        for target in targets:
+            corpus["targets"][target] = fuzz_target(
+                target, corpus["targets"].get(target, []), args.seconds, args.keep,
+                args.max_bytes, args.min_bytes, args.repeat, rng)
+        corpus["backend"] = args.backend or "stdlib"
+        save_corpus(args.corpus, corpus)
+        if args.json:
+            print(json.dumps(corpus, indent=2, ensure_ascii=False))
+        return 0
+
+    if not any(corpus["targets"].get(t) for t in targets):
+        print(f"No corpus entries in {args.corpus}; run `perf_fuzz.py fuzz` first", file=sys.stderr)
+        return 1
+
+    if args.command == "scale":
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        report = {}
+        for target in targets:
+            rows = [dict(growth(target, e["messages"], sizes, args.repeat), id=e["id"])
+                    for e in corpus["targets"].get(target, [])]
+            if rows:
+                report[target] = max(rows, key=lambda r: (r["exponent"], r["ns_per_byte"][-1]))
+        if args.json:
+            print(json.dumps(report, indent=2))
+            return 0
+        print(f"{'extractor':<32}{'exponent':>9}  ns/byte at " + ", ".join(str(s) for s in sizes))
+        for target, row in report.items():
+            print(f"{target:<32}{row['exponent']:>9}  " + ", ".join(str(v) for v in row["ns_per_byte"])
+                  + f"   [{row['id']}]")
+        return 0
+
+    # replay: each entry at the full size plus two smaller sizes for the exponent
+    sizes = [max(args.bytes // 16, 64), max(args.bytes // 4, 128), args.bytes]
+    results, failures = [], 0
+    for target in targets:
+        for entry in corpus["targets"].get(target, []):
+            row = growth(target, entry["messages"], sizes, args.repeat)
+            ok = row["ms"][-1] <= args.budget_ms and row["exponent"] <= args.max_exponent
+            failures += not ok
+            results.append({"target": target, "id": entry["id"], "ms": row["ms"][-1],
+                            "ns_per_byte": row["ns_per_byte"][-1], "exponent": row["exponent"], "ok": ok})
+    if args.json:
+        print(json.dumps({"bytes": args.bytes, "failures": failures, "results": results}, indent=2))
+    else:
+        for r in sorted(results, key=lambda r: r["ms"], reverse=True):
+            print(f"{'OK  ' if r['ok'] else 'FAIL'} {r['target']:<32} {r['id']}  {r['ms']:>9.2f}ms  "
+                  f"{r['ns_per_byte']:>8} ns/byte  exponent={r['exponent']}")
+        print(f"\n{len(results) - failures}/{len(results)} corpus entries within {args.budget_ms}ms "
+              f"and exponent {args.max_exponent} at {args.bytes} bytes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Replay captured hook traffic through two pipelines and compare them
+
+Takes a capture written by hooks/traffic_capture.py and runs every payload
+through pipeline A and pipeline B. A pipeline is a checkout (a directory or
+a git ref) plus an optional user config file. The report lists, per prompt:
+- hook latency (in-process main() time, median of --repeat fresh processes)
+- enhanced output size
+- mode (ultra vs standard, from should_use_ultra_mode) and complexity tier
+It ends with a summary of latency/size deltas and every mode or tier flip.
+
+Each replay runs in a fresh process, like the real hook, and under a
+temporary $HOME per pipeline, so the user's learning data is never touched.
+
+Usage:
+    python3 replay_traffic.py capture.jsonl.gz --b-config candidate-config.json
+    python3 replay_traffic.py capture.jsonl.gz --a-ref main --b-root . --json
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "hooks"))
+
+from traffic_capture import read_capture  # noqa: E402
+
+WORKER_SOURCE = '''\
+import contextlib, io, json, sys, time
+sys.path.insert(0, {scripts_dir!r})
+payload = sys.stdin.read()
+sys.stdin = io.StringIO(payload)
+import enhance_prompt
+out = io.StringIO()
+start = time.perf_counter()
+with contextlib.redirect_stdout(out):
+    try:
+        enhance_prompt.main()
+    except SystemExit:
+        pass
+elapsed_ms = (time.perf_counter() - start) * 1000
+input_data = json.loads(payload)
+prompt = str(input_data.get("prompt", ""))
+context = enhance_prompt.analyze_prompt_context(prompt, input_data)
+ultra = enhance_prompt.should_use_ultra_mode(context, enhance_prompt.load_config())
+print(json.dumps({{
+    "latency_ms": elapsed_ms,
+    "output_chars": len(out.getvalue()),
+    "mode": "ultra" if ultra else "standard",
+    "complexity": context.get("complexity_indicators", {{}}).get("level", "unknown"),
+}}))
+'''
+
+
+def export_ref(ref: str, destination: Path) -> Path:
+    """Extract a git ref of this repository into destination"""
+    archive = subprocess.run(["git", "-C", str(ROOT), "archive", "--format=tar", ref],
+                             check=True, stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(destination, filter="data")
+        else:
+            tar.extractall(destination)
+    return destination
+
+
+def stage_pipeline(name: str, root: Path, config_file: Optional[Path], base_dir: Path) -> Dict[str, str]:
+    """Install one pipeline's hook layout and a temporary $HOME with its user config"""
+    install = base_dir / name / "enhancer"
+    home = base_dir / name / "home"
+    (install / "scripts").mkdir(parents=True)
+    for module in (root / "hooks").glob("*.py"):
+        shutil.copy2(module, install / "scripts" / module.name)
+    if (root / "integration_manager.py").exists():
+        shutil.copy2(root / "integration_manager.py", install / "scripts" / "integration_manager.py")
+    shutil.copytree(root / "hooks" / "templates", install / "templates")
+    shutil.copytree(root / "hooks" / "config", install / "config")
+
+    claude_dir = home / ".claude"
+    claude_dir.mkdir(parents=True)
+    if config_file:
+        shutil.copy2(config_file, claude_dir / "prompt-enhancer-config.json")
+    return {"home": str(home), "scripts": str(install / "scripts")}
+
+
+def replay_one(python: str, staged: Dict[str, str], payload: Dict, repeat: int) -> Dict[str, Any]:
+    env = dict(os.environ, HOME=staged["home"])
+    env.pop("CLAUDE_ENHANCER_CAPTURE", None)
+    worker = WORKER_SOURCE.format(scripts_dir=staged["scripts"])
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([python, "-c", worker], input=json.dumps(payload).encode(),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        if result.returncode != 0:
+            return {"error": result.stderr.decode("utf-8", "replace")[-300:]}
+        runs.append(json.loads(result.stdout.decode().strip().splitlines()[-1]))
+    measured = dict(runs[-1])
+    measured["latency_ms"] = round(statistics.median(r["latency_ms"] for r in runs), 3)
+    return measured
+
+
+def compare(records: List[Dict], results_a: List[Dict], results_b: List[Dict]) -> Dict[str, Any]:
+    rows, flips = [], []
+    for index, (record, a, b) in enumerate(zip(records, results_a, results_b)):
+        prompt = str(record.get("payload", {}).get("prompt", ""))
+        row = {"index": index, "prompt": prompt[:60], "prompt_chars": len(prompt), "a": a, "b": b}
+        if "error" not in a and "error" not in b:
+            row["latency_delta_ms"] = round(b["latency_ms"] - a["latency_ms"], 3)
+            row["size_delta"] = b["output_chars"] - a["output_chars"]
+            changes = [f"{field}: {a[field]} -> {b[field]}"
+                       for field in ("mode", "complexity") if a[field] != b[field]]
+            if changes:
+                flips.append({"index": index, "prompt": prompt[:60], "changes": changes})
+        rows.append(row)
+
+    ok = [r for r in rows if "latency_delta_ms" in r]
+    summary = {"prompts": len(rows), "errors": len(rows) - len(ok), "flips": len(flips)}
+    if ok:
+        summary.update({
+            "latency_a_median_ms": round(statistics.median(r["a"]["latency_ms"] for r in ok), 3),
+            "latency_b_median_ms": round(statistics.median(r["b"]["latency_ms"] for r in ok), 3),
+            "latency_delta_median_ms": round(statistics.median(r["latency_delta_ms"] for r in ok), 3),
+            "output_chars_a": sum(r["a"]["output_chars"] for r in ok),
+            "output_chars_b": sum(r["b"]["output_chars"] for r in ok),
+            "mode_flips": sum(1 for f in flips if any(c.startswith("mode") for c in f["changes"])),
+        })
+    return {"summary": summary, "flips": flips, "prompts": rows}
+
+
+def _pipeline_root(root: Optional[Path], ref: Optional[str], name: str, base_dir: Path) -> Path:
+    if ref:
+        return export_ref(ref, base_dir / f"{name}-checkout")
+    return (root or ROOT).resolve()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a hook traffic capture through two pipelines")
+    parser.add_argument("capture", type=Path, help="Capture file written by traffic_capture.py")
+    for side in ("a", "b"):
+        parser.add_argument(f"--{side}-root", type=Path, help=f"Checkout for pipeline {side.upper()}")
+        parser.add_argument(f"--{side}-ref", help=f"Git ref for pipeline {side.upper()}")
+        parser.add_argument(f"--{side}-config", type=Path, help=f"User config for pipeline {side.upper()}")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per prompt and pipeline")
+    parser.add_argument("--limit", type=int, help="Replay only the first N records")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    records = list(read_capture(args.capture))[:args.limit]
+    if not records:
+        print(f"No records in {args.capture}", file=sys.stderr)
+        return 1
+
+    base_dir = Path(tempfile.mkdtemp(prefix="enhancer-replay-"))
+    try:
+        results = {}
+        for side in ("a", "b"):
+            root = _pipeline_root(getattr(args, f"{side}_root"), getattr(args, f"{side}_ref"), side, base_dir)
+            staged = stage_pipeline(side, root, getattr(args, f"{side}_config"), base_dir)
+            results[side] = [replay_one(args.python, staged, r.get("payload", {}), args.repeat)
+                             for r in records]
+        report = compare(records, results["a"], results["b"])
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"{'#':>4} {'chars':>7} {'A ms':>9} {'B ms':>9} {'delta':>9} {'size delta':>11}  mode A/B   prompt")
+    for row in report["prompts"]:
+        if "latency_delta_ms" not in row:
+            print(f"{row['index']:>4} {row['prompt_chars']:>7}  error: {(row['a'].get('error') or row['b'].get('error'))!r}")
+            continue
+        print(f"{row['index']:>4} {row['prompt_chars']:>7} {row['a']['latency_ms']:>9.2f} "
+              f"{row['b']['latency_ms']:>9.2f} {row['latency_delta_ms']:>+9.2f} {row['size_delta']:>+11}  "
+              f"{row['a']['mode'][0]}/{row['b']['mode'][0]}        {row['prompt']!r}")
+
+    summary = report["summary"]
+    print(f"\n{summary['prompts']} prompts, {summary['errors']} errors")
+    if "latency_delta_median_ms" in summary:
+        print(f"Median latency: A {summary['latency_a_median_ms']}ms, B {summary['latency_b_median_ms']}ms "
+              f"(delta {summary['latency_delta_median_ms']:+}ms)")
+        print(f"Total output: A {summary['output_chars_a']} chars, B {summary['output_chars_b']} chars")
+    print(f"Mode/tier changes: {summary['flips']}")
+    for flip in report["flips"]:
+        print(f"  #{flip['index']} {flip['prompt']!r}: {', '.join(flip['changes'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
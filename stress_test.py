@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Concurrent-invocation stress harness for the prompt enhancement hook
+
+Launches N concurrent hook processes against a temporary $HOME with a
+realistic prompt mix, for each requested concurrency level, and reports:
+- latency distribution (p50/p90/p99/max) and throughput per level
+- integrity of the learning files written under contention: torn (unparsable)
+  interactions.log lines, lost appends, and corrupt JSON state files
+
+Each worker process runs enhance_prompt.main(), which records the
+interaction through IntegrationManager after printing, so interactions.log
+appends contend the same way they do in real sessions.
+
+Usage:
+    python3 stress_test.py --concurrency 1,4,8,16 --requests 64
+    python3 stress_test.py --prompts-file prompts.jsonl --json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+HOOKS_DIR = ROOT / "hooks"
+
+# (weight, prompt) - mostly short follow-ups, some features, a few huge pastes
+PROMPT_MIX = [
+    (20, "yes"),
+    (15, "continue"),
+    (10, "run the tests again"),
+    (10, "fix typo in README.md"),
+    (10, "Add a login endpoint to api.py with tests for validate_token()"),
+    (8, "Refactor utils.py and config_loader.py to share parse_config() and add caching"),
+    (6, "Design a distributed microservices architecture for production payments with kubernetes"),
+    (5, "orchestrate a multi-agent research plan and evaluate alternatives with a decision matrix"),
+    (3, "Why does this fail?\n" + "Traceback (most recent call last):\n  File \"app.py\", line 42\n" * 400),
+    (2, "Review this module:\n" + "def handler(event):\n    return process(event)\n" * 1200),
+]
+
+HISTORY = [
+    {"role": "user", "content": "We use flask and pandas, see app.py and the load_data() function"},
+    {"role": "assistant", "content": "I looked at load_data() in app.py; the parse_rows method is slow."},
+]
+
+WORKER_SOURCE = '''\
+import contextlib, io, sys
+sys.path.insert(0, {scripts_dir!r})
+payload = sys.stdin.read()
+sys.stdin = io.StringIO(payload)
+import enhance_prompt
+out = io.StringIO()
+with contextlib.redirect_stdout(out):
+    try:
+        enhance_prompt.main()
+    except SystemExit:
+        pass
+'''
+
+
+def load_prompt_mix(prompts_file: Optional[str]) -> List[Dict[str, Any]]:
+    """Weighted payload list from PROMPT_MIX or a JSONL file of hook payloads"""
+    if prompts_file:
+        with open(prompts_file, "r", encoding="utf-8") as f:
+            return [{"weight": 1, "payload": json.loads(line)} for line in f if line.strip()]
+    mix = []
+    for weight, prompt in PROMPT_MIX:
+        payload = {"prompt": prompt}
+        if weight < 10:
+            payload["conversationHistory"] = HISTORY
+        mix.append({"weight": weight, "payload": payload})
+    return mix
+
+
+def stage_environment(base_dir: Path) -> Dict[str, str]:
+    """Create a temporary $HOME with an installed hook layout and user config"""
+    home = base_dir / "home"
+    install = base_dir / "enhancer"
+    (install / "scripts").mkdir(parents=True)
+    for module in HOOKS_DIR.glob("*.py"):
+        shutil.copy2(module, install / "scripts" / module.name)
+    shutil.copy2(ROOT / "integration_manager.py", install / "scripts" / "integration_manager.py")
+    shutil.copytree(HOOKS_DIR / "templates", install / "templates")
+    shutil.copytree(HOOKS_DIR / "config", install / "config")
+
+    claude_dir = home / ".claude"
+    (claude_dir / "prompt-enhancer-learning" / "analytics").mkdir(parents=True)
+    (claude_dir / "prompt-enhancer-config.json").write_text(json.dumps({
+        "bypass": {"prefixes": ["*", "/", "#"]},
+        "enrichment": {"ultra_mode": {"enabled": True}},
+        "learning": {"interaction_log": {"enabled": True}}
+    }))
+    (claude_dir / "prompt-enhancer-learning" / "patterns.json").write_text(json.dumps({
+        "refactor": {"pattern_regex": r"refactor\w*", "success_rate": 0.9}
+    }))
+
+    return {"home": str(home), "scripts": str(install / "scripts")}
+
+
+def run_invocation(python: str, worker: str, payload: Dict, env: Dict[str, str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result = subprocess.run([python, "-c", worker], input=json.dumps(payload).encode(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    return {
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "ok": result.returncode == 0,
+        "stderr": result.stderr.decode("utf-8", "replace")[-500:] if result.returncode else ""
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_level(concurrency: int, requests: int, mix: List[Dict], python: str, worker: str,
+              env: Dict[str, str], rng: random.Random) -> Dict[str, Any]:
+    """Run `requests` invocations with `concurrency` processes in flight"""
+    payloads = rng.choices([m["payload"] for m in mix], weights=[m["weight"] for m in mix], k=requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda p: run_invocation(python, worker, p, env), payloads))
+    wall_s = time.perf_counter() - start
+
+    latencies = sorted(r["latency_ms"] for r in results)
+    errors = [r["stderr"] for r in results if not r["ok"]]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+        "throughput_per_s": round(requests / wall_s, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+    }
+
+
+def verify_learning_files(home: Path, expected_records: int) -> Dict[str, Any]:
+    """Check interactions.log and JSON state files for torn or lost writes"""
+    learning_dir = home / ".claude" / "prompt-enhancer-learning"
+    log_file = learning_dir / "analytics" / "interactions.log"
+
+    records, torn = 0, []
+    if log_file.exists():
+        raw = log_file.read_bytes()
+        for number, line in enumerate(raw.split(b"\n"), 1):
+            if not line:
+                continue
+            try:
+                json.loads(line)
+                records += 1
+            except ValueError:
+                torn.append(number)
+        if raw and not raw.endswith(b"\n"):
+            torn.append("unterminated final line")
+
+    corrupt_json = []
+    for state_file in learning_dir.rglob("*.json"):
+        try:
+            json.loads(state_file.read_text())
+        except ValueError:
+            corrupt_json.append(str(state_file.relative_to(learning_dir)))
+
+    return {
+        "expected_records": expected_records,
+        "records": records,
+        "lost_records": max(expected_records - records - len(torn), 0),
+        "torn_lines": torn[:20],
+        "corrupt_json_files": corrupt_json,
+        "ok": records == expected_records and not torn and not corrupt_json,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent hook invocation stress test")
+    parser.add_argument("--concurrency", default="1,2,4,8,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=48, help="Invocations per level")
+    parser.add_argument("--prompts-file", help="JSONL file of hook payloads")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary $HOME")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    mix = load_prompt_mix(args.prompts_file)
+    rng = random.Random(args.seed)
+
+    base_dir = Path(tempfile.mkdtemp(prefix="enhancer-stress-"))
+    try:
+        staged = stage_environment(base_dir)
+        env = dict(os.environ, HOME=staged["home"])
+        worker = WORKER_SOURCE.format(scripts_dir=staged["scripts"])
+
+        report = {"levels": []}
+        for level in levels:
+            level_report = run_level(level, args.requests, mix, args.python, worker, env, rng)
+            report["levels"].append(level_report)
+            if not args.json:
+                print(f"N={level:<3} throughput={level_report['throughput_per_s']:>7}/s  "
+                      f"p50={level_report['p50_ms']:>8}ms  p90={level_report['p90_ms']:>8}ms  "
+                      f"p99={level_report['p99_ms']:>8}ms  max={level_report['max_ms']:>8}ms  "
+                      f"errors={level_report['errors']}")
+
+        report["integrity"] = verify_learning_files(Path(staged["home"]), args.requests * len(levels))
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            integrity = report["integrity"]
+            print(f"\nLearning files: {'OK' if integrity['ok'] else 'CONTENTION DAMAGE'} - "
+                  f"{integrity['records']}/{integrity['expected_records']} records, "
+                  f"lost={integrity['lost_records']}, torn={integrity['torn_lines']}, "
+                  f"corrupt_json={integrity['corrupt_json_files']}")
+            for level in report["levels"]:
+                if level["first_error"]:
+                    print(f"First error at N={level['concurrency']}:\n{level['first_error']}")
+        return 0 if report["integrity"]["ok"] and not any(l["errors"] for l in report["levels"]) else 1
+    finally:
+        if args.keep:
+            print(f"Temporary environment kept at {base_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())